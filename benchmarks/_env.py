@@ -0,0 +1,23 @@
+import json
+import os
+from pathlib import Path
+
+# Campi di tipo lista che .env.example riporta separati da virgole: pydantic-settings
+# li legge come JSON, quindi vengono convertiti prima di importare le impostazioni
+_COMMA_SEPARATED_LISTS = ("CORS_ORIGINS",)
+
+def load_example_env() -> None:
+    """
+    Popola le variabili d'ambiente mancanti con i valori di .env.example,
+    così che i benchmark possano importare le impostazioni senza un file .env.
+    """
+    env_example = Path(__file__).resolve().parent.parent / ".env.example"
+    for line in env_example.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        key, value = key.strip(), value.strip()
+        if key in _COMMA_SEPARATED_LISTS and not value.startswith("["):
+            value = json.dumps([item.strip() for item in value.split(",") if item.strip()])
+        os.environ.setdefault(key, value)
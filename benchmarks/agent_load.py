@@ -0,0 +1,280 @@
+"""
+Test di carico della pipeline degli agenti contro il server MCP di prova.
+
+Avvia benchmarks.fake_mcp_server in un processo separato (oppure usa un server
+indicato con --server-url) e misura throughput, latenze p50/p95/p99 e tasso di
+errore a una concorrenza fissata.
+
+Bersagli:
+    agents   chiamate concorrenti ad AgentManager.run_agent nello stesso event loop
+    tasks    corpi dei task Celery che non richiedono il database, eseguiti in un
+             pool di processi come i worker prefork di Celery (un task per processo)
+
+Uso:
+    python -m benchmarks.agent_load --target agents --concurrency 50 --requests 2000
+    python -m benchmarks.agent_load --target tasks --concurrency 8 --requests 400 --latency-scale 0.1
+    python -m benchmarks.agent_load --target agents --distinct 50 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from benchmarks._env import load_example_env
+from benchmarks.fake_mcp_server import add_server_arguments, profile_options, start_in_process
+
+load_example_env()
+
+STORE_ID = "00000000-0000-0000-0000-000000000001"
+
+# Input di AgentManager.run_agent per tipo di agente
+AGENT_INPUTS: Dict[str, Callable[[int], Dict[str, Any]]] = {
+    "inventory": lambda i: {"action": "predict_demand", "product_id": f"product_{i}", "days_ahead": 30},
+    "pricing": lambda i: {"action": "optimize", "product_id": f"product_{i}"},
+    "customer_service": lambda i: {"query": f"Dov'è il mio ordine #{i}?"},
+    "marketing": lambda i: {"action": "generate_description", "product_id": f"product_{i}"},
+    "email": lambda i: {"email_content": f"Buongiorno, vorrei informazioni sull'ordine #{i}"},
+}
+
+# Task Celery senza accesso al database: nome del task e argomenti
+TASKS: Dict[str, Tuple[str, Callable[[int], Dict[str, Any]]]] = {
+    "customer_service.answer_query": (
+        "src.tasks.customer_service.answer_query",
+        lambda i: {"query": f"Dov'è il mio ordine #{i}?", "store_id": STORE_ID},
+    ),
+    "customer_service.generate_response": (
+        "src.tasks.customer_service.generate_response",
+        lambda i: {"message": f"Il prodotto {i} è arrivato danneggiato", "customer_id": f"customer_{i}", "store_id": STORE_ID},
+    ),
+    "customer_service.analyze_sentiment": (
+        "src.tasks.customer_service.analyze_sentiment",
+        lambda i: {"text": f"Servizio ottimo, consegna numero {i} puntuale"},
+    ),
+    "inventory.predict_demand": (
+        "src.tasks.inventory.predict_demand",
+        lambda i: {"product_id": f"product_{i}", "store_id": STORE_ID},
+    ),
+    "inventory.recommend_restock": (
+        "src.tasks.inventory.recommend_restock",
+        lambda i: {"store_id": STORE_ID, "threshold": i % 10},
+    ),
+    "inventory.optimize_inventory": (
+        "src.tasks.inventory.optimize_inventory",
+        lambda i: {"store_id": STORE_ID},
+    ),
+    "pricing.analyze_competition": (
+        "src.tasks.pricing.analyze_competition",
+        lambda i: {"product_id": f"product_{i}", "store_id": STORE_ID},
+    ),
+    "pricing.recommend_promotions": (
+        "src.tasks.pricing.recommend_promotions",
+        lambda i: {"store_id": STORE_ID},
+    ),
+    "pricing.forecast_impact": (
+        "src.tasks.pricing.forecast_impact",
+        lambda i: {"product_id": f"product_{i}", "store_id": STORE_ID, "new_price": 10.0 + i % 50},
+    ),
+}
+
+def _is_error(result: Any) -> bool:
+    if isinstance(result, BaseException):
+        return True
+    return isinstance(result, dict) and ("error" in result or result.get("success") is False)
+
+def _input_index(index: int, distinct: int) -> int:
+    """
+    Indice dell'input di una richiesta: con distinct > 0 gli input si ripetono
+    (utile per misurare cache e single-flight), altrimenti sono tutti diversi.
+    """
+    return random.randrange(distinct) if distinct > 0 else index
+
+async def _run_agents(operations: List[str], requests: int, concurrency: int, distinct: int) -> List[Tuple[str, float, bool]]:
+    from src.mcp.agent_manager import agent_manager
+    from src.mcp.client import mcp_client
+    
+    samples: List[Tuple[str, float, bool]] = []
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def run_one(index: int) -> None:
+        agent_type = operations[index % len(operations)]
+        input_data = AGENT_INPUTS[agent_type](_input_index(index, distinct))
+        async with semaphore:
+            started_at = time.perf_counter()
+            try:
+                result = await agent_manager.run_agent(agent_type, input_data, store_id=STORE_ID)
+            except Exception as e:
+                result = e
+            samples.append((agent_type, time.perf_counter() - started_at, _is_error(result)))
+    
+    await mcp_client.startup()
+    try:
+        await asyncio.gather(*(run_one(index) for index in range(requests)))
+    finally:
+        await mcp_client.shutdown()
+    return samples
+
+def _init_task_worker() -> None:
+    """
+    Stessa inizializzazione di worker_process_init nei worker Celery.
+    """
+    from src.core.celery_app import init_worker_process
+    
+    init_worker_process()
+
+def _run_task(operation: str, index: int) -> Tuple[str, float, bool]:
+    import importlib
+    
+    task_path, build_kwargs = TASKS[operation]
+    module_name, task_name = task_path.rsplit(".", 1)
+    task = getattr(importlib.import_module(module_name), task_name)
+    
+    started_at = time.perf_counter()
+    try:
+        result = task.apply(kwargs=build_kwargs(index)).get(propagate=False)
+    except Exception as e:
+        result = e
+    return operation, time.perf_counter() - started_at, _is_error(result)
+
+def _run_tasks(operations: List[str], requests: int, concurrency: int, distinct: int) -> List[Tuple[str, float, bool]]:
+    samples = []
+    with ProcessPoolExecutor(
+        max_workers=concurrency,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_init_task_worker,
+    ) as executor:
+        futures = [
+            executor.submit(_run_task, operations[index % len(operations)], _input_index(index, distinct))
+            for index in range(requests)
+        ]
+        for future in as_completed(futures):
+            samples.append(future.result())
+    return samples
+
+def _percentile(ordered: List[float], percentile: float) -> float:
+    if not ordered:
+        return 0.0
+    # Metodo nearest-rank
+    rank = max(1, math.ceil(percentile / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+def summarize(samples: List[Tuple[str, float, bool]], elapsed: float) -> Dict[str, Any]:
+    """
+    Calcola throughput, percentili di latenza e tasso di errore, in totale e per operazione.
+    """
+    groups: Dict[str, List[Tuple[float, bool]]] = defaultdict(list)
+    for operation, latency, failed in samples:
+        groups[operation].append((latency, failed))
+        groups["totale"].append((latency, failed))
+    
+    summary = {}
+    for operation, values in groups.items():
+        latencies = sorted(latency for latency, _ in values)
+        errors = sum(1 for _, failed in values if failed)
+        summary[operation] = {
+            "requests": len(values),
+            "errors": errors,
+            "error_rate": errors / len(values),
+            "throughput": len(values) / elapsed if elapsed else 0.0,
+            "p50": _percentile(latencies, 50),
+            "p95": _percentile(latencies, 95),
+            "p99": _percentile(latencies, 99),
+            "max": latencies[-1],
+        }
+    return summary
+
+def _print_summary(summary: Dict[str, Any], elapsed: float) -> None:
+    print(f"\ndurata {elapsed:.2f}s")
+    print(f"{'operazione':<38} {'richieste':>9} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errori':>8}")
+    for operation in sorted(summary, key=lambda name: (name == "totale", name)):
+        row = summary[operation]
+        print(
+            f"{operation:<38} {row['requests']:>9} {row['throughput']:>8.1f} "
+            f"{row['p50'] * 1000:>9.1f} {row['p95'] * 1000:>9.1f} {row['p99'] * 1000:>9.1f} "
+            f"{row['error_rate'] * 100:>7.2f}%"
+        )
+
+def _mcp_counters() -> Dict[str, float]:
+    """
+    Contatori MCP del processo (cache, retry, hedging, ...) sommati per nome.
+    """
+    from src.core.metrics import metrics
+    
+    totals: Dict[str, float] = defaultdict(float)
+    for key, value in metrics.snapshot()["counters"].items():
+        if key.startswith("mcp_"):
+            totals[key.split("{", 1)[0]] += value
+    return dict(totals)
+
+def _server_stats(server_url: str) -> Optional[Dict[str, Any]]:
+    import httpx
+    
+    try:
+        return httpx.get(f"{server_url}/stats", timeout=5).json()
+    except Exception:
+        return None
+
+def main(args: argparse.Namespace) -> None:
+    server_process = None
+    server_url = args.server_url
+    if not server_url:
+        server_process, server_url = start_in_process(**profile_options(args))
+    # Le impostazioni vengono lette all'importazione di src: l'URL va impostato prima
+    os.environ["MCP_SERVER_URL"] = server_url
+    os.environ["MCP_ENABLED"] = "True"
+    if args.no_cache:
+        os.environ["MCP_CACHE_ENABLED"] = "False"
+    
+    catalog = AGENT_INPUTS if args.target == "agents" else TASKS
+    operations = args.operations.split(",") if args.operations else list(catalog)
+    unknown = [operation for operation in operations if operation not in catalog]
+    if unknown:
+        raise SystemExit(f"Operazioni non valide per {args.target}: {', '.join(unknown)}")
+    
+    print(f"server MCP di prova: {server_url}")
+    print(f"bersaglio {args.target}, concorrenza {args.concurrency}, richieste {args.requests}")
+    
+    try:
+        started_at = time.perf_counter()
+        if args.target == "agents":
+            samples = asyncio.run(_run_agents(operations, args.requests, args.concurrency, args.distinct))
+        else:
+            samples = _run_tasks(operations, args.requests, args.concurrency, args.distinct)
+        elapsed = time.perf_counter() - started_at
+        
+        summary = summarize(samples, elapsed)
+        _print_summary(summary, elapsed)
+        
+        report = {"target": args.target, "concurrency": args.concurrency, "elapsed": elapsed, "summary": summary}
+        if args.target == "agents":
+            report["mcp_counters"] = _mcp_counters()
+            for name, value in sorted(report["mcp_counters"].items()):
+                print(f"{name:<38} {value:>9.0f}")
+        report["server"] = _server_stats(server_url)
+        
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as report_file:
+                json.dump(report, report_file, indent=2)
+    finally:
+        if server_process is not None:
+            server_process.terminate()
+            server_process.join(5)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=["agents", "tasks"], default="agents", help="Codice da sottoporre a carico")
+    parser.add_argument("--operations", help="Tipi di agente o task da eseguire, separati da virgola (predefinito: tutti)")
+    parser.add_argument("--concurrency", type=int, default=20, help="Richieste contemporanee (processi per --target tasks)")
+    parser.add_argument("--requests", type=int, default=500, help="Numero totale di richieste")
+    parser.add_argument("--distinct", type=int, default=0, help="Numero di input distinti (0 = tutti diversi)")
+    parser.add_argument("--no-cache", action="store_true", help="Disabilita la cache delle risposte MCP")
+    parser.add_argument("--server-url", help="Usa un server MCP già avviato invece di quello di prova")
+    parser.add_argument("--json", help="Salva il report in formato JSON")
+    add_server_arguments(parser)
+    main(parser.parse_args())
@@ -0,0 +1,475 @@
+"""
+Server MCP di prova per benchmark e test di carico senza backend LLM.
+
+Implementa tutte le funzioni MCP usate dagli agenti (src/agents/*, src/email/agent.py
+e AgentManager) con risposte sintetiche, e simula per ogni funzione una
+distribuzione di latenza, un tasso di errore e una dimensione del payload
+configurabili. Espone gli stessi endpoint del server reale:
+
+    GET  /functions                  elenco delle funzioni (con supporto batch)
+    POST /function/{nome}            chiamata singola
+    POST /function/{nome}/batch      chiamata batch ({"items": [...]})
+    POST /function/{nome}/stream     chiamata in streaming (Server-Sent Events)
+    GET  /stats                      richieste ed errori simulati per funzione
+
+Le distribuzioni di latenza si indicano come stringhe:
+
+    fixed:0.2              sempre 200 ms
+    uniform:0.05:0.5       uniforme tra 50 e 500 ms
+    normal:0.3:0.1         normale (media, deviazione standard), troncata a 0
+    lognormal:0.8:0.5      lognormale (mediana, sigma)
+    exp:0.2                esponenziale con media 200 ms
+
+Il file di configurazione opzionale (JSON) sovrascrive il profilo predefinito:
+
+    {
+        "default": {"latency": "lognormal:0.15:0.4", "error_rate": 0.01, "payload_bytes": 512},
+        "functions": {"marketing_generate_campaign": {"latency": "lognormal:3:0.4"}}
+    }
+
+Uso:
+    python -m benchmarks.fake_mcp_server --port 8080 --error-rate 0.02 --latency-scale 0.5
+"""
+import argparse
+import asyncio
+import fnmatch
+import json
+import math
+import multiprocessing
+import random
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Campo di testo principale di ogni funzione (None se la risposta è strutturata)
+# e generatore dei campi della risposta
+FUNCTIONS: Dict[str, Tuple[Optional[str], Callable[[Dict[str, Any]], Dict[str, Any]]]] = {
+    # Agenti generici (AgentManager)
+    "inventory_agent": ("result", lambda p: {"result": ""}),
+    "pricing_agent": ("result", lambda p: {"result": ""}),
+    "customer_service_agent": ("result", lambda p: {"result": ""}),
+    "marketing_agent": ("result", lambda p: {"result": ""}),
+    "email_agent": ("result", lambda p: {"result": ""}),
+    "inventory_agent_capabilities": (None, lambda p: {"capabilities": ["predict_demand", "recommend_restock", "optimize", "analyze_trends"]}),
+    "pricing_agent_capabilities": (None, lambda p: {"capabilities": ["optimize", "analyze_competition", "recommend_promotions", "forecast_impact"]}),
+    "customer_service_agent_capabilities": (None, lambda p: {"capabilities": ["answer", "handle_complaint", "generate_response", "analyze_sentiment"]}),
+    "marketing_agent_capabilities": (None, lambda p: {"capabilities": ["generate_description", "optimize_seo", "generate_campaign", "analyze_performance", "generate_social_post"]}),
+    "email_agent_capabilities": (None, lambda p: {"capabilities": ["generate_response", "classify", "extract_info", "generate_follow_up", "summarize_thread"]}),
+    # Prezzi
+    "pricing_optimize": (None, lambda p: {
+        "optimized_price": round(random.uniform(5, 200), 2),
+        "confidence": round(random.uniform(0.5, 1), 2),
+    }),
+    "pricing_analyze_competition": (None, lambda p: {
+        "competitors": [{"name": f"competitor_{i}", "price": round(random.uniform(5, 200), 2)} for i in range(3)],
+        "average_price": round(random.uniform(5, 200), 2),
+    }),
+    "pricing_recommend_promotions": (None, lambda p: {
+        "promotions": [{"type": "discount", "value": random.choice([5, 10, 15, 20])}],
+    }),
+    "pricing_forecast_impact": (None, lambda p: {
+        "expected_revenue_change": round(random.uniform(-0.2, 0.3), 3),
+        "expected_volume_change": round(random.uniform(-0.3, 0.3), 3),
+    }),
+    # Inventario
+    "inventory_predict_demand": (None, lambda p: {
+        "forecast": [random.randint(0, 50) for _ in range(int(p.get("days_ahead", 30) or 30))],
+    }),
+    "inventory_recommend_restock": (None, lambda p: {
+        "products": [{"product_id": f"product_{i}", "quantity": random.randint(5, 100)} for i in range(5)],
+    }),
+    "inventory_optimize": (None, lambda p: {
+        "recommendations": [{"product_id": f"product_{i}", "target_stock": random.randint(5, 100)} for i in range(5)],
+    }),
+    "inventory_analyze_trends": (None, lambda p: {
+        "trends": [{"period": i, "change": round(random.uniform(-0.5, 0.5), 3)} for i in range(12)],
+    }),
+    # Servizio clienti
+    "customer_service_answer": ("answer", lambda p: {"answer": ""}),
+    "customer_service_handle_complaint": ("response", lambda p: {"response": "", "actions": {}}),
+    "customer_service_generate_response": ("response", lambda p: {"response": ""}),
+    "customer_service_analyze_sentiment": (None, lambda p: {
+        "sentiment": random.choice(["positive", "neutral", "negative"]),
+        "sentiment_score": round(random.uniform(-1, 1), 3),
+    }),
+    # Marketing
+    "marketing_generate_description": ("description", lambda p: {"description": ""}),
+    "marketing_optimize_seo": ("meta_description", lambda p: {
+        "title": "Titolo ottimizzato",
+        "meta_description": "",
+        "keywords": ["prodotto", "offerta", "qualità"],
+    }),
+    "marketing_generate_campaign": ("content", lambda p: {
+        "title": "Campagna settimanale",
+        "intro": "Scopri le novità della settimana",
+        "content": "",
+        "cta": "Visita il negozio",
+    }),
+    "marketing_analyze_performance": (None, lambda p: {
+        "metrics": {"ctr": round(random.uniform(0, 0.1), 4), "conversion_rate": round(random.uniform(0, 0.05), 4)},
+    }),
+    "marketing_generate_social_post": ("content", lambda p: {"content": "", "hashtags": ["#novità", "#offerta"]}),
+    # Email
+    "email_generate_response": ("body", lambda p: {"subject": "Re: la sua richiesta", "body": ""}),
+    "email_classify": (None, lambda p: {
+        "category": random.choice(["order", "support", "complaint", "other"]),
+        "priority": random.choice(["low", "medium", "high"]),
+    }),
+    "email_extract_info": (None, lambda p: {"entities": {"order_id": f"#{random.randint(1000, 9999)}"}}),
+    "email_generate_follow_up": ("body", lambda p: {"subject": "Come va con il suo acquisto?", "body": ""}),
+    "email_summarize_thread": ("summary", lambda p: {"summary": ""}),
+}
+
+# Funzioni di generazione di testo: più lente delle funzioni analitiche
+GENERATIVE_FUNCTIONS = [
+    "*_agent",
+    "customer_service_answer",
+    "customer_service_handle_complaint",
+    "customer_service_generate_response",
+    "marketing_generate_*",
+    "email_generate_*",
+    "email_summarize_thread",
+]
+
+DEFAULT_PROFILE = {
+    "latency": "lognormal:0.15:0.4",
+    "error_rate": 0.0,
+    "error_statuses": [500, 503],
+    "payload_bytes": 512,
+    "stream_chunks": 20,
+}
+
+GENERATIVE_PROFILE = {
+    "latency": "lognormal:1.2:0.5",
+    "payload_bytes": 2048,
+}
+
+CAPABILITIES_PROFILE = {
+    "latency": "fixed:0.005",
+    "payload_bytes": 0,
+}
+
+WORDS = (
+    "prodotto qualità cliente ordine spedizione offerta negozio prezzo disponibile "
+    "garanzia consegna servizio novità collezione sconto assistenza"
+).split()
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """
+    Converte una specifica di latenza (es. "lognormal:0.8:0.5") in un campionatore.
+    """
+    kind, *args = spec.split(":")
+    values = [float(arg) for arg in args]
+    
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    if kind == "exp":
+        return lambda: random.expovariate(1.0 / values[0])
+    
+    raise ValueError(f"Distribuzione di latenza non supportata: {spec}")
+
+def _lorem(size: int) -> str:
+    words = []
+    length = 0
+    while length < size:
+        word = random.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:size]
+
+class FunctionProfile:
+    """
+    Comportamento simulato di una funzione MCP.
+    """
+    
+    def __init__(self, name: str, config: Dict[str, Any], latency_scale: float = 1.0):
+        self.name = name
+        self.text_field, self.build = FUNCTIONS[name]
+        self.sample_latency = parse_latency(config["latency"])
+        self.latency_scale = latency_scale
+        self.error_rate = float(config["error_rate"])
+        self.error_statuses = list(config["error_statuses"])
+        self.payload_bytes = int(config["payload_bytes"])
+        self.stream_chunks = max(1, int(config["stream_chunks"]))
+    
+    def latency(self) -> float:
+        return self.sample_latency() * self.latency_scale
+    
+    def failure(self) -> Optional[int]:
+        """
+        Restituisce il codice di stato dell'errore simulato, o None se la chiamata riesce.
+        """
+        if self.error_rate and random.random() < self.error_rate:
+            return random.choice(self.error_statuses)
+        return None
+    
+    def response(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        body = {"success": True, **self.build(parameters)}
+        if self.text_field:
+            body[self.text_field] = _lorem(max(1, self.payload_bytes))
+        elif self.payload_bytes:
+            body["details"] = _lorem(self.payload_bytes)
+        return body
+
+def build_profiles(config: Optional[Dict[str, Any]] = None, latency_scale: float = 1.0, **overrides) -> Dict[str, FunctionProfile]:
+    """
+    Costruisce i profili di tutte le funzioni dal profilo predefinito, dal file di
+    configurazione (default, poi functions) e dalle opzioni della riga di comando,
+    in ordine di precedenza crescente: le opzioni valgono per tutte le funzioni.
+    """
+    config = config or {}
+    overrides = {key: value for key, value in overrides.items() if value is not None}
+    profiles = {}
+    
+    for name in FUNCTIONS:
+        profile = dict(DEFAULT_PROFILE)
+        if name.endswith("_agent_capabilities"):
+            profile.update(CAPABILITIES_PROFILE)
+        elif any(fnmatch.fnmatchcase(name, pattern) for pattern in GENERATIVE_FUNCTIONS):
+            profile.update(GENERATIVE_PROFILE)
+        
+        profile.update(config.get("default", {}))
+        for pattern, function_config in config.get("functions", {}).items():
+            if fnmatch.fnmatchcase(name, pattern):
+                profile.update(function_config)
+        profile.update(overrides)
+        
+        profiles[name] = FunctionProfile(name, profile, latency_scale)
+    
+    return profiles
+
+class FakeMCPServer:
+    """
+    Server HTTP/1.1 minimale (keep-alive, chunked per lo streaming) che simula il server MCP.
+    """
+    
+    def __init__(self, profiles: Dict[str, FunctionProfile]):
+        self.profiles = profiles
+        self.requests: Dict[str, int] = defaultdict(int)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.started_at = time.monotonic()
+    
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> Tuple[asyncio.AbstractServer, str]:
+        server = await asyncio.start_server(self._handle_connection, host, port, backlog=1024)
+        bound_host, bound_port = server.sockets[0].getsockname()[:2]
+        return server, f"http://{bound_host}:{bound_port}"
+    
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                method, path, _ = request_line.split(" ", 2)
+                headers = {}
+                for line in header_lines:
+                    if ":" in line:
+                        key, value = line.split(":", 1)
+                        headers[key.strip().lower()] = value.strip()
+                
+                content_length = int(headers.get("content-length", 0))
+                body = await reader.readexactly(content_length) if content_length else b""
+                
+                await self._dispatch(method, path.split("?", 1)[0], body, writer)
+                await writer.drain()
+                
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+    
+    async def _dispatch(self, method: str, path: str, body: bytes, writer: asyncio.StreamWriter) -> None:
+        if method == "GET" and path == "/functions":
+            functions = [{"name": name, "batch": True, "stream": True} for name in self.profiles]
+            return self._write_json(writer, 200, functions)
+        
+        if method == "GET" and path == "/stats":
+            return self._write_json(writer, 200, self.stats())
+        
+        parts = path.strip("/").split("/")
+        if method != "POST" or len(parts) not in (2, 3) or parts[0] != "function":
+            return self._write_json(writer, 404, {"error": "Endpoint non trovato"})
+        
+        profile = self.profiles.get(parts[1])
+        if profile is None:
+            return self._write_json(writer, 404, {"error": f"Funzione sconosciuta: {parts[1]}"})
+        
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            return self._write_json(writer, 400, {"error": "JSON non valido"})
+        
+        mode = parts[2] if len(parts) == 3 else "call"
+        self.requests[f"{profile.name}:{mode}"] += 1
+        
+        if mode == "call":
+            await self._call(profile, payload, writer)
+        elif mode == "batch":
+            await self._batch(profile, payload.get("items", []), writer)
+        elif mode == "stream":
+            await self._stream(profile, payload, writer)
+        else:
+            self._write_json(writer, 404, {"error": "Endpoint non trovato"})
+    
+    async def _call(self, profile: FunctionProfile, parameters: Dict[str, Any], writer: asyncio.StreamWriter) -> None:
+        await asyncio.sleep(profile.latency())
+        status = profile.failure()
+        if status:
+            self.errors[profile.name] += 1
+            return self._write_json(writer, status, {"error": "Errore simulato"})
+        self._write_json(writer, 200, profile.response(parameters))
+    
+    async def _batch(self, profile: FunctionProfile, items: List[Dict[str, Any]], writer: asyncio.StreamWriter) -> None:
+        # Un batch costa quanto la chiamata più lenta tra i suoi elementi
+        latencies = [profile.latency() for _ in items] or [0.0]
+        await asyncio.sleep(max(latencies))
+        status = profile.failure()
+        if status:
+            self.errors[profile.name] += 1
+            return self._write_json(writer, status, {"error": "Errore simulato"})
+        self._write_json(writer, 200, {"results": [profile.response(item) for item in items]})
+    
+    async def _stream(self, profile: FunctionProfile, parameters: Dict[str, Any], writer: asyncio.StreamWriter) -> None:
+        latency = profile.latency()
+        status = profile.failure()
+        # Il primo evento arriva dopo il 10% della latenza totale, come il primo token di un LLM
+        await asyncio.sleep(latency * 0.1)
+        if status:
+            self.errors[profile.name] += 1
+            return self._write_json(writer, status, {"error": "Errore simulato"})
+        
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\n"
+            b"Connection: keep-alive\r\n\r\n"
+        )
+        
+        response = profile.response(parameters)
+        text = response.pop(profile.text_field, "") if profile.text_field else ""
+        chunk_size = max(1, math.ceil(len(text) / profile.stream_chunks))
+        chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        interval = latency * 0.9 / max(1, len(chunks))
+        
+        for index, chunk in enumerate(chunks):
+            if index:
+                await asyncio.sleep(interval)
+            self._write_chunk(writer, f"data: {json.dumps({'delta': chunk}, ensure_ascii=False)}\n\n")
+            await writer.drain()
+        
+        # Gli altri campi della risposta arrivano nell'ultimo evento
+        self._write_chunk(writer, f"data: {json.dumps(response, ensure_ascii=False)}\n\ndata: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+    
+    @staticmethod
+    def _write_chunk(writer: asyncio.StreamWriter, text: str) -> None:
+        data = text.encode("utf-8")
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+    
+    @staticmethod
+    def _write_json(writer: asyncio.StreamWriter, status: int, body: Any) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found"}.get(status, "Error")
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: keep-alive\r\n\r\n".encode() + data
+        )
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "uptime": round(time.monotonic() - self.started_at, 3),
+            "requests": dict(self.requests),
+            "errors": dict(self.errors),
+        }
+
+async def serve(profiles: Dict[str, FunctionProfile], host: str, port: int, ready: Optional[Any] = None) -> None:
+    """
+    Avvia il server e lo mantiene attivo; l'URL viene inviato a ready (se indicato).
+    """
+    server, url = await FakeMCPServer(profiles).start(host, port)
+    if ready is not None:
+        ready.send(url)
+        ready.close()
+    else:
+        print(f"Server MCP di prova in ascolto su {url}")
+    async with server:
+        await server.serve_forever()
+
+def _run_process(options: Dict[str, Any], ready: Any) -> None:
+    profiles = build_profiles(**options["profiles"])
+    try:
+        asyncio.run(serve(profiles, options["host"], options["port"], ready))
+    except KeyboardInterrupt:
+        pass
+
+def start_in_process(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    **profile_options,
+) -> Tuple[multiprocessing.Process, str]:
+    """
+    Avvia il server in un processo separato (per non contendere la CPU al client
+    misurato) e restituisce il processo e l'URL del server.
+    """
+    parent, child = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(
+        target=_run_process,
+        args=({"host": host, "port": port, "profiles": profile_options}, child),
+        daemon=True,
+    )
+    process.start()
+    child.close()
+    if not parent.poll(30):
+        process.terminate()
+        raise RuntimeError("Il server MCP di prova non si è avviato")
+    return process, parent.recv()
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Opzioni del profilo simulato, condivise con gli script di test di carico.
+    """
+    parser.add_argument("--config", help="File JSON con i profili delle funzioni")
+    parser.add_argument("--latency", help="Distribuzione di latenza per tutte le funzioni (es. lognormal:0.2:0.5)")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Fattore moltiplicativo delle latenze")
+    parser.add_argument("--error-rate", type=float, help="Frazione di chiamate che falliscono")
+    parser.add_argument("--error-statuses", type=lambda v: [int(s) for s in v.split(",")], help="Codici di errore simulati (es. 500,503)")
+    parser.add_argument("--payload-bytes", type=int, help="Dimensione del testo generato nelle risposte")
+    parser.add_argument("--stream-chunks", type=int, help="Numero di eventi delle risposte in streaming")
+
+def profile_options(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Converte le opzioni della riga di comando negli argomenti di build_profiles.
+    """
+    config = None
+    if args.config:
+        with open(args.config, encoding="utf-8") as config_file:
+            config = json.load(config_file)
+    return {
+        "config": config,
+        "latency_scale": args.latency_scale,
+        "latency": args.latency,
+        "error_rate": args.error_rate,
+        "error_statuses": args.error_statuses,
+        "payload_bytes": args.payload_bytes,
+        "stream_chunks": args.stream_chunks,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1", help="Indirizzo di ascolto")
+    parser.add_argument("--port", type=int, default=8080, help="Porta di ascolto")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(build_profiles(**profile_options(args)), args.host, args.port))
+    except KeyboardInterrupt:
+        pass
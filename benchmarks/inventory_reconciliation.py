@@ -0,0 +1,90 @@
+"""
+Benchmark della riconciliazione dell'inventario in sync_inventory.
+
+Confronta, su cataloghi sintetici di dimensione crescente, la ricerca lineare
+per ogni prodotto usata in precedenza (O(prodotti x prodotti del marketplace))
+con l'indice SKU -> quantità e il confronto sulla proiezione (id, sku, quantità)
+di src.inventory.reconciliation (O(prodotti)). Riporta anche il numero di
+istruzioni UPDATE ... FROM (VALUES ...) necessarie per applicare le modifiche.
+
+La ricerca lineare viene misurata solo fino a --legacy-max SKU, oltre i quali
+diventa troppo lenta.
+
+Uso:
+    python -m benchmarks.inventory_reconciliation --sizes 1000,10000,100000 --changed 0.1
+"""
+import argparse
+import math
+import random
+import time
+import uuid
+from typing import Any, Dict, List, Tuple
+
+from benchmarks._env import load_example_env
+
+load_example_env()
+
+from src.inventory.reconciliation import UPDATE_BATCH_SIZE, build_sku_index, diff_quantities  # noqa: E402
+
+def _make_catalog(size: int, changed: float) -> Tuple[List[Tuple[uuid.UUID, str, int]], List[Dict[str, Any]]]:
+    """
+    Genera le righe del database e i prodotti del marketplace, in ordine diverso,
+    con una frazione `changed` di quantità modificate.
+    """
+    rows = [(uuid.uuid4(), f"SKU-{index:08d}", random.randint(0, 500)) for index in range(size)]
+    marketplace_products = [
+        {"sku": sku, "quantity": quantity + 1 if random.random() < changed else quantity}
+        for _, sku, quantity in rows
+    ]
+    random.shuffle(marketplace_products)
+    return rows, marketplace_products
+
+def _legacy_diff(rows: List[Tuple[uuid.UUID, str, int]], marketplace_products: List[Dict[str, Any]]) -> int:
+    """
+    Algoritmo precedente: ricerca lineare nel catalogo del marketplace per ogni prodotto.
+    """
+    updated_count = 0
+    for _, sku, quantity in rows:
+        marketplace_product = next(
+            (p for p in marketplace_products if p.get("sku") == sku),
+            None
+        )
+        if marketplace_product and marketplace_product.get("quantity") != quantity:
+            updated_count += 1
+    return updated_count
+
+def _indexed_diff(rows: List[Tuple[uuid.UUID, str, int]], marketplace_products: List[Dict[str, Any]]) -> int:
+    return len(diff_quantities(rows, build_sku_index(marketplace_products)))
+
+def _measure(function, *args) -> Tuple[float, Any]:
+    started_at = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started_at, result
+
+def main(sizes: List[int], changed: float, legacy_max: int) -> None:
+    print(f"{'SKU':>9} {'modificati':>10} {'UPDATE':>7} {'indice ms':>10} {'ns/SKU':>8} {'lineare ms':>11} {'speedup':>9}")
+    for size in sizes:
+        rows, marketplace_products = _make_catalog(size, changed)
+        indexed_time, updated_count = _measure(_indexed_diff, rows, marketplace_products)
+        statements = math.ceil(updated_count / UPDATE_BATCH_SIZE)
+        
+        legacy = "-"
+        speedup = "-"
+        if size <= legacy_max:
+            legacy_time, legacy_count = _measure(_legacy_diff, rows, marketplace_products)
+            assert legacy_count == updated_count
+            legacy = f"{legacy_time * 1000:.1f}"
+            speedup = f"{legacy_time / indexed_time:.0f}x"
+        
+        print(
+            f"{size:>9} {updated_count:>10} {statements:>7} {indexed_time * 1000:>10.1f} "
+            f"{indexed_time / size * 1e9:>8.0f} {legacy:>11} {speedup:>9}"
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,5000,10000,50000,100000", help="Dimensioni dei cataloghi, separate da virgola")
+    parser.add_argument("--changed", type=float, default=0.1, help="Frazione di quantità modificate")
+    parser.add_argument("--legacy-max", type=int, default=10000, help="Dimensione massima per la ricerca lineare")
+    args = parser.parse_args()
+    main([int(size) for size in args.sizes.split(",")], args.changed, args.legacy_max)
@@ -0,0 +1,112 @@
+"""
+Micro-benchmark del trasporto HTTP verso il server MCP.
+
+Confronta la latenza per chiamata tra un client httpx creato a ogni chiamata
+(comportamento precedente) e il pool di connessioni persistente di MCPClient,
+usando un server MCP di prova in locale.
+
+Uso:
+    python -m benchmarks.mcp_transport --calls 500
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import List, Tuple
+
+from benchmarks._env import load_example_env
+
+load_example_env()
+
+import httpx  # noqa: E402
+
+from src.mcp.client import MCPClient  # noqa: E402
+
+RESPONSE_BODY = json.dumps({"success": True, "result": "ok"}).encode()
+
+async def _handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """
+    Server MCP minimale: risponde 200 a ogni richiesta e mantiene la connessione aperta.
+    """
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            content_length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    content_length = int(line.split(b":", 1)[1])
+            if content_length:
+                await reader.readexactly(content_length)
+            
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: application/json\r\n"
+                b"Content-Length: " + str(len(RESPONSE_BODY)).encode() + b"\r\n"
+                b"Connection: keep-alive\r\n\r\n" + RESPONSE_BODY
+            )
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionResetError):
+        pass
+    finally:
+        writer.close()
+
+async def _start_stub_server() -> Tuple[asyncio.AbstractServer, str]:
+    server = await asyncio.start_server(_handle_connection, "127.0.0.1", 0)
+    host, port = server.sockets[0].getsockname()[:2]
+    return server, f"http://{host}:{port}"
+
+async def _bench_fresh_client(server_url: str, calls: int) -> List[float]:
+    """
+    Una nuova connessione per ogni chiamata.
+    """
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        async with httpx.AsyncClient() as client:
+            response = await client.post(f"{server_url}/function/bench", json={"value": 1})
+            response.json()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+async def _bench_pooled_client(server_url: str, calls: int) -> List[float]:
+    """
+    Connessioni riutilizzate dal pool di MCPClient.
+    """
+    client = MCPClient(server_url=server_url)
+    client.enabled = True
+    await client.startup()
+    latencies = []
+    try:
+        for _ in range(calls):
+            start = time.perf_counter()
+            await client.call_function("bench", {"value": 1})
+            latencies.append(time.perf_counter() - start)
+    finally:
+        await client.shutdown()
+    return latencies
+
+def _report(label: str, latencies: List[float]) -> float:
+    ordered = sorted(latencies)
+    mean = statistics.mean(ordered) * 1000
+    p50 = ordered[len(ordered) // 2] * 1000
+    p95 = ordered[int(len(ordered) * 0.95) - 1] * 1000
+    print(f"{label:<22} media {mean:7.3f} ms   p50 {p50:7.3f} ms   p95 {p95:7.3f} ms")
+    return mean
+
+async def main(calls: int) -> None:
+    server, server_url = await _start_stub_server()
+    async with server:
+        # Riscaldamento
+        await _bench_fresh_client(server_url, 10)
+        await _bench_pooled_client(server_url, 10)
+        
+        fresh = _report("client per chiamata", await _bench_fresh_client(server_url, calls))
+        pooled = _report("pool persistente", await _bench_pooled_client(server_url, calls))
+        print(f"guadagno per chiamata: {fresh - pooled:.3f} ms ({fresh / pooled:.1f}x)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=500, help="Numero di chiamate per scenario")
+    args = parser.parse_args()
+    asyncio.run(main(args.calls))
@@ -1,5 +1,5 @@
 import logging
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
 
 from src.mcp.client import mcp_client
 
@@ -43,6 +43,39 @@ class CustomerServiceAgent:
         result = await mcp_client.call_function("customer_service_answer", parameters)
         return result
     
+    async def stream_answer_query(
+        self,
+        query: str,
+        customer_id: Optional[str] = None,
+        store_id: str = None,
+        context: Optional[Dict[str, Any]] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Risponde a una domanda di un cliente restituendo la risposta in streaming.
+        
+        Args:
+            query: Domanda del cliente
+            customer_id: ID del cliente (opzionale)
+            store_id: ID del negozio
+            context: Contesto aggiuntivo (opzionale)
+        
+        Returns:
+            Eventi della risposta man mano che vengono generati
+        """
+        parameters = {
+            "query": query,
+            "store_id": store_id,
+        }
+        
+        if customer_id:
+            parameters["customer_id"] = customer_id
+        
+        if context:
+            parameters["context"] = context
+        
+        async for event in mcp_client.stream_function("customer_service_answer", parameters):
+            yield event
+    
     async def handle_complaint(
         self,
         complaint: str,
@@ -122,6 +155,28 @@ class CustomerServiceAgent:
         
         result = await mcp_client.call_function("customer_service_analyze_sentiment", parameters)
         return result
+    
+    async def analyze_sentiments(
+        self,
+        texts: List[str],
+    ) -> List[Dict[str, Any]]:
+        """
+        Analizza il sentiment di più testi con chiamate MCP batch.
+        
+        Args:
+            texts: Testi da analizzare
+        
+        Returns:
+            Analisi del sentiment, nello stesso ordine di texts
+        """
+        items = [
+            {
+                "text": text,
+            }
+            for text in texts
+        ]
+        
+        return await mcp_client.call_batch("customer_service_analyze_sentiment", items)
 
 # Istanza dell'agente di servizio clienti
 customer_service_agent = CustomerServiceAgent()
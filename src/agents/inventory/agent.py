@@ -36,6 +36,34 @@ class InventoryAgent:
         result = await mcp_client.call_function("inventory_predict_demand", parameters)
         return result
     
+    async def predict_demands(
+        self,
+        product_ids: List[str],
+        store_id: str,
+        days_ahead: int = 30,
+    ) -> List[Dict[str, Any]]:
+        """
+        Prevede la domanda futura per più prodotti con chiamate MCP batch.
+        
+        Args:
+            product_ids: ID dei prodotti
+            store_id: ID del negozio
+            days_ahead: Numero di giorni per cui prevedere la domanda
+        
+        Returns:
+            Previsioni della domanda, nello stesso ordine di product_ids
+        """
+        items = [
+            {
+                "product_id": product_id,
+                "store_id": store_id,
+                "days_ahead": days_ahead,
+            }
+            for product_id in product_ids
+        ]
+        
+        return await mcp_client.call_batch("inventory_predict_demand", items)
+    
     async def recommend_restock(
         self,
         store_id: str,
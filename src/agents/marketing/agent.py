@@ -1,5 +1,5 @@
 import logging
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
 
 from src.mcp.client import mcp_client
 
@@ -16,6 +16,7 @@ class MarketingAgent:
         store_id: str,
         tone: str = "professional",  # professional, friendly, persuasive
         length: str = "medium",  # short, medium, long
+        product_version: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
         Genera una descrizione ottimizzata per un prodotto.
@@ -25,6 +26,8 @@ class MarketingAgent:
             store_id: ID del negozio
             tone: Tono della descrizione
             length: Lunghezza della descrizione
+            product_version: Versione del prodotto (es. hash dei dati letti dalla generazione) usata per
+                invalidare la descrizione in cache (opzionale)
         
         Returns:
             Descrizione del prodotto
@@ -36,9 +39,56 @@ class MarketingAgent:
             "length": length,
         }
         
-        result = await mcp_client.call_function("marketing_generate_description", parameters)
+        result = await mcp_client.call_function(
+            "marketing_generate_description",
+            parameters,
+            cache_context={"product_version": product_version},
+        )
         return result
     
+    async def generate_product_descriptions(
+        self,
+        product_ids: List[str],
+        store_id: str,
+        tone: str = "professional",  # professional, friendly, persuasive
+        length: str = "medium",  # short, medium, long
+        product_versions: Optional[List[Optional[str]]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Genera descrizioni ottimizzate per più prodotti con chiamate MCP batch.
+        
+        Args:
+            product_ids: ID dei prodotti
+            store_id: ID del negozio
+            tone: Tono delle descrizioni
+            length: Lunghezza delle descrizioni
+            product_versions: Versioni dei prodotti usate per invalidare le
+                descrizioni in cache (opzionale, stesso ordine di product_ids)
+        
+        Returns:
+            Descrizioni dei prodotti, nello stesso ordine di product_ids
+        """
+        items = [
+            {
+                "product_id": product_id,
+                "store_id": store_id,
+                "tone": tone,
+                "length": length,
+            }
+            for product_id in product_ids
+        ]
+        
+        cache_contexts = [
+            {"product_version": product_version}
+            for product_version in (product_versions or [None] * len(product_ids))
+        ]
+        
+        return await mcp_client.call_batch(
+            "marketing_generate_description",
+            items,
+            cache_contexts=cache_contexts,
+        )
+    
     async def optimize_seo(
         self,
         text: str,
@@ -95,6 +145,39 @@ class MarketingAgent:
         result = await mcp_client.call_function("marketing_generate_campaign", parameters)
         return result
     
+    async def stream_campaign(
+        self,
+        store_id: str,
+        objective: str,  # sales, awareness, engagement
+        target_audience: Optional[Dict[str, Any]] = None,
+        budget: Optional[float] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Genera una campagna di marketing restituendola in streaming.
+        
+        Args:
+            store_id: ID del negozio
+            objective: Obiettivo della campagna
+            target_audience: Pubblico target (opzionale)
+            budget: Budget della campagna (opzionale)
+        
+        Returns:
+            Eventi del piano della campagna man mano che vengono generati
+        """
+        parameters = {
+            "store_id": store_id,
+            "objective": objective,
+        }
+        
+        if target_audience:
+            parameters["target_audience"] = target_audience
+        
+        if budget:
+            parameters["budget"] = budget
+        
+        async for event in mcp_client.stream_function("marketing_generate_campaign", parameters):
+            yield event
+    
     async def analyze_performance(
         self,
         store_id: str,
@@ -33,6 +33,31 @@ class PricingAgent:
         result = await mcp_client.call_function("pricing_optimize", parameters)
         return result
     
+    async def optimize_prices(
+        self,
+        product_ids: List[str],
+        store_id: str,
+    ) -> List[Dict[str, Any]]:
+        """
+        Ottimizza i prezzi di più prodotti con chiamate MCP batch.
+        
+        Args:
+            product_ids: ID dei prodotti
+            store_id: ID del negozio
+        
+        Returns:
+            Prezzi ottimizzati e analisi, nello stesso ordine di product_ids
+        """
+        items = [
+            {
+                "product_id": product_id,
+                "store_id": store_id,
+            }
+            for product_id in product_ids
+        ]
+        
+        return await mcp_client.call_batch("pricing_optimize", items)
+    
     async def analyze_competition(
         self,
         product_id: str,
@@ -56,6 +81,31 @@ class PricingAgent:
         result = await mcp_client.call_function("pricing_analyze_competition", parameters)
         return result
     
+    async def analyze_competitions(
+        self,
+        product_ids: List[str],
+        store_id: str,
+    ) -> List[Dict[str, Any]]:
+        """
+        Analizza i prezzi della concorrenza per più prodotti con chiamate MCP batch.
+        
+        Args:
+            product_ids: ID dei prodotti
+            store_id: ID del negozio
+        
+        Returns:
+            Analisi dei prezzi della concorrenza, nello stesso ordine di product_ids
+        """
+        items = [
+            {
+                "product_id": product_id,
+                "store_id": store_id,
+            }
+            for product_id in product_ids
+        ]
+        
+        return await mcp_client.call_batch("pricing_analyze_competition", items)
+    
     async def recommend_promotions(
         self,
         store_id: str,
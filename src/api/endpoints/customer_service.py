@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.agents.customer_service.agent import customer_service_agent
+from src.api.streaming import event_stream_response
+from src.core.dependencies import get_db, get_current_user
+from src.models.store import Store
+from src.models.user import User
+from src.schemas.customer_service import CustomerServiceQuery
+
+router = APIRouter()
+
+@router.post("/answer/stream")
+async def stream_answer(
+    *,
+    db: AsyncSession = Depends(get_db),
+    query_in: CustomerServiceQuery,
+    current_user: User = Depends(get_current_user),
+) -> StreamingResponse:
+    """
+    Risponde a una domanda di un cliente in streaming (Server-Sent Events).
+    
+    Ogni evento contiene una parte della risposta; lo stream termina con
+    l'evento "done" oppure con un evento "error".
+    """
+    # Verifica che il negozio appartenga all'utente corrente
+    result = await db.execute(
+        select(Store).where(Store.id == query_in.store_id, Store.owner_id == current_user.id)
+    )
+    store = result.scalars().first()
+    if not store:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Negozio non trovato o non autorizzato",
+        )
+    
+    events = customer_service_agent.stream_answer_query(
+        query=query_in.query,
+        customer_id=str(query_in.customer_id) if query_in.customer_id else None,
+        store_id=str(store.id),
+        context=query_in.context,
+    )
+    return event_stream_response(events)
@@ -2,14 +2,18 @@ from typing import Any, List, Dict
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.api.streaming import event_stream_response
 from src.core.dependencies import get_db, get_current_user, check_subscription_plan
 from src.models.email_template import EmailTemplate
 from src.models.user import User
 from src.models.customer import Customer
 from src.models.store import Store
-from src.schemas.email import EmailTemplate as EmailTemplateSchema, EmailTemplateCreate, EmailTemplateUpdate, EmailSend
+from src.email.agent import email_agent
+from src.schemas.email import EmailTemplate as EmailTemplateSchema, EmailTemplateCreate, EmailTemplateUpdate, EmailSend, EmailResponseGenerate
 
 router = APIRouter()
 
@@ -185,3 +189,35 @@ async def send_newsletter(
         "message": "Newsletter in elaborazione",
         "status": "accepted"
     }
+
+@router.post("/generate-response/stream")
+async def stream_generate_response(
+    *,
+    db: AsyncSession = Depends(get_db),
+    request_in: EmailResponseGenerate,
+    current_user: User = Depends(get_current_user),
+) -> StreamingResponse:
+    """
+    Genera una risposta a un'email in streaming (Server-Sent Events).
+    
+    Ogni evento contiene una parte della risposta; lo stream termina con
+    l'evento "done" oppure con un evento "error".
+    """
+    # Verifica che il negozio appartenga all'utente corrente
+    result = await db.execute(
+        select(Store).where(Store.id == request_in.store_id, Store.owner_id == current_user.id)
+    )
+    store = result.scalars().first()
+    if not store:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Negozio non trovato o non autorizzato",
+        )
+    
+    events = email_agent.stream_response(
+        email_content=request_in.email_content,
+        customer_id=str(request_in.customer_id) if request_in.customer_id else None,
+        store_id=str(store.id),
+        tone=request_in.tone,
+    )
+    return event_stream_response(events)
@@ -5,6 +5,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.core.dependencies import get_db, get_current_user
+from src.integrations.registry import marketplace_clients
 from src.models.store import Store
 from src.models.user import User
 from src.schemas.store import Store as StoreSchema, StoreCreate, StoreUpdate
@@ -84,6 +85,9 @@ async def update_store(
         setattr(store, field, value)
     
     await db.commit()
+    
+    # I client marketplace in cache sono stati creati con la configurazione precedente
+    await marketplace_clients.invalidate_store(store.id)
     await db.refresh(store)
     return store
 
@@ -106,4 +110,5 @@ async def delete_store(
     
     await db.delete(store)
     await db.commit()
+    await marketplace_clients.invalidate_store(store.id)
     return store
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.dependencies import get_db
+from src.models.store import Store
+from src.tasks.webhooks import schedule_flush
+from src.webhooks.buffer import buffer_updates
+from src.webhooks.events import WebhookUpdates, parse_shopify_event, parse_woocommerce_event
+from src.webhooks.verification import verify_hmac_signature
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+async def _get_store(db: AsyncSession, store_id: UUID, platform: str) -> Store:
+    result = await db.execute(
+        select(Store).where(Store.id == store_id, Store.platform == platform, Store.is_active == True)
+    )
+    store = result.scalars().first()
+    if not store:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Negozio non trovato",
+        )
+    return store
+
+def _verify(body: bytes, signature: Optional[str], secret: Optional[str]) -> None:
+    if not verify_hmac_signature(body, signature, secret):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Firma del webhook non valida",
+        )
+
+def _parse_payload(body: bytes) -> Dict[str, Any]:
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Payload del webhook non valido",
+        )
+    return payload
+
+async def _enqueue(store: Store, updates: Optional[WebhookUpdates], topic: str) -> Dict[str, Any]:
+    """
+    Accumula gli aggiornamenti nel buffer del negozio e pianifica il loro
+    svuotamento sulla coda webhooks; la risposta non attende l'applicazione.
+    """
+    if updates is None:
+        logger.info(f"Webhook {topic} non gestito per il negozio {store.id}: ignorato")
+        return {"success": True, "queued": False}
+    
+    if not updates.is_empty() and await buffer_updates(store.id, updates):
+        # La pubblicazione sul broker è sincrona: non deve bloccare l'event loop
+        await asyncio.to_thread(schedule_flush, store.id)
+    
+    return {"success": True, "queued": not updates.is_empty()}
+
+@router.post("/shopify/{store_id}")
+async def receive_shopify_webhook(
+    *,
+    db: AsyncSession = Depends(get_db),
+    store_id: UUID,
+    request: Request,
+) -> Any:
+    """
+    Riceve i webhook Shopify (inventory_levels/update, products/update, orders/create).
+    
+    La firma X-Shopify-Hmac-Sha256 è calcolata con il webhook_secret del negozio
+    o, in sua assenza, con l'API secret dell'app.
+    """
+    store = await _get_store(db, store_id, "shopify")
+    credentials = (store.settings or {}).get("credentials", {})
+    
+    body = await request.body()
+    _verify(
+        body,
+        request.headers.get("X-Shopify-Hmac-Sha256"),
+        credentials.get("webhook_secret") or credentials.get("api_secret"),
+    )
+    
+    topic = request.headers.get("X-Shopify-Topic", "")
+    payload = _parse_payload(body)
+    return await _enqueue(store, parse_shopify_event(topic, payload), topic)
+
+@router.post("/woocommerce/{store_id}")
+async def receive_woocommerce_webhook(
+    *,
+    db: AsyncSession = Depends(get_db),
+    store_id: UUID,
+    request: Request,
+) -> Any:
+    """
+    Riceve i webhook WooCommerce (product.updated, order.created).
+    
+    La firma X-WC-Webhook-Signature è calcolata con il webhook_secret configurato
+    per il webhook nel negozio.
+    """
+    store = await _get_store(db, store_id, "woocommerce")
+    credentials = (store.settings or {}).get("credentials", {})
+    
+    body = await request.body()
+    topic = request.headers.get("X-WC-Webhook-Topic")
+    if topic is None:
+        # Alla creazione del webhook WooCommerce invia un ping non firmato (webhook_id=...)
+        return {"success": True, "queued": False}
+    
+    _verify(body, request.headers.get("X-WC-Webhook-Signature"), credentials.get("webhook_secret"))
+    
+    payload = _parse_payload(body)
+    return await _enqueue(store, parse_woocommerce_event(topic, payload), topic)
@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from src.api.endpoints import auth, users, stores, products, orders, customers, email, integrations
+from src.api.endpoints import auth, users, stores, products, orders, customers, customer_service, email, integrations, webhooks
 
 # Router principale per le API
 api_router = APIRouter()
@@ -12,5 +12,7 @@ api_router.include_router(stores.router, prefix="/stores", tags=["negozi"])
 api_router.include_router(products.router, prefix="/products", tags=["prodotti"])
 api_router.include_router(orders.router, prefix="/orders", tags=["ordini"])
 api_router.include_router(customers.router, prefix="/customers", tags=["clienti"])
+api_router.include_router(customer_service.router, prefix="/customer-service", tags=["servizio clienti"])
 api_router.include_router(email.router, prefix="/email", tags=["email"])
 api_router.include_router(integrations.router, prefix="/integrations", tags=["integrazioni"])
+api_router.include_router(webhooks.router, prefix="/webhooks", tags=["webhook"])
@@ -0,0 +1,31 @@
+import json
+from typing import Any, AsyncIterator, Dict
+
+from fastapi.responses import StreamingResponse
+
+async def _format_events(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    """
+    Serializza gli eventi di un agente nel formato Server-Sent Events.
+    """
+    async for event in events:
+        data = json.dumps(event, ensure_ascii=False, default=str)
+        if "error" in event:
+            yield f"event: error\ndata: {data}\n\n"
+            return
+        yield f"data: {data}\n\n"
+    
+    yield "event: done\ndata: [DONE]\n\n"
+
+def event_stream_response(events: AsyncIterator[Dict[str, Any]]) -> StreamingResponse:
+    """
+    Restituisce gli eventi di un agente al client come stream SSE (text/event-stream).
+    """
+    return StreamingResponse(
+        _format_events(events),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Disabilita il buffering dei reverse proxy (es. nginx)
+            "X-Accel-Buffering": "no",
+        },
+    )
@@ -1,4 +1,5 @@
 from celery import Celery
+from celery.signals import worker_process_init, worker_process_shutdown
 from src.core.config import settings
 
 # Configurazione dell'app Celery
@@ -12,6 +13,9 @@ celery_app = Celery(
         "src.tasks.pricing",
         "src.tasks.marketing",
         "src.tasks.customer_service",
+        "src.tasks.webhooks",
+        "src.tasks.payments",
+        "src.tasks.fanout",
     ]
 )
 
@@ -35,13 +39,16 @@ celery_app.conf.task_routes = {
     "src.tasks.pricing.*": {"queue": "pricing"},
     "src.tasks.marketing.*": {"queue": "marketing"},
     "src.tasks.customer_service.*": {"queue": "customer_service"},
+    "src.tasks.webhooks.*": {"queue": "webhooks"},
+    "src.tasks.payments.*": {"queue": "payments"},
 }
 
 # Configurazione dei task periodici
 celery_app.conf.beat_schedule = {
-    "sync-inventory-every-hour": {
+    # Le giacenze arrivano via webhook: la sincronizzazione resta come riconciliazione
+    "reconcile-inventory-periodically": {
         "task": "src.tasks.inventory.sync_inventory",
-        "schedule": 3600.0,
+        "schedule": settings.INVENTORY_SYNC_INTERVAL_SECONDS,
     },
     "update-pricing-every-day": {
         "task": "src.tasks.pricing.update_dynamic_pricing",
@@ -51,7 +58,58 @@ celery_app.conf.beat_schedule = {
         "task": "src.tasks.marketing.send_weekly_newsletter",
         "schedule": 604800.0,
     },
+    "process-customer-feedback-daily": {
+        "task": "src.tasks.customer_service.process_customer_feedback",
+        "schedule": 86400.0,
+    },
+    "reconcile-payments-daily": {
+        "task": "src.tasks.payments.reconcile_payments",
+        "schedule": 86400.0,
+    },
 }
 
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    """
+    Inizializzazione di ogni processo worker dopo il fork.
+    """
+    from src.core.redis import reset_redis
+    from src.db.session import engine
+    from src.integrations.payment.executor import reset_payment_executor
+    from src.integrations.registry import marketplace_clients
+    from src.mcp.client import mcp_client
+    
+    # I pool di connessioni ereditati dal processo padre non sono condivisibili
+    mcp_client.reset()
+    marketplace_clients.reset()
+    reset_payment_executor()
+    reset_redis()
+    engine.sync_engine.dispose(close=False)
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    """
+    Rilascio delle risorse alla chiusura di ogni processo worker.
+    """
+    from src.core.redis import close_redis
+    from src.core.worker_loop import worker_loop
+    from src.db.session import engine
+    from src.integrations.payment.executor import shutdown_payment_executor
+    from src.integrations.registry import marketplace_clients
+    from src.mcp.client import mcp_client
+    
+    async def _shutdown():
+        await mcp_client.shutdown()
+        await marketplace_clients.shutdown()
+        await close_redis()
+        await engine.dispose()
+    
+    # Le risorse vanno chiuse nel loop persistente in cui sono state create dai task
+    try:
+        worker_loop.run(_shutdown())
+    finally:
+        worker_loop.close()
+        shutdown_payment_executor()
+
 if __name__ == "__main__":
     celery_app.start()
@@ -1,5 +1,5 @@
 import os
-from typing import List, Union
+from typing import Dict, List, Union
 from pydantic import AnyHttpUrl, validator
 from pydantic_settings import BaseSettings
 
@@ -66,6 +66,173 @@ class Settings(BaseSettings):
     HUGGINGFACE_API_KEY: str = ""
     MCP_ENABLED: bool = True
     MCP_SERVER_URL: str = "http://localhost:8080"
+    MCP_TIMEOUT: float = 60.0
+    MCP_CONNECT_TIMEOUT: float = 5.0
+    MCP_HTTP2: bool = True
+    MCP_POOL_MAX_CONNECTIONS: int = 100
+    MCP_POOL_MAX_KEEPALIVE: int = 20
+    MCP_POOL_KEEPALIVE_EXPIRY: float = 30.0
+    MCP_BATCH_MAX_SIZE: int = 50
+    MCP_BATCH_CONCURRENCY: int = 10
+    MCP_FUNCTIONS_CACHE_TTL: float = 300.0
+    MCP_CACHE_ENABLED: bool = True
+    MCP_CACHE_REDIS_ENABLED: bool = True
+    MCP_CACHE_LOCAL_MAX_ENTRIES: int = 1024
+    # TTL in secondi per funzione (sono ammessi pattern con *); 0 o assente disabilita la cache
+    MCP_CACHE_TTLS: Dict[str, int] = {
+        "marketing_optimize_seo": 86400,
+        "marketing_generate_description": 86400,
+        "customer_service_analyze_sentiment": 86400,
+        "*_agent_capabilities": 3600,
+    }
+    # Funzioni le cui chiamate concorrenti identiche vengono unificate (sono ammessi pattern con *)
+    MCP_SINGLEFLIGHT_FUNCTIONS: List[str] = [
+        "pricing_analyze_competition",
+        "pricing_optimize",
+        "pricing_forecast_impact",
+        "inventory_predict_demand",
+        "inventory_recommend_restock",
+        "inventory_analyze_trends",
+        "customer_service_analyze_sentiment",
+        "marketing_optimize_seo",
+        "*_agent_capabilities",
+    ]
+    MCP_SINGLEFLIGHT_DISTRIBUTED: bool = False
+    MCP_SINGLEFLIGHT_LOCK_TTL: float = 120.0
+    MCP_SINGLEFLIGHT_RESULT_TTL: float = 10.0
+    MCP_SINGLEFLIGHT_WAIT_TIMEOUT: float = 90.0
+    MCP_SINGLEFLIGHT_POLL_INTERVAL: float = 0.05
+    MCP_MAX_CONCURRENCY: int = 64
+    MCP_DEFAULT_FUNCTION_CONCURRENCY: int = 16
+    # Limiti di concorrenza massimi per le singole funzioni
+    MCP_FUNCTION_MAX_CONCURRENCY: Dict[str, int] = {
+        "marketing_generate_campaign": 4,
+        "marketing_generate_description": 8,
+        "email_generate_response": 8,
+        "customer_service_answer": 8,
+    }
+    MCP_ADAPTIVE_LIMITS: bool = True
+    MCP_ADAPTIVE_MIN_CONCURRENCY: int = 1
+    MCP_ADAPTIVE_LATENCY_TOLERANCE: float = 2.0
+    MCP_ADAPTIVE_DECREASE_FACTOR: float = 0.7
+    # Funzioni senza effetti collaterali, che possono essere ripetute o duplicate (hedging)
+    MCP_IDEMPOTENT_FUNCTIONS: List[str] = [
+        "*_agent_capabilities",
+        "pricing_optimize",
+        "pricing_analyze_competition",
+        "pricing_recommend_promotions",
+        "pricing_forecast_impact",
+        "inventory_predict_demand",
+        "inventory_recommend_restock",
+        "inventory_optimize",
+        "inventory_analyze_trends",
+        "customer_service_analyze_sentiment",
+        "marketing_optimize_seo",
+        "marketing_analyze_performance",
+        "email_classify",
+        "email_extract_info",
+        "email_summarize_thread",
+    ]
+    MCP_RETRY_MAX_ATTEMPTS: int = 3
+    MCP_RETRY_BASE_DELAY: float = 0.5
+    MCP_RETRY_MAX_DELAY: float = 10.0
+    MCP_HEDGING_ENABLED: bool = True
+    MCP_HEDGE_PERCENTILE: float = 95.0
+    MCP_HEDGE_MIN_SAMPLES: int = 20
+    MCP_BREAKER_FAILURE_THRESHOLD: int = 5
+    MCP_BREAKER_RESET_TIMEOUT: float = 30.0
+    MCP_BREAKER_HALF_OPEN_MAX_CALLS: int = 1
+    
+    # Sincronizzazione marketplace
+    # Intervallo della sincronizzazione periodica, di sola riconciliazione: gli
+    # aggiornamenti arrivano tramite webhook
+    INVENTORY_SYNC_INTERVAL_SECONDS: float = 21600.0
+    # Intervallo tra due riconciliazioni complete del catalogo; nel frattempo si
+    # scaricano solo i prodotti modificati dall'ultima sincronizzazione
+    INVENTORY_FULL_SYNC_INTERVAL_HOURS: float = 24.0
+    # Margine sottratto al watermark per tollerare differenze di orologio e ritardi del marketplace
+    INVENTORY_SYNC_OVERLAP_SECONDS: int = 300
+    
+    # Distribuzione dei task periodici per negozio
+    # Negozi con almeno questo numero di elementi (prodotti, clienti, ordini) hanno un sotto-task dedicato
+    STORE_FANOUT_SMALL_THRESHOLD: int = 1000
+    # Numero di negozi piccoli raggruppati nello stesso sotto-task
+    STORE_FANOUT_CHUNK_SIZE: int = 10
+    
+    # Pricing dinamico
+    # Prodotti per pagina inviati all'ottimizzazione e pagine ottimizzate contemporaneamente
+    PRICING_PAGE_SIZE: int = 200
+    PRICING_CONCURRENCY: int = 4
+    # Età massima di un checkpoint da cui riprendere un repricing interrotto
+    PRICING_CHECKPOINT_MAX_AGE_HOURS: float = 12.0
+    # Richieste di pubblicazione dei prezzi sul marketplace in corso contemporaneamente per negozio
+    PRICE_PUBLISH_CONCURRENCY: int = 4
+    PRICE_PUBLISH_MAX_ATTEMPTS: int = 3
+    # Costo stimato in punti di una mutation productVariantsBulkUpdate (API GraphQL di Shopify)
+    SHOPIFY_VARIANTS_UPDATE_COST: int = 10
+    
+    # Client asincrono Shopify: versione dell'API Admin e pool di connessioni per negozio
+    SHOPIFY_API_VERSION: str = "2023-07"
+    SHOPIFY_TIMEOUT: float = 30.0
+    SHOPIFY_CONNECT_TIMEOUT: float = 5.0
+    SHOPIFY_POOL_MAX_CONNECTIONS: int = 10
+    SHOPIFY_POOL_MAX_KEEPALIVE: int = 5
+    SHOPIFY_POOL_KEEPALIVE_EXPIRY: float = 30.0
+    
+    # Esportazione del catalogo Shopify con le bulk operation GraphQL (sincronizzazioni complete e importazioni)
+    SHOPIFY_BULK_EXPORT_ENABLED: bool = True
+    SHOPIFY_BULK_POLL_INTERVAL: float = 5.0
+    SHOPIFY_BULK_TIMEOUT: int = 3600
+    
+    # Richieste agli endpoint batch di WooCommerce (100 operazioni ciascuna) in corso contemporaneamente
+    WOOCOMMERCE_BATCH_CONCURRENCY: int = 4
+    
+    # Registro dei client marketplace del processo (per negozio o integrazione)
+    MARKETPLACE_CLIENT_CACHE_SIZE: int = 256
+    # Secondi di inutilizzo dopo cui un client e il suo pool di connessioni vengono chiusi
+    MARKETPLACE_CLIENT_IDLE_TTL: float = 900.0
+    
+    # Cache delle letture dei marketplace con richieste condizionali (ETag / Last-Modified) in Redis
+    MARKETPLACE_HTTP_CACHE_ENABLED: bool = True
+    MARKETPLACE_HTTP_CACHE_TTL: int = 86400
+    # Dimensione massima (caratteri) di un body memorizzato
+    MARKETPLACE_HTTP_CACHE_MAX_BODY_SIZE: int = 1048576
+    
+    # Client di pagamento: thread del pool in cui vengono eseguite le chiamate
+    # sincrone agli SDK di Stripe e PayPal e timeout delle richieste PayPal
+    PAYMENT_THREAD_POOL_SIZE: int = 16
+    PAYMENT_HTTP_TIMEOUT: int = 30
+    
+    # Token OAuth PayPal condivisi tra i worker in Redis: rinnovo anticipato
+    # rispetto alla scadenza e lock del rinnovo (durata e attesa massima)
+    PAYPAL_TOKEN_CACHE_ENABLED: bool = True
+    PAYPAL_TOKEN_REFRESH_MARGIN: int = 300
+    PAYPAL_TOKEN_LOCK_TIMEOUT: int = 30
+    PAYPAL_TOKEN_LOCK_WAIT: int = 10
+    
+    # Riconciliazione dei pagamenti Stripe e PayPal con gli ordini: giorni
+    # riesaminati a ogni esecuzione e minuti più recenti esclusi, perché le
+    # transazioni compaiono nelle esportazioni dei provider con ritardo
+    PAYMENT_RECONCILIATION_WINDOW_DAYS: float = 7.0
+    PAYMENT_RECONCILIATION_LAG_MINUTES: int = 180
+    
+    # Rate limit delle API dei marketplace (token bucket per negozio condiviso in Redis)
+    MARKETPLACE_RATE_LIMIT_ENABLED: bool = True
+    MARKETPLACE_RATE_LIMIT_MAX_ATTEMPTS: int = 5
+    # Pausa applicata a una risposta 429/503 senza Retry-After
+    MARKETPLACE_RATE_LIMIT_DEFAULT_PAUSE: float = 2.0
+    MARKETPLACE_RATE_LIMIT_STATE_TTL: int = 3600
+    # Valori iniziali, poi corretti con gli header di limite restituiti dal marketplace
+    SHOPIFY_RATE_LIMIT_BUCKET: int = 40
+    SHOPIFY_RATE_LIMIT_RATE: float = 2.0
+    WOOCOMMERCE_RATE_LIMIT_BUCKET: int = 20
+    WOOCOMMERCE_RATE_LIMIT_RATE: float = 5.0
+    
+    # Webhook marketplace
+    # Attesa prima di applicare gli aggiornamenti accumulati, per unificare gli eventi ravvicinati
+    WEBHOOK_FLUSH_DELAY_SECONDS: float = 5.0
+    # Scadenza del flag di svuotamento pianificato, nel caso il task vada perso
+    WEBHOOK_FLUSH_LOCK_TTL: int = 120
     
     # Email
     SMTP_HOST: str
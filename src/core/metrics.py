@@ -0,0 +1,123 @@
+import threading
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+class MetricsRegistry:
+    """
+    Registro in memoria di contatori, gauge e distribuzioni del processo.
+    
+    Le metriche sono identificate da nome ed etichette e vengono esposte
+    dall'endpoint /metrics dell'API.
+    """
+    
+    def __init__(self, max_samples: int = 1024):
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = defaultdict(lambda: defaultdict(float))
+        self._gauges: Dict[str, Dict[LabelKey, float]] = defaultdict(dict)
+        self._samples: Dict[str, Dict[LabelKey, Deque[float]]] = defaultdict(dict)
+    
+    @staticmethod
+    def _label_key(labels: Dict[str, Any]) -> LabelKey:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+    
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        """
+        Incrementa un contatore.
+        """
+        with self._lock:
+            self._counters[name][self._label_key(labels)] += value
+    
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        """
+        Imposta il valore di un gauge.
+        """
+        with self._lock:
+            self._gauges[name][self._label_key(labels)] = value
+    
+    def add_gauge(self, name: str, delta: float, **labels: Any) -> None:
+        """
+        Somma un delta al valore di un gauge.
+        """
+        with self._lock:
+            key = self._label_key(labels)
+            self._gauges[name][key] = self._gauges[name].get(key, 0.0) + delta
+    
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """
+        Registra un campione di una distribuzione (es. latenze).
+        """
+        with self._lock:
+            key = self._label_key(labels)
+            samples = self._samples[name].get(key)
+            if samples is None:
+                samples = self._samples[name][key] = deque(maxlen=self.max_samples)
+            samples.append(value)
+    
+    def get_counter(self, name: str, **labels: Any) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(self._label_key(labels), 0.0)
+    
+    def get_gauge(self, name: str, **labels: Any) -> float:
+        with self._lock:
+            return self._gauges.get(name, {}).get(self._label_key(labels), 0.0)
+    
+    def sample_count(self, name: str, **labels: Any) -> int:
+        with self._lock:
+            return len(self._samples.get(name, {}).get(self._label_key(labels), ()))
+    
+    def percentile(self, name: str, percentile: float, **labels: Any) -> float:
+        """
+        Calcola un percentile sui campioni recenti di una distribuzione (0 se vuota).
+        """
+        with self._lock:
+            samples = sorted(self._samples.get(name, {}).get(self._label_key(labels), ()))
+        if not samples:
+            return 0.0
+        index = min(len(samples) - 1, max(0, int(round(percentile / 100 * len(samples))) - 1))
+        return samples[index]
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Restituisce lo stato corrente di tutte le metriche.
+        """
+        def _format(name: str, key: LabelKey) -> str:
+            if not key:
+                return name
+            return name + "{" + ",".join(f"{k}={v}" for k, v in key) + "}"
+        
+        with self._lock:
+            counters = {
+                _format(name, key): value
+                for name, series in self._counters.items()
+                for key, value in series.items()
+            }
+            gauges = {
+                _format(name, key): value
+                for name, series in self._gauges.items()
+                for key, value in series.items()
+            }
+            distributions = {}
+            for name, series in self._samples.items():
+                for key, samples in series.items():
+                    ordered = sorted(samples)
+                    if not ordered:
+                        continue
+                    distributions[_format(name, key)] = {
+                        "count": len(ordered),
+                        "p50": ordered[len(ordered) // 2],
+                        "p95": ordered[max(0, int(len(ordered) * 0.95) - 1)],
+                        "p99": ordered[max(0, int(len(ordered) * 0.99) - 1)],
+                        "max": ordered[-1],
+                    }
+        
+        return {
+            "counters": counters,
+            "gauges": gauges,
+            "distributions": distributions,
+        }
+
+# Registro delle metriche del processo
+metrics = MetricsRegistry()
@@ -0,0 +1,67 @@
+import asyncio
+import logging
+from typing import Optional
+
+import redis
+import redis.asyncio as aioredis
+
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_async_client: Optional[aioredis.Redis] = None
+_async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_sync_client: Optional[redis.Redis] = None
+
+def get_redis() -> aioredis.Redis:
+    """
+    Restituisce il client Redis asincrono condiviso dal processo.
+    
+    Come per il pool HTTP di MCP, le connessioni sono legate all'event loop
+    corrente e il client viene ricreato se il loop cambia.
+    """
+    global _async_client, _async_client_loop
+    
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        _async_client = aioredis.Redis.from_url(settings.REDIS_URI, decode_responses=True)
+        _async_client_loop = loop
+    return _async_client
+
+def get_sync_redis() -> redis.Redis:
+    """
+    Restituisce il client Redis sincrono condiviso dal processo.
+    """
+    global _sync_client
+    
+    if _sync_client is None:
+        _sync_client = redis.Redis.from_url(settings.REDIS_URI, decode_responses=True)
+    return _sync_client
+
+async def close_redis() -> None:
+    """
+    Chiude il client Redis asincrono, se aperto nel loop corrente.
+    """
+    global _async_client, _async_client_loop
+    
+    client, loop = _async_client, _async_client_loop
+    _async_client = None
+    _async_client_loop = None
+    
+    if client is None or loop is not asyncio.get_running_loop():
+        return
+    
+    try:
+        await client.close()
+    except Exception as e:
+        logger.warning(f"Errore nella chiusura del client Redis: {str(e)}")
+
+def reset_redis() -> None:
+    """
+    Scarta i client Redis senza chiuderli (es. dopo un fork del processo).
+    """
+    global _async_client, _async_client_loop, _sync_client
+    
+    _async_client = None
+    _async_client_loop = None
+    _sync_client = None
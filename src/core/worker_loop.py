@@ -0,0 +1,90 @@
+import asyncio
+import functools
+import inspect
+import logging
+import os
+import threading
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class WorkerLoop:
+    """
+    Event loop persistente per eseguire codice asincrono da codice sincrono (task Celery).
+    
+    A differenza di asyncio.run, il loop non viene chiuso al termine di ogni
+    esecuzione: i pool di connessioni legati al loop (database, MCP, Redis)
+    restano validi tra un task e l'altro. Ogni thread ha il proprio loop e un
+    nuovo loop viene creato dopo un fork del processo.
+    """
+    
+    def __init__(self):
+        self._local = threading.local()
+    
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        """
+        Restituisce il loop del thread corrente, creandolo se necessario.
+        """
+        loop: Optional[asyncio.AbstractEventLoop] = getattr(self._local, "loop", None)
+        if loop is None or loop.is_closed() or getattr(self._local, "pid", None) != os.getpid():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            self._local.loop = loop
+            self._local.pid = os.getpid()
+        return loop
+    
+    def run(self, coroutine: Awaitable[T]) -> T:
+        """
+        Esegue una coroutine fino al completamento nel loop persistente.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            if inspect.iscoroutine(coroutine):
+                coroutine.close()
+            raise RuntimeError("WorkerLoop.run non può essere chiamato da un event loop in esecuzione")
+        
+        return self.get_loop().run_until_complete(coroutine)
+    
+    def close(self) -> None:
+        """
+        Annulla i task rimasti e chiude il loop del thread corrente.
+        """
+        loop: Optional[asyncio.AbstractEventLoop] = getattr(self._local, "loop", None)
+        self._local.loop = None
+        if loop is None or loop.is_closed() or getattr(self._local, "pid", None) != os.getpid():
+            return
+        
+        try:
+            pending = asyncio.all_tasks(loop)
+            for task in pending:
+                task.cancel()
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.run_until_complete(loop.shutdown_default_executor())
+        except Exception as e:
+            logger.warning(f"Errore nella chiusura dell'event loop del worker: {str(e)}")
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+# Event loop persistente dei worker
+worker_loop = WorkerLoop()
+
+def async_task(function: Callable[..., Awaitable[T]]) -> Callable[..., T]:
+    """
+    Decoratore che rende sincrona una funzione asincrona eseguendola nel loop
+    persistente del worker; da applicare sotto @celery_app.task.
+    """
+    @functools.wraps(function)
+    def wrapper(*args: Any, **kwargs: Any) -> T:
+        return worker_loop.run(function(*args, **kwargs))
+    
+    # Celery verifica gli argomenti dei task sulla firma della funzione originale
+    wrapper.__signature__ = inspect.signature(function)
+    return wrapper
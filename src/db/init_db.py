@@ -11,6 +11,8 @@ from src.models.product import Product
 from src.models.order import Order
 from src.models.customer import Customer
 from src.models.email_template import EmailTemplate
+from src.models.sync_state import SyncState
+from src.models.payment_discrepancy import PaymentDiscrepancy
 from src.utils.security import get_password_hash
 
 async def init_db(db: AsyncSession) -> None:
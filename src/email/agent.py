@@ -1,5 +1,5 @@
 import logging
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
 
 from src.mcp.client import mcp_client
 
@@ -41,6 +41,37 @@ class EmailAgent:
         result = await mcp_client.call_function("email_generate_response", parameters)
         return result
     
+    async def stream_response(
+        self,
+        email_content: str,
+        customer_id: Optional[str] = None,
+        store_id: str = None,
+        tone: str = "professional",  # professional, friendly, formal
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Genera una risposta a un'email restituendola in streaming.
+        
+        Args:
+            email_content: Contenuto dell'email ricevuta
+            customer_id: ID del cliente (opzionale)
+            store_id: ID del negozio
+            tone: Tono della risposta
+        
+        Returns:
+            Eventi della risposta man mano che vengono generati
+        """
+        parameters = {
+            "email_content": email_content,
+            "store_id": store_id,
+            "tone": tone,
+        }
+        
+        if customer_id:
+            parameters["customer_id"] = customer_id
+        
+        async for event in mcp_client.stream_function("email_generate_response", parameters):
+            yield event
+    
     async def classify_email(
         self,
         email_content: str,
@@ -61,6 +92,28 @@ class EmailAgent:
         result = await mcp_client.call_function("email_classify", parameters)
         return result
     
+    async def classify_emails(
+        self,
+        email_contents: List[str],
+    ) -> List[Dict[str, Any]]:
+        """
+        Classifica più email con chiamate MCP batch.
+        
+        Args:
+            email_contents: Contenuti delle email
+        
+        Returns:
+            Classificazioni delle email, nello stesso ordine di email_contents
+        """
+        items = [
+            {
+                "email_content": email_content,
+            }
+            for email_content in email_contents
+        ]
+        
+        return await mcp_client.call_batch("email_classify", items)
+    
     async def extract_info(
         self,
         email_content: str,
@@ -0,0 +1,159 @@
+import hashlib
+import logging
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from src.core.config import settings
+from src.core.metrics import metrics
+from src.core.redis import get_redis, get_sync_redis
+
+logger = logging.getLogger(__name__)
+
+# Voce in cache: etag, last_modified e body della risposta
+CacheEntry = Dict[str, str]
+
+class ConditionalGetCache:
+    """
+    Cache HTTP delle letture dei marketplace basata sulle richieste condizionali.
+    
+    Per ogni URL di risorsa vengono salvati in Redis l'ETag e/o il Last-Modified
+    della risposta insieme al body; le letture successive inviano If-None-Match
+    e If-Modified-Since e, se il marketplace risponde 304 Not Modified, viene
+    restituito il body in cache senza riscaricarlo. Le risposte senza
+    validatori non vengono memorizzate. Se Redis non è disponibile le richieste
+    procedono senza cache.
+    """
+    
+    def __init__(self, platform: str):
+        self.platform = platform
+    
+    def _key(self, url: str) -> str:
+        return f"httpcache:{self.platform}:{hashlib.sha256(url.encode()).hexdigest()}"
+    
+    @staticmethod
+    def conditional_headers(entry: Optional[CacheEntry]) -> Dict[str, str]:
+        """
+        Header condizionali da inviare con la richiesta per una voce in cache.
+        """
+        headers: Dict[str, str] = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+    
+    def _resolve(
+        self,
+        entry: Optional[CacheEntry],
+        status_code: int,
+        headers: Mapping[str, Any],
+        body: Optional[str],
+    ) -> Tuple[Optional[str], Optional[CacheEntry]]:
+        """
+        Restituisce il body da usare per la risposta (quello in cache su un 304,
+        None se la risposta va usata così com'è) e la voce da memorizzare.
+        """
+        if status_code == 304 and entry and "body" in entry:
+            metrics.inc("marketplace_http_cache_requests_total", platform=self.platform, result="hit")
+            metrics.inc("marketplace_http_cache_bytes_saved_total", len(entry["body"].encode()), platform=self.platform)
+            self._update_hit_ratio()
+            return entry["body"], None
+        
+        metrics.inc("marketplace_http_cache_requests_total", platform=self.platform, result="miss")
+        self._update_hit_ratio()
+        
+        if status_code != 200 or body is None or len(body) > settings.MARKETPLACE_HTTP_CACHE_MAX_BODY_SIZE:
+            return None, None
+        
+        etag = headers.get("ETag") or headers.get("etag")
+        last_modified = headers.get("Last-Modified") or headers.get("last-modified")
+        if not etag and not last_modified:
+            return None, None
+        
+        return None, {"etag": etag or "", "last_modified": last_modified or "", "body": body}
+    
+    def _update_hit_ratio(self) -> None:
+        hits = metrics.get_counter("marketplace_http_cache_requests_total", platform=self.platform, result="hit")
+        misses = metrics.get_counter("marketplace_http_cache_requests_total", platform=self.platform, result="miss")
+        metrics.set_gauge("marketplace_http_cache_hit_ratio", hits / (hits + misses), platform=self.platform)
+    
+    async def lookup(self, url: str) -> Optional[CacheEntry]:
+        """
+        Recupera la voce in cache di un URL, se presente.
+        """
+        if not settings.MARKETPLACE_HTTP_CACHE_ENABLED:
+            return None
+        
+        try:
+            return await get_redis().hgetall(self._key(url)) or None
+        except Exception as e:
+            logger.warning(f"Cache HTTP {self.platform} non disponibile: {str(e)}")
+            return None
+    
+    async def resolve(
+        self,
+        url: str,
+        entry: Optional[CacheEntry],
+        status_code: int,
+        headers: Mapping[str, Any],
+        body: Optional[str],
+    ) -> Optional[str]:
+        """
+        Elabora la risposta a una richiesta condizionale: su un 304 restituisce il
+        body in cache, altrimenti memorizza i nuovi validatori e restituisce None.
+        """
+        if not settings.MARKETPLACE_HTTP_CACHE_ENABLED:
+            return None
+        
+        cached_body, new_entry = self._resolve(entry, status_code, headers, body)
+        if new_entry is not None:
+            try:
+                async with get_redis().pipeline(transaction=False) as pipe:
+                    pipe.hset(self._key(url), mapping=new_entry)
+                    pipe.expire(self._key(url), settings.MARKETPLACE_HTTP_CACHE_TTL)
+                    await pipe.execute()
+            except Exception as e:
+                logger.warning(f"Cache HTTP {self.platform} non disponibile: {str(e)}")
+        return cached_body
+    
+    def lookup_sync(self, url: str) -> Optional[CacheEntry]:
+        """
+        Come lookup, per i client sincroni.
+        """
+        if not settings.MARKETPLACE_HTTP_CACHE_ENABLED:
+            return None
+        
+        try:
+            return get_sync_redis().hgetall(self._key(url)) or None
+        except Exception as e:
+            logger.warning(f"Cache HTTP {self.platform} non disponibile: {str(e)}")
+            return None
+    
+    def resolve_sync(
+        self,
+        url: str,
+        entry: Optional[CacheEntry],
+        status_code: int,
+        headers: Mapping[str, Any],
+        body: Optional[str],
+    ) -> Optional[str]:
+        """
+        Come resolve, per i client sincroni.
+        """
+        if not settings.MARKETPLACE_HTTP_CACHE_ENABLED:
+            return None
+        
+        cached_body, new_entry = self._resolve(entry, status_code, headers, body)
+        if new_entry is not None:
+            try:
+                pipe = get_sync_redis().pipeline(transaction=False)
+                pipe.hset(self._key(url), mapping=new_entry)
+                pipe.expire(self._key(url), settings.MARKETPLACE_HTTP_CACHE_TTL)
+                pipe.execute()
+            except Exception as e:
+                logger.warning(f"Cache HTTP {self.platform} non disponibile: {str(e)}")
+        return cached_body
+
+# Cache condivise per piattaforma
+shopify_http_cache = ConditionalGetCache("shopify")
+woocommerce_http_cache = ConditionalGetCache("woocommerce")
@@ -0,0 +1,28 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+C = TypeVar("C")
+
+async def prefetch_pages(
+    fetch_page: Callable[[Optional[C]], Awaitable[Tuple[List[T], Optional[C]]]],
+) -> AsyncIterator[T]:
+    """
+    Itera gli elementi di un'API paginata scaricando la pagina successiva mentre
+    il chiamante elabora quella corrente.
+    
+    fetch_page riceve il cursore della pagina da scaricare (None per la prima) e
+    restituisce gli elementi della pagina e il cursore della successiva (None se
+    è l'ultima). In memoria restano al più due pagine.
+    """
+    pending: Optional[asyncio.Future] = asyncio.ensure_future(fetch_page(None))
+    try:
+        while pending is not None:
+            items, cursor = await pending
+            pending = asyncio.ensure_future(fetch_page(cursor)) if cursor is not None else None
+            for item in items:
+                yield item
+    finally:
+        # Il consumatore si è interrotto prima della fine: la pagina in arrivo non serve più
+        if pending is not None and not pending.done():
+            pending.cancel()
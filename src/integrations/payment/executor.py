@@ -0,0 +1,58 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+from src.core.config import settings
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def get_payment_executor() -> ThreadPoolExecutor:
+    """
+    Restituisce il pool di thread condiviso dai client di pagamento del processo.
+    
+    Gli SDK di Stripe e PayPal sono sincroni: le chiamate vengono eseguite in
+    un pool dedicato di PAYMENT_THREAD_POOL_SIZE thread, così i pagamenti di
+    più negozi procedono in parallelo senza occupare il pool predefinito
+    dell'event loop.
+    """
+    global _executor
+    
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PAYMENT_THREAD_POOL_SIZE,
+                thread_name_prefix="payments",
+            )
+        return _executor
+
+async def run_in_payment_executor(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Esegue una chiamata sincrona di un client di pagamento nel pool dedicato.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_payment_executor(), functools.partial(func, *args, **kwargs))
+
+def shutdown_payment_executor() -> None:
+    """
+    Chiude il pool di thread attendendo le chiamate in corso.
+    """
+    global _executor
+    
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+def reset_payment_executor() -> None:
+    """
+    Scarta il pool senza chiuderlo (es. dopo un fork del processo, in cui i
+    thread del padre non esistono).
+    """
+    global _executor
+    
+    _executor = None
@@ -1,14 +1,97 @@
 import logging
-from typing import Any, Dict, List, Optional
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
 
 import paypalrestsdk
+import requests
 from fastapi import HTTPException, status
 
+from src.core.config import settings
+from src.integrations.pagination import prefetch_pages
+from src.integrations.payment.executor import run_in_payment_executor
+from src.integrations.payment.token_cache import paypal_token_cache
+
 logger = logging.getLogger(__name__)
 
+# Limiti della Transaction Search API: finestra massima di 31 giorni per
+# richiesta e al più 500 transazioni per pagina
+TRANSACTIONS_MAX_WINDOW = timedelta(days=31)
+TRANSACTIONS_MAX_PAGE_SIZE = 500
+
+# Prefissi dei codici evento delle transazioni (transaction_event_code)
+EVENT_CODE_PAYMENTS = "T00"
+EVENT_CODE_WITHDRAWALS = "T04"
+EVENT_CODE_REFUNDS = "T11"
+
+# Cursore della Transaction Search: (inizio della finestra, pagina)
+TransactionsCursor = Tuple[datetime, int]
+
+def _utc(value: datetime) -> datetime:
+    """
+    Porta una data in UTC; le date senza fuso orario sono già UTC.
+    """
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+class SessionApi(paypalrestsdk.Api):
+    """
+    Contesto API PayPal che invia le richieste con una sessione HTTP propria,
+    riutilizzando le connessioni tra una chiamata e l'altra, e che ottiene il
+    token OAuth dell'applicazione dalla cache condivisa tra i worker.
+    """
+    
+    def __init__(self, options: Dict[str, Any], session: requests.Session):
+        super().__init__(options)
+        self.session = session
+        self._access_token: Optional[str] = None
+        self._token_expires_at = 0.0
+    
+    def get_token_hash(
+        self,
+        authorization_code: Optional[str] = None,
+        refresh_token: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Dict[str, Any]:
+        # I token degli utenti (authorization_code, refresh_token) restano gestiti dall'SDK
+        if authorization_code is not None or refresh_token is not None:
+            return super().get_token_hash(authorization_code, refresh_token, headers)
+        
+        now = time.time()
+        if self.token_hash is not None and self._token_expires_at - now > settings.PAYPAL_TOKEN_REFRESH_MARGIN:
+            return self.token_hash
+        
+        # Un token_hash azzerato dall'SDK dopo un 401 indica un token rifiutato da PayPal
+        rejected_token = self._access_token if self.token_hash is None else None
+        
+        def fetch() -> Dict[str, Any]:
+            self.token_hash = None
+            return super(SessionApi, self).get_token_hash(headers=headers)
+        
+        token_hash, expires_at = paypal_token_cache.get(self.mode, self.client_id, fetch, rejected_token)
+        
+        # expires_in residuo, usato dall'SDK per verificare la scadenza del token
+        self.token_hash = {**token_hash, "expires_in": max(int(expires_at - now), 0)}
+        self.token_request_at = datetime.now()
+        self._access_token = token_hash.get("access_token")
+        self._token_expires_at = expires_at
+        return self.token_hash
+    
+    def http_call(self, url: str, method: str, **kwargs: Any) -> Dict[str, Any]:
+        kwargs.setdefault("timeout", settings.PAYMENT_HTTP_TIMEOUT)
+        response = self.session.request(method, url, proxies=self.proxies, **kwargs)
+        return self.handle_response(response, response.content.decode("utf-8"))
+
 class PayPalClient:
     """
     Client per l'integrazione con PayPal.
+    
+    Ogni client ha il proprio contesto paypalrestsdk.Api, con credenziali,
+    token OAuth e sessione HTTP, invece della configurazione globale di
+    paypalrestsdk: client di negozi diversi possono essere usati
+    contemporaneamente nello stesso processo, anche da thread diversi (vedi run).
     """
     
     def __init__(
@@ -29,12 +112,26 @@ class PayPalClient:
         self.client_secret = client_secret
         self.mode = mode
         
-        # Configura il client PayPal
-        paypalrestsdk.configure({
+        # Contesto API del client, con la propria sessione HTTP
+        self.session = requests.Session()
+        self.api = SessionApi({
             "mode": mode,
             "client_id": client_id,
             "client_secret": client_secret,
-        })
+        }, self.session)
+    
+    async def run(self, method: str, *args: Any, **kwargs: Any) -> Any:
+        """
+        Esegue un metodo sincrono del client nel pool di thread dei pagamenti,
+        senza bloccare l'event loop (es. await client.run("get_payment", payment_id)).
+        """
+        return await run_in_payment_executor(getattr(self, method), *args, **kwargs)
+    
+    def close(self) -> None:
+        """
+        Chiude la sessione HTTP del client.
+        """
+        self.session.close()
     
     def create_payment(self, payment_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -47,7 +144,7 @@ class PayPalClient:
             Dettagli del pagamento creato
         """
         try:
-            payment = paypalrestsdk.Payment(payment_data)
+            payment = paypalrestsdk.Payment(payment_data, api=self.api)
             
             if payment.create():
                 return payment.to_dict()
@@ -76,7 +173,7 @@ class PayPalClient:
             Dettagli del pagamento eseguito
         """
         try:
-            payment = paypalrestsdk.Payment.find(payment_id)
+            payment = paypalrestsdk.Payment.find(payment_id, api=self.api)
             
             if payment.execute({"payer_id": payer_id}):
                 return payment.to_dict()
@@ -104,7 +201,7 @@ class PayPalClient:
             Dettagli del pagamento
         """
         try:
-            payment = paypalrestsdk.Payment.find(payment_id)
+            payment = paypalrestsdk.Payment.find(payment_id, api=self.api)
             return payment.to_dict()
         except Exception as e:
             logger.error(f"Errore nel recupero del pagamento PayPal {payment_id}: {str(e)}")
@@ -124,7 +221,7 @@ class PayPalClient:
             Dettagli del piano di fatturazione creato
         """
         try:
-            billing_plan = paypalrestsdk.BillingPlan(billing_plan_data)
+            billing_plan = paypalrestsdk.BillingPlan(billing_plan_data, api=self.api)
             
             if billing_plan.create():
                 return billing_plan.to_dict()
@@ -152,7 +249,7 @@ class PayPalClient:
             True se l'attivazione è avvenuta con successo
         """
         try:
-            billing_plan = paypalrestsdk.BillingPlan.find(billing_plan_id)
+            billing_plan = paypalrestsdk.BillingPlan.find(billing_plan_id, api=self.api)
             
             update = [
                 {
@@ -190,7 +287,7 @@ class PayPalClient:
             Dettagli dell'accordo di fatturazione creato
         """
         try:
-            billing_agreement = paypalrestsdk.BillingAgreement(billing_agreement_data)
+            billing_agreement = paypalrestsdk.BillingAgreement(billing_agreement_data, api=self.api)
             
             if billing_agreement.create():
                 return billing_agreement.to_dict()
@@ -218,7 +315,7 @@ class PayPalClient:
             Dettagli dell'accordo di fatturazione eseguito
         """
         try:
-            billing_agreement = paypalrestsdk.BillingAgreement.execute(token)
+            billing_agreement = paypalrestsdk.BillingAgreement.execute(token, api=self.api)
             return billing_agreement.to_dict()
         except Exception as e:
             logger.error(f"Errore nell'esecuzione dell'accordo di fatturazione PayPal: {str(e)}")
@@ -238,7 +335,7 @@ class PayPalClient:
             Dettagli dell'accordo di fatturazione
         """
         try:
-            billing_agreement = paypalrestsdk.BillingAgreement.find(billing_agreement_id)
+            billing_agreement = paypalrestsdk.BillingAgreement.find(billing_agreement_id, api=self.api)
             return billing_agreement.to_dict()
         except Exception as e:
             logger.error(f"Errore nel recupero dell'accordo di fatturazione PayPal {billing_agreement_id}: {str(e)}")
@@ -259,7 +356,7 @@ class PayPalClient:
             True se la cancellazione è avvenuta con successo
         """
         try:
-            billing_agreement = paypalrestsdk.BillingAgreement.find(billing_agreement_id)
+            billing_agreement = paypalrestsdk.BillingAgreement.find(billing_agreement_id, api=self.api)
             
             if billing_agreement.cancel(cancel_note):
                 return True
@@ -275,3 +372,122 @@ class PayPalClient:
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Errore nella cancellazione dell'accordo di fatturazione PayPal: {str(e)}",
             )
+    
+    def _fetch_transactions(
+        self,
+        cursor: TransactionsCursor,
+        end: datetime,
+        page_size: int,
+        params: Dict[str, Any],
+    ) -> Tuple[List[Dict[str, Any]], Optional[TransactionsCursor]]:
+        """
+        Scarica una pagina della Transaction Search e restituisce le transazioni
+        e il cursore della pagina successiva, passando alla finestra di 31 giorni
+        seguente quando quella corrente è esaurita.
+        """
+        window_start, page = cursor
+        window_end = min(window_start + TRANSACTIONS_MAX_WINDOW, end)
+        query = {
+            **params,
+            "start_date": window_start.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "end_date": window_end.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "page_size": page_size,
+            "page": page,
+        }
+        response = self.api.get(f"v1/reporting/transactions?{urlencode(query)}")
+        
+        items = response.get("transaction_details", [])
+        if page < int(response.get("total_pages") or 1):
+            return items, (window_start, page + 1)
+        if window_end < end:
+            return items, (window_end, 1)
+        return items, None
+    
+    async def iter_transactions(
+        self,
+        created_gte: datetime,
+        created_lt: Optional[datetime] = None,
+        page_size: int = TRANSACTIONS_MAX_PAGE_SIZE,
+        **params: Any,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Itera le transazioni del conto nella finestra indicata con la
+        Transaction Search API, a finestre di 31 giorni e pagina per pagina,
+        scaricando la pagina successiva mentre viene elaborata quella corrente.
+        
+        Le transazioni compaiono nella ricerca con un ritardo fino a tre ore.
+        
+        Args:
+            created_gte: Inizio della finestra (incluso)
+            created_lt: Fine della finestra (predefinito adesso)
+            page_size: Numero di transazioni per pagina (massimo 500)
+            params: Altri filtri della ricerca (es. transaction_status="S")
+        
+        Returns:
+            Elementi transaction_details (transaction_info, payer_info, ...)
+        """
+        start = _utc(created_gte)
+        end = _utc(created_lt) if created_lt is not None else datetime.now(timezone.utc)
+        if start >= end:
+            return
+        
+        page_size = min(page_size, TRANSACTIONS_MAX_PAGE_SIZE)
+        params = {"fields": "transaction_info", **params}
+        
+        async def fetch_page(cursor: Optional[TransactionsCursor]) -> Tuple[List[Dict[str, Any]], Optional[TransactionsCursor]]:
+            try:
+                return await run_in_payment_executor(self._fetch_transactions, cursor or (start, 1), end, page_size, params)
+            except Exception as e:
+                logger.error(f"Errore nell'esportazione delle transazioni PayPal: {str(e)}")
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Errore nell'esportazione delle transazioni PayPal: {str(e)}",
+                )
+        
+        async for item in prefetch_pages(fetch_page):
+            yield item
+    
+    async def _iter_event_codes(
+        self,
+        prefix: str,
+        created_gte: datetime,
+        created_lt: Optional[datetime],
+        params: Dict[str, Any],
+    ) -> AsyncIterator[Dict[str, Any]]:
+        async for item in self.iter_transactions(created_gte, created_lt, **params):
+            event_code = item.get("transaction_info", {}).get("transaction_event_code") or ""
+            if event_code.startswith(prefix):
+                yield item
+    
+    def iter_charges(
+        self,
+        created_gte: datetime,
+        created_lt: Optional[datetime] = None,
+        **params: Any,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Itera i pagamenti ricevuti (codici evento T00xx) nella finestra indicata.
+        """
+        return self._iter_event_codes(EVENT_CODE_PAYMENTS, created_gte, created_lt, params)
+    
+    def iter_refunds(
+        self,
+        created_gte: datetime,
+        created_lt: Optional[datetime] = None,
+        **params: Any,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Itera i rimborsi (codici evento T11xx) nella finestra indicata.
+        """
+        return self._iter_event_codes(EVENT_CODE_REFUNDS, created_gte, created_lt, params)
+    
+    def iter_payouts(
+        self,
+        created_gte: datetime,
+        created_lt: Optional[datetime] = None,
+        **params: Any,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Itera i prelievi verso il conto bancario (codici evento T04xx) nella finestra indicata.
+        """
+        return self._iter_event_codes(EVENT_CODE_WITHDRAWALS, created_gte, created_lt, params)
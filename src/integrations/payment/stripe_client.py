@@ -1,14 +1,34 @@
 import logging
-from typing import Any, Dict, List, Optional
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 import stripe
 from fastapi import HTTPException, status
 
+from src.integrations.pagination import prefetch_pages
+from src.integrations.payment.executor import run_in_payment_executor
+
 logger = logging.getLogger(__name__)
 
+# Numero massimo di oggetti per pagina delle liste Stripe
+MAX_PAGE_SIZE = 100
+
+def _timestamp(value: datetime) -> int:
+    """
+    Converte una data in timestamp Unix; le date senza fuso orario sono UTC.
+    """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
 class StripeClient:
     """
     Client per l'integrazione con Stripe.
+    
+    La API Key viene passata a ogni richiesta invece di essere impostata
+    globalmente su stripe.api_key: client di negozi diversi possono essere
+    usati contemporaneamente nello stesso processo, anche da thread diversi
+    (vedi run).
     """
     
     def __init__(self, api_key: str):
@@ -19,7 +39,13 @@ class StripeClient:
             api_key: API Key di Stripe
         """
         self.api_key = api_key
-        stripe.api_key = api_key
+    
+    async def run(self, method: str, *args: Any, **kwargs: Any) -> Any:
+        """
+        Esegue un metodo sincrono del client nel pool di thread dei pagamenti,
+        senza bloccare l'event loop (es. await client.run("create_payment_intent", data)).
+        """
+        return await run_in_payment_executor(getattr(self, method), *args, **kwargs)
     
     def create_customer(self, customer_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -32,7 +58,7 @@ class StripeClient:
             Dettagli del cliente creato
         """
         try:
-            customer = stripe.Customer.create(**customer_data)
+            customer = stripe.Customer.create(api_key=self.api_key, **customer_data)
             return customer
         except stripe.error.StripeError as e:
             logger.error(f"Errore nella creazione del cliente Stripe: {str(e)}")
@@ -52,7 +78,7 @@ class StripeClient:
             Dettagli del cliente
         """
         try:
-            customer = stripe.Customer.retrieve(customer_id)
+            customer = stripe.Customer.retrieve(customer_id, api_key=self.api_key)
             return customer
         except stripe.error.StripeError as e:
             logger.error(f"Errore nel recupero del cliente Stripe {customer_id}: {str(e)}")
@@ -73,7 +99,7 @@ class StripeClient:
             Dettagli del cliente aggiornato
         """
         try:
-            customer = stripe.Customer.modify(customer_id, **customer_data)
+            customer = stripe.Customer.modify(customer_id, api_key=self.api_key, **customer_data)
             return customer
         except stripe.error.StripeError as e:
             logger.error(f"Errore nell'aggiornamento del cliente Stripe {customer_id}: {str(e)}")
@@ -93,7 +119,7 @@ class StripeClient:
             Conferma dell'eliminazione
         """
         try:
-            deleted = stripe.Customer.delete(customer_id)
+            deleted = stripe.Customer.delete(customer_id, api_key=self.api_key)
             return deleted
         except stripe.error.StripeError as e:
             logger.error(f"Errore nell'eliminazione del cliente Stripe {customer_id}: {str(e)}")
@@ -113,7 +139,7 @@ class StripeClient:
             Dettagli del metodo di pagamento creato
         """
         try:
-            payment_method = stripe.PaymentMethod.create(**payment_method_data)
+            payment_method = stripe.PaymentMethod.create(api_key=self.api_key, **payment_method_data)
             return payment_method
         except stripe.error.StripeError as e:
             logger.error(f"Errore nella creazione del metodo di pagamento Stripe: {str(e)}")
@@ -137,6 +163,7 @@ class StripeClient:
             payment_method = stripe.PaymentMethod.attach(
                 payment_method_id,
                 customer=customer_id,
+                api_key=self.api_key,
             )
             return payment_method
         except stripe.error.StripeError as e:
@@ -157,7 +184,7 @@ class StripeClient:
             Dettagli dell'intent di pagamento creato
         """
         try:
-            payment_intent = stripe.PaymentIntent.create(**payment_intent_data)
+            payment_intent = stripe.PaymentIntent.create(api_key=self.api_key, **payment_intent_data)
             return payment_intent
         except stripe.error.StripeError as e:
             logger.error(f"Errore nella creazione dell'intent di pagamento Stripe: {str(e)}")
@@ -179,9 +206,9 @@ class StripeClient:
         """
         try:
             if confirmation_data:
-                payment_intent = stripe.PaymentIntent.confirm(payment_intent_id, **confirmation_data)
+                payment_intent = stripe.PaymentIntent.confirm(payment_intent_id, api_key=self.api_key, **confirmation_data)
             else:
-                payment_intent = stripe.PaymentIntent.confirm(payment_intent_id)
+                payment_intent = stripe.PaymentIntent.confirm(payment_intent_id, api_key=self.api_key)
             
             return payment_intent
         except stripe.error.StripeError as e:
@@ -202,7 +229,7 @@ class StripeClient:
             Dettagli dell'abbonamento creato
         """
         try:
-            subscription = stripe.Subscription.create(**subscription_data)
+            subscription = stripe.Subscription.create(api_key=self.api_key, **subscription_data)
             return subscription
         except stripe.error.StripeError as e:
             logger.error(f"Errore nella creazione dell'abbonamento Stripe: {str(e)}")
@@ -222,7 +249,7 @@ class StripeClient:
             Dettagli dell'abbonamento
         """
         try:
-            subscription = stripe.Subscription.retrieve(subscription_id)
+            subscription = stripe.Subscription.retrieve(subscription_id, api_key=self.api_key)
             return subscription
         except stripe.error.StripeError as e:
             logger.error(f"Errore nel recupero dell'abbonamento Stripe {subscription_id}: {str(e)}")
@@ -243,7 +270,7 @@ class StripeClient:
             Dettagli dell'abbonamento aggiornato
         """
         try:
-            subscription = stripe.Subscription.modify(subscription_id, **subscription_data)
+            subscription = stripe.Subscription.modify(subscription_id, api_key=self.api_key, **subscription_data)
             return subscription
         except stripe.error.StripeError as e:
             logger.error(f"Errore nell'aggiornamento dell'abbonamento Stripe {subscription_id}: {str(e)}")
@@ -263,7 +290,7 @@ class StripeClient:
             Dettagli dell'abbonamento cancellato
         """
         try:
-            subscription = stripe.Subscription.delete(subscription_id)
+            subscription = stripe.Subscription.delete(subscription_id, api_key=self.api_key)
             return subscription
         except stripe.error.StripeError as e:
             logger.error(f"Errore nella cancellazione dell'abbonamento Stripe {subscription_id}: {str(e)}")
@@ -271,3 +298,128 @@ class StripeClient:
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Errore nella cancellazione dell'abbonamento Stripe: {str(e)}",
             )
+    
+    def _fetch_page(
+        self,
+        resource: Any,
+        params: Dict[str, Any],
+        starting_after: Optional[str],
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Scarica una pagina di una lista Stripe e restituisce gli oggetti e il
+        cursore (ID dell'ultimo oggetto) della pagina successiva.
+        """
+        if starting_after is not None:
+            params = {**params, "starting_after": starting_after}
+        page = resource.list(api_key=self.api_key, **params)
+        items = list(page.data)
+        return items, items[-1]["id"] if items and page.has_more else None
+    
+    async def _iter_list(
+        self,
+        resource: Any,
+        label: str,
+        created_gte: Optional[datetime],
+        created_lt: Optional[datetime],
+        page_size: int,
+        params: Dict[str, Any],
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Itera tutti gli oggetti di una lista Stripe nella finestra di creazione
+        indicata, pagina per pagina, senza bloccare l'event loop.
+        """
+        created: Dict[str, int] = {}
+        if created_gte is not None:
+            created["gte"] = _timestamp(created_gte)
+        if created_lt is not None:
+            created["lt"] = _timestamp(created_lt)
+        
+        params = {**params, "limit": min(page_size, MAX_PAGE_SIZE)}
+        if created:
+            params["created"] = created
+        
+        async def fetch_page(starting_after: Optional[str]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+            try:
+                return await run_in_payment_executor(self._fetch_page, resource, params, starting_after)
+            except stripe.error.StripeError as e:
+                logger.error(f"Errore nell'esportazione {label} Stripe: {str(e)}")
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Errore nell'esportazione {label} Stripe: {str(e)}",
+                )
+        
+        async for item in prefetch_pages(fetch_page):
+            yield item
+    
+    def iter_charges(
+        self,
+        created_gte: Optional[datetime] = None,
+        created_lt: Optional[datetime] = None,
+        page_size: int = MAX_PAGE_SIZE,
+        **params: Any,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Itera gli addebiti creati nella finestra indicata, dal più recente,
+        scaricando la pagina successiva mentre viene elaborata quella corrente.
+        
+        Args:
+            created_gte: Inizio della finestra (incluso, opzionale)
+            created_lt: Fine della finestra (esclusa, opzionale)
+            page_size: Numero di oggetti per pagina (massimo 100)
+            params: Altri filtri della lista (es. customer)
+        """
+        return self._iter_list(stripe.Charge, "degli addebiti", created_gte, created_lt, page_size, params)
+    
+    def iter_payment_intents(
+        self,
+        created_gte: Optional[datetime] = None,
+        created_lt: Optional[datetime] = None,
+        page_size: int = MAX_PAGE_SIZE,
+        **params: Any,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Itera i PaymentIntent creati nella finestra indicata, dal più recente.
+        
+        Args:
+            created_gte: Inizio della finestra (incluso, opzionale)
+            created_lt: Fine della finestra (esclusa, opzionale)
+            page_size: Numero di oggetti per pagina (massimo 100)
+            params: Altri filtri della lista (es. expand=["data.latest_charge"])
+        """
+        return self._iter_list(stripe.PaymentIntent, "dei PaymentIntent", created_gte, created_lt, page_size, params)
+    
+    def iter_refunds(
+        self,
+        created_gte: Optional[datetime] = None,
+        created_lt: Optional[datetime] = None,
+        page_size: int = MAX_PAGE_SIZE,
+        **params: Any,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Itera i rimborsi creati nella finestra indicata, dal più recente.
+        
+        Args:
+            created_gte: Inizio della finestra (incluso, opzionale)
+            created_lt: Fine della finestra (esclusa, opzionale)
+            page_size: Numero di oggetti per pagina (massimo 100)
+            params: Altri filtri della lista (es. payment_intent)
+        """
+        return self._iter_list(stripe.Refund, "dei rimborsi", created_gte, created_lt, page_size, params)
+    
+    def iter_payouts(
+        self,
+        created_gte: Optional[datetime] = None,
+        created_lt: Optional[datetime] = None,
+        page_size: int = MAX_PAGE_SIZE,
+        **params: Any,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Itera i versamenti verso il conto bancario creati nella finestra indicata, dal più recente.
+        
+        Args:
+            created_gte: Inizio della finestra (incluso, opzionale)
+            created_lt: Fine della finestra (esclusa, opzionale)
+            page_size: Numero di oggetti per pagina (massimo 100)
+            params: Altri filtri della lista (es. status)
+        """
+        return self._iter_list(stripe.Payout, "dei versamenti", created_gte, created_lt, page_size, params)
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from redis import RedisError
+
+from src.core.config import settings
+from src.core.metrics import metrics
+from src.core.redis import get_sync_redis
+
+logger = logging.getLogger(__name__)
+
+# Risposta dell'endpoint OAuth: access_token, token_type, expires_in, ...
+TokenHash = Dict[str, Any]
+
+class PayPalTokenCache:
+    """
+    Cache dei token OAuth PayPal condivisa tra i worker tramite Redis.
+    
+    I token sono indicizzati per modalità e client_id e scadono in Redis
+    insieme al token (expires_in della risposta). Un token viene rinnovato
+    quando mancano meno di PAYPAL_TOKEN_REFRESH_MARGIN secondi alla scadenza:
+    un solo worker alla volta lo richiede a PayPal, sotto un lock Redis,
+    mentre gli altri continuano a usare quello ancora valido o, se è già
+    scaduto, attendono il nuovo. Se Redis non è disponibile il token viene
+    richiesto direttamente a PayPal.
+    """
+    
+    def _key(self, mode: str, client_id: str) -> str:
+        return f"paypal:token:{mode}:{hashlib.sha256(client_id.encode()).hexdigest()}"
+    
+    def _read(self, key: str) -> Optional[Tuple[TokenHash, float]]:
+        raw = get_sync_redis().get(key)
+        if not raw:
+            return None
+        entry = json.loads(raw)
+        return entry["token_hash"], entry["expires_at"]
+    
+    def _fetch_and_store(self, key: str, fetch: Callable[[], TokenHash]) -> Tuple[TokenHash, float]:
+        token_hash = fetch()
+        expires_in = int(token_hash.get("expires_in") or 0)
+        expires_at = time.time() + expires_in
+        metrics.inc("paypal_token_requests_total", result="refresh")
+        
+        if expires_in > 0:
+            try:
+                get_sync_redis().set(key, json.dumps({"token_hash": token_hash, "expires_at": expires_at}), ex=expires_in)
+            except RedisError as e:
+                logger.warning(f"Cache dei token PayPal non disponibile: {str(e)}")
+        return token_hash, expires_at
+    
+    def _fetch_local(self, fetch: Callable[[], TokenHash]) -> Tuple[TokenHash, float]:
+        token_hash = fetch()
+        metrics.inc("paypal_token_requests_total", result="refresh")
+        return token_hash, time.time() + int(token_hash.get("expires_in") or 0)
+    
+    def get(
+        self,
+        mode: str,
+        client_id: str,
+        fetch: Callable[[], TokenHash],
+        rejected_token: Optional[str] = None,
+    ) -> Tuple[TokenHash, float]:
+        """
+        Restituisce il token del client e la sua scadenza (timestamp Unix),
+        richiedendolo a PayPal con fetch solo se necessario.
+        
+        Args:
+            mode: Modalità PayPal (sandbox o live)
+            client_id: Client ID di PayPal
+            fetch: Funzione che richiede un nuovo token a PayPal
+            rejected_token: Access token rifiutato da PayPal, da non riutilizzare
+        """
+        if not settings.PAYPAL_TOKEN_CACHE_ENABLED:
+            return self._fetch_local(fetch)
+        
+        key = self._key(mode, client_id)
+        try:
+            cached = self._read(key)
+            if cached is not None and cached[0].get("access_token") != rejected_token:
+                if cached[1] - time.time() > settings.PAYPAL_TOKEN_REFRESH_MARGIN:
+                    metrics.inc("paypal_token_requests_total", result="hit")
+                    return cached
+                
+                # In scadenza: lo rinnova un solo worker, gli altri usano ancora quello valido
+                lock = get_sync_redis().lock(f"{key}:lock", timeout=settings.PAYPAL_TOKEN_LOCK_TIMEOUT)
+                if not lock.acquire(blocking=False):
+                    metrics.inc("paypal_token_requests_total", result="hit")
+                    return cached
+                try:
+                    return self._fetch_and_store(key, fetch)
+                finally:
+                    self._release(lock)
+            
+            # Assente, scaduto o rifiutato: attende l'eventuale rinnovo in corso in un altro worker
+            lock = get_sync_redis().lock(
+                f"{key}:lock",
+                timeout=settings.PAYPAL_TOKEN_LOCK_TIMEOUT,
+                blocking_timeout=settings.PAYPAL_TOKEN_LOCK_WAIT,
+            )
+            acquired = lock.acquire()
+            try:
+                cached = self._read(key)
+                if (
+                    cached is not None
+                    and cached[0].get("access_token") != rejected_token
+                    and cached[1] > time.time()
+                ):
+                    metrics.inc("paypal_token_requests_total", result="hit")
+                    return cached
+                if not acquired:
+                    logger.warning("Rinnovo del token PayPal in un altro worker non completato in tempo")
+                return self._fetch_and_store(key, fetch)
+            finally:
+                if acquired:
+                    self._release(lock)
+        
+        except RedisError as e:
+            logger.warning(f"Cache dei token PayPal non disponibile: {str(e)}")
+            return self._fetch_local(fetch)
+    
+    @staticmethod
+    def _release(lock: Any) -> None:
+        try:
+            lock.release()
+        except RedisError as e:
+            # Il lock può essere scaduto durante una richiesta più lenta di PAYPAL_TOKEN_LOCK_TIMEOUT
+            logger.warning(f"Lock del token PayPal già rilasciato: {str(e)}")
+
+# Cache condivisa dal processo
+paypal_token_cache = PayPalTokenCache()
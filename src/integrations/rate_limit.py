@@ -0,0 +1,282 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Mapping, Optional, Tuple
+
+from src.core.config import settings
+from src.core.metrics import metrics
+from src.core.redis import get_redis, get_sync_redis
+
+logger = logging.getLogger(__name__)
+
+# Prenota un token dal bucket del negozio e restituisce i secondi di attesa prima
+# di poterlo usare (0 se disponibile subito). I token possono scendere sotto zero:
+# le richieste successive si mettono in coda dietro quelle già prenotate.
+_ACQUIRE_SCRIPT = """
+local now_parts = redis.call("TIME")
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local state = redis.call("HMGET", KEYS[1], "tokens", "updated_at", "capacity", "rate")
+local capacity = tonumber(state[3]) or tonumber(ARGV[1])
+local rate = tonumber(state[4]) or tonumber(ARGV[2])
+local tokens = tonumber(state[1]) or capacity
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - updated_at) * rate) - 1
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated_at", tostring(now), "capacity", tostring(capacity), "rate", tostring(rate))
+redis.call("EXPIRE", KEYS[1], tonumber(ARGV[3]))
+if tokens >= 0 then
+    return "0"
+end
+return tostring(-tokens / rate)
+"""
+
+# Allinea il bucket a quanto riportato dal marketplace: capacità e velocità,
+# token disponibili (mai più di quelli già stimati) ed eventuale pausa imposta
+_OBSERVE_SCRIPT = """
+local now_parts = redis.call("TIME")
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local state = redis.call("HMGET", KEYS[1], "tokens", "updated_at", "capacity", "rate")
+local capacity = tonumber(ARGV[1]) or tonumber(state[3]) or tonumber(ARGV[5])
+local rate = tonumber(ARGV[2]) or tonumber(state[4]) or tonumber(ARGV[6])
+local tokens = tonumber(state[1]) or capacity
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - updated_at) * rate)
+local available = tonumber(ARGV[3])
+if available then
+    tokens = math.min(tokens, available)
+end
+local pause = tonumber(ARGV[4])
+if pause then
+    tokens = math.min(tokens, -pause * rate)
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated_at", tostring(now), "capacity", tostring(capacity), "rate", tostring(rate))
+redis.call("EXPIRE", KEYS[1], tonumber(ARGV[7]))
+return "1"
+"""
+
+# Risposte che indicano un limite superato: la richiesta viene ritardata e ripetuta
+THROTTLED_STATUS_CODES = {429, 503}
+
+# (token disponibili, capacità, velocità, pausa in secondi); None dove non noto
+RateLimitState = Tuple[Optional[float], Optional[float], Optional[float], Optional[float]]
+
+def _header(headers: Optional[Mapping[str, Any]], name: str) -> Optional[str]:
+    if not headers:
+        return None
+    value = headers.get(name)
+    if value is None:
+        # Alcuni client espongono gli header come dict semplice, sensibile alle maiuscole
+        value = next((v for k, v in headers.items() if k.lower() == name.lower()), None)
+    return value
+
+def _retry_after(status_code: int, headers: Optional[Mapping[str, Any]]) -> Optional[float]:
+    if status_code not in THROTTLED_STATUS_CODES:
+        return None
+    try:
+        return max(0.0, float(_header(headers, "Retry-After")))
+    except (TypeError, ValueError):
+        return settings.MARKETPLACE_RATE_LIMIT_DEFAULT_PAUSE
+
+def parse_shopify_headers(status_code: int, headers: Optional[Mapping[str, Any]]) -> RateLimitState:
+    """
+    Legge il leaky bucket dell'API REST di Shopify dall'header
+    X-Shopify-Shop-Api-Call-Limit (es. "32/40"). Il bucket si svuota di
+    capacità / 20 richieste al secondo (2/s con 40, 20/s con 400 su Plus).
+    """
+    available = capacity = rate = None
+    call_limit = _header(headers, "X-Shopify-Shop-Api-Call-Limit")
+    if call_limit and "/" in call_limit:
+        try:
+            used, capacity = (float(part) for part in call_limit.split("/", 1))
+            available = capacity - used
+            rate = capacity / 20
+        except ValueError:
+            available = capacity = rate = None
+    return available, capacity, rate, _retry_after(status_code, headers)
+
+def parse_generic_headers(status_code: int, headers: Optional[Mapping[str, Any]]) -> RateLimitState:
+    """
+    Legge gli header RateLimit-* / X-RateLimit-* esposti da alcuni server
+    WooCommerce (plugin o proxy) e il Retry-After delle risposte 429/503.
+    """
+    available = capacity = None
+    for prefix in ("RateLimit", "X-RateLimit"):
+        try:
+            remaining = _header(headers, f"{prefix}-Remaining")
+            limit = _header(headers, f"{prefix}-Limit")
+            if remaining is not None:
+                available = float(remaining)
+            if limit is not None:
+                capacity = float(limit)
+        except ValueError:
+            continue
+    return available, capacity, None, _retry_after(status_code, headers)
+
+class RateLimitScheduler:
+    """
+    Scheduler token bucket per negozio, condiviso tra i worker tramite Redis.
+    
+    Ogni richiesta verso un marketplace prenota un token dal bucket del negozio
+    e, se il budget è esaurito, attende il proprio turno invece di fallire.
+    Capacità, velocità e token disponibili vengono corretti con gli header di
+    limite restituiti dal marketplace; un 429/503 sospende il bucket per il
+    Retry-After indicato. Se Redis non è disponibile le richieste procedono
+    senza limitazione.
+    """
+    
+    def __init__(
+        self,
+        platform: str,
+        capacity: float,
+        rate: float,
+        parse_headers: Callable[[int, Optional[Mapping[str, Any]]], RateLimitState],
+    ):
+        self.platform = platform
+        self.capacity = capacity
+        self.rate = rate
+        self.parse_headers = parse_headers
+    
+    def _key(self, shop: str) -> str:
+        return f"ratelimit:{self.platform}:{shop}"
+    
+    def _acquire_args(self, shop: str) -> Tuple[Any, ...]:
+        return (
+            _ACQUIRE_SCRIPT,
+            1,
+            self._key(shop),
+            self.capacity,
+            self.rate,
+            settings.MARKETPLACE_RATE_LIMIT_STATE_TTL,
+        )
+    
+    def _parse_response(
+        self,
+        shop: str,
+        status_code: int,
+        headers: Optional[Mapping[str, Any]],
+    ) -> Tuple[bool, Optional[float], Optional[Tuple[Any, ...]]]:
+        """
+        Interpreta una risposta e restituisce se è stata limitata, la pausa da
+        rispettare e gli argomenti dello script di aggiornamento del bucket
+        (None se la risposta non porta informazioni sul limite).
+        """
+        available, capacity, rate, pause = self.parse_headers(status_code, headers)
+        throttled = status_code in THROTTLED_STATUS_CODES
+        if throttled:
+            metrics.inc("marketplace_rate_limited_total", platform=self.platform, shop=shop)
+            logger.warning(f"Limite di richieste {self.platform} raggiunto per {shop}: nuovo tentativo tra {pause or 0:.1f}s")
+        
+        if available is None and capacity is None and rate is None and pause is None:
+            return throttled, pause, None
+        
+        return throttled, pause, (
+            _OBSERVE_SCRIPT,
+            1,
+            self._key(shop),
+            "" if capacity is None else capacity,
+            "" if rate is None else rate,
+            "" if available is None else available,
+            "" if pause is None else pause,
+            self.capacity,
+            self.rate,
+            settings.MARKETPLACE_RATE_LIMIT_STATE_TTL,
+        )
+    
+    def acquire_sync(self, shop: str) -> float:
+        """
+        Attende (bloccando il thread) il turno di una richiesta verso il negozio
+        e restituisce i secondi di attesa.
+        """
+        if not settings.MARKETPLACE_RATE_LIMIT_ENABLED:
+            return 0.0
+        
+        try:
+            wait = float(get_sync_redis().eval(*self._acquire_args(shop)))
+        except Exception as e:
+            logger.warning(f"Rate limiter Redis non disponibile per {self.platform} {shop}: {str(e)}")
+            return 0.0
+        
+        if wait > 0:
+            time.sleep(wait)
+        metrics.observe("marketplace_rate_limit_wait_seconds", wait, platform=self.platform, shop=shop)
+        return wait
+    
+    async def acquire(self, shop: str) -> float:
+        """
+        Come acquire_sync, ma attende senza bloccare l'event loop.
+        """
+        if not settings.MARKETPLACE_RATE_LIMIT_ENABLED:
+            return 0.0
+        
+        try:
+            wait = float(await get_redis().eval(*self._acquire_args(shop)))
+        except Exception as e:
+            logger.warning(f"Rate limiter Redis non disponibile per {self.platform} {shop}: {str(e)}")
+            return 0.0
+        
+        if wait > 0:
+            await asyncio.sleep(wait)
+        metrics.observe("marketplace_rate_limit_wait_seconds", wait, platform=self.platform, shop=shop)
+        return wait
+    
+    def observe_sync(self, shop: str, status_code: int, headers: Optional[Mapping[str, Any]]) -> bool:
+        """
+        Aggiorna il bucket del negozio con gli header di una risposta.
+        
+        Restituisce True se la risposta indica un limite superato e la richiesta
+        va ripetuta.
+        """
+        throttled, pause, observe_args = self._parse_response(shop, status_code, headers)
+        
+        if not settings.MARKETPLACE_RATE_LIMIT_ENABLED:
+            if throttled and pause:
+                time.sleep(pause)
+            return throttled
+        
+        if observe_args is None:
+            return throttled
+        
+        try:
+            get_sync_redis().eval(*observe_args)
+        except Exception as e:
+            logger.warning(f"Rate limiter Redis non disponibile per {self.platform} {shop}: {str(e)}")
+            if throttled and pause:
+                time.sleep(pause)
+        
+        return throttled
+    
+    async def observe(self, shop: str, status_code: int, headers: Optional[Mapping[str, Any]]) -> bool:
+        """
+        Come observe_sync, ma senza bloccare l'event loop.
+        """
+        throttled, pause, observe_args = self._parse_response(shop, status_code, headers)
+        
+        if not settings.MARKETPLACE_RATE_LIMIT_ENABLED:
+            if throttled and pause:
+                await asyncio.sleep(pause)
+            return throttled
+        
+        if observe_args is None:
+            return throttled
+        
+        try:
+            await get_redis().eval(*observe_args)
+        except Exception as e:
+            logger.warning(f"Rate limiter Redis non disponibile per {self.platform} {shop}: {str(e)}")
+            if throttled and pause:
+                await asyncio.sleep(pause)
+        
+        return throttled
+
+# Scheduler condivisi per piattaforma
+shopify_rate_limiter = RateLimitScheduler(
+    "shopify",
+    capacity=settings.SHOPIFY_RATE_LIMIT_BUCKET,
+    rate=settings.SHOPIFY_RATE_LIMIT_RATE,
+    parse_headers=parse_shopify_headers,
+)
+woocommerce_rate_limiter = RateLimitScheduler(
+    "woocommerce",
+    capacity=settings.WOOCOMMERCE_RATE_LIMIT_BUCKET,
+    rate=settings.WOOCOMMERCE_RATE_LIMIT_RATE,
+    parse_headers=parse_generic_headers,
+)
@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from src.core.config import settings
+from src.models.store import Store
+
+logger = logging.getLogger(__name__)
+
+# Chiave di una voce del registro: ID del negozio
+RegistryKey = str
+
+def _fingerprint(*values: Any) -> str:
+    """
+    Impronta della configurazione da cui è stato costruito un client: se cambia,
+    il client in cache non è più valido.
+    """
+    payload = json.dumps(values, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def _build_client(platform: str, credentials: Dict[str, Any]) -> Any:
+    """
+    Crea il client del marketplace a partire dalle credenziali.
+    """
+    if platform == "shopify":
+        from src.integrations.shopify.async_client import AsyncShopifyClient
+        
+        return AsyncShopifyClient(
+            api_key=credentials.get("api_key"),
+            api_secret=credentials.get("api_secret"),
+            shop_url=credentials.get("shop_url"),
+            access_token=credentials.get("access_token"),
+        )
+    
+    if platform == "woocommerce":
+        from src.integrations.woocommerce.client import WooCommerceClient
+        
+        return WooCommerceClient(
+            url=credentials.get("url"),
+            consumer_key=credentials.get("consumer_key"),
+            consumer_secret=credentials.get("consumer_secret"),
+        )
+    
+    raise ValueError(f"Piattaforma non supportata: {platform}")
+
+async def _close_client(client: Any) -> None:
+    close = getattr(client, "close", None)
+    if close is None or not asyncio.iscoroutinefunction(close):
+        return
+    
+    try:
+        await close()
+    except Exception as e:
+        logger.warning(f"Errore nella chiusura del client marketplace: {str(e)}")
+
+class MarketplaceClientRegistry:
+    """
+    Registro dei client marketplace del processo, per negozio.
+    
+    I client vengono creati alla prima richiesta e riutilizzati, insieme al
+    loro pool di connessioni, dalle sincronizzazioni successive. Ogni voce
+    ricorda l'impronta della configurazione da cui è stata costruita
+    (Store.settings): se il chiamante
+    passa una configurazione diversa, ad esempio modificata da un altro
+    processo, il client viene ricreato. Oltre MARKETPLACE_CLIENT_CACHE_SIZE
+    voci vengono scartate le meno usate di recente, e quelle inutilizzate da
+    MARKETPLACE_CLIENT_IDLE_TTL secondi vengono chiuse.
+    """
+    
+    def __init__(self, max_size: Optional[int] = None, idle_ttl: Optional[float] = None):
+        self.max_size = max_size or settings.MARKETPLACE_CLIENT_CACHE_SIZE
+        self.idle_ttl = idle_ttl or settings.MARKETPLACE_CLIENT_IDLE_TTL
+        # chiave -> (impronta, client, ultimo utilizzo), dalla meno recente
+        self._entries: OrderedDict = OrderedDict()
+    
+    async def get_for_store(self, store: Store) -> Any:
+        """
+        Restituisce il client del marketplace di un negozio, creandolo se necessario.
+        """
+        store_settings = store.settings or {}
+        return await self._get(
+            str(store.id),
+            store.platform,
+            store_settings.get("credentials", {}),
+            _fingerprint(store.platform, store_settings),
+        )
+    
+    async def _get(self, key: RegistryKey, platform: str, credentials: Dict[str, Any], fingerprint: str) -> Any:
+        now = time.monotonic()
+        stale = []
+        
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry[0] != fingerprint:
+            logger.info(f"Configurazione del negozio {key} modificata: client marketplace ricreato")
+            stale.append(entry[1])
+            entry = None
+        
+        if entry is None:
+            entry = (fingerprint, _build_client(platform, credentials), now)
+        self._entries[key] = (fingerprint, entry[1], now)
+        
+        # Rimuove le voci inattive e, oltre il limite, le meno usate di recente
+        while self._entries:
+            oldest_key, (_, client, last_used) = next(iter(self._entries.items()))
+            if oldest_key == key:
+                break
+            if len(self._entries) <= self.max_size and now - last_used <= self.idle_ttl:
+                break
+            del self._entries[oldest_key]
+            stale.append(client)
+        
+        for client in stale:
+            await _close_client(client)
+        
+        return entry[1]
+    
+    async def invalidate_store(self, store_id: UUID) -> None:
+        """
+        Scarta il client di un negozio, ad esempio dopo la modifica delle credenziali.
+        """
+        entry = self._entries.pop(str(store_id), None)
+        if entry is not None:
+            await _close_client(entry[1])
+    
+    async def shutdown(self) -> None:
+        """
+        Chiude tutti i client del registro.
+        """
+        entries = list(self._entries.values())
+        self._entries.clear()
+        for _, client, _ in entries:
+            await _close_client(client)
+    
+    def reset(self) -> None:
+        """
+        Scarta i client senza chiuderli (es. dopo un fork del processo).
+        """
+        self._entries.clear()
+
+# Registro condiviso dal processo
+marketplace_clients = MarketplaceClientRegistry()
@@ -0,0 +1,698 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import HTTPException, status
+
+from src.core.config import settings
+from src.core.metrics import metrics
+from src.integrations.http_cache import shopify_http_cache
+from src.integrations.pagination import prefetch_pages
+from src.integrations.rate_limit import shopify_rate_limiter
+from src.integrations.shopify.bulk import (
+    BULK_OPERATION_FINAL_STATUSES,
+    BULK_OPERATION_RUN_QUERY_MUTATION,
+    BULK_OPERATION_STATUS_QUERY,
+    ShopifyBulkOperationError,
+    parse_jsonl,
+)
+
+logger = logging.getLogger(__name__)
+
+# Dimensione massima di pagina consentita dall'API REST di Shopify
+MAX_PAGE_SIZE = 250
+
+# Numero massimo di inventory item per richiesta di giacenze (limite di inventory_levels)
+INVENTORY_ITEMS_BATCH_SIZE = 50
+
+UPDATE_VARIANT_PRICES_MUTATION = """
+mutation productVariantsBulkUpdate($productId: ID!, $variants: [ProductVariantsBulkInput!]!) {
+  productVariantsBulkUpdate(productId: $productId, variants: $variants) {
+    productVariants {
+      id
+      price
+      compareAtPrice
+    }
+    userErrors {
+      field
+      message
+    }
+  }
+}
+"""
+
+class ShopifyAPIError(Exception):
+    """
+    Risposta di errore dell'API Admin di Shopify.
+    """
+    
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+
+class AsyncShopifyClient:
+    """
+    Client asincrono per l'integrazione con Shopify.
+    
+    A differenza di ShopifyClient non usa la sessione globale di ShopifyResource:
+    credenziali e pool di connessioni (httpx, keep-alive) appartengono
+    all'istanza, così più negozi possono essere sincronizzati contemporaneamente
+    nello stesso event loop. Le chiamate REST passano dal rate limiter del negozio.
+    """
+    
+    def __init__(
+        self,
+        api_key: str,
+        api_secret: str,
+        shop_url: str,
+        access_token: Optional[str] = None,
+        api_version: Optional[str] = None,
+    ):
+        """
+        Inizializza il client Shopify.
+        
+        Args:
+            api_key: API Key di Shopify
+            api_secret: API Secret di Shopify
+            shop_url: URL del negozio Shopify (es. my-store.myshopify.com)
+            access_token: Token di accesso (opzionale)
+            api_version: Versione dell'API Admin (predefinita SHOPIFY_API_VERSION)
+        """
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.shop_url = shop_url
+        self.access_token = access_token
+        self.api_version = api_version or settings.SHOPIFY_API_VERSION
+        
+        shop = (shop_url or "").removeprefix("https://").removeprefix("http://").rstrip("/")
+        self.base_url = f"https://{shop}"
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._http_client_loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    def _build_http_client(self) -> httpx.AsyncClient:
+        """
+        Crea il client HTTP del negozio con il pool di connessioni configurato.
+        """
+        headers = {"Accept": "application/json"}
+        if self.access_token:
+            headers["X-Shopify-Access-Token"] = self.access_token
+        
+        limits = httpx.Limits(
+            max_connections=settings.SHOPIFY_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.SHOPIFY_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=settings.SHOPIFY_POOL_KEEPALIVE_EXPIRY,
+        )
+        return httpx.AsyncClient(
+            base_url=f"{self.base_url}/admin/api/{self.api_version}/",
+            headers=headers,
+            limits=limits,
+            timeout=httpx.Timeout(settings.SHOPIFY_TIMEOUT, connect=settings.SHOPIFY_CONNECT_TIMEOUT),
+        )
+    
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """
+        Restituisce il client HTTP dell'istanza, ricreandolo se l'event loop è cambiato.
+        """
+        loop = asyncio.get_running_loop()
+        if (
+            self._http_client is None
+            or self._http_client.is_closed
+            or self._http_client_loop is not loop
+        ):
+            self._http_client = self._build_http_client()
+            self._http_client_loop = loop
+        return self._http_client
+    
+    async def close(self) -> None:
+        """
+        Chiude il pool di connessioni del negozio.
+        """
+        client, loop = self._http_client, self._http_client_loop
+        self._http_client = None
+        self._http_client_loop = None
+        
+        if client is None or client.is_closed or loop is not asyncio.get_running_loop():
+            return
+        
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.warning(f"Errore nella chiusura del pool di connessioni Shopify {self.shop_url}: {str(e)}")
+    
+    async def __aenter__(self) -> "AsyncShopifyClient":
+        return self
+    
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+    
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        json: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> httpx.Response:
+        """
+        Esegue una richiesta REST attendendo il turno nel rate limiter del negozio;
+        le risposte 429/503 vengono ritardate e ripetute. path può essere relativo
+        alla versione dell'API o l'URL completo di una pagina successiva.
+        """
+        client = self._get_http_client()
+        for attempt in range(settings.MARKETPLACE_RATE_LIMIT_MAX_ATTEMPTS):
+            await shopify_rate_limiter.acquire(self.shop_url)
+            response = await client.request(method, path, params=params, json=json, headers=headers)
+            throttled = await shopify_rate_limiter.observe(self.shop_url, response.status_code, response.headers)
+            if not throttled:
+                break
+        
+        if response.is_error:
+            raise ShopifyAPIError(response.status_code, _error_message(response))
+        return response
+    
+    async def _get_json(self, path: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        response = await self._request("GET", path, params=params)
+        return response.json()
+    
+    async def _get_cached_json(self, path: str) -> Dict[str, Any]:
+        """
+        Legge una singola risorsa con una richiesta condizionale: se non è cambiata
+        dall'ultima lettura (304) viene restituito il body in cache.
+        """
+        url = f"{self.base_url}/admin/api/{self.api_version}/{path}"
+        entry = await shopify_http_cache.lookup(url)
+        response = await self._request("GET", path, headers=shopify_http_cache.conditional_headers(entry))
+        
+        cached_body = await shopify_http_cache.resolve(url, entry, response.status_code, response.headers, response.text)
+        if cached_body is not None:
+            return json.loads(cached_body)
+        return response.json()
+    
+    async def request_access_token(self, code: str) -> str:
+        """
+        Richiede un token di accesso utilizzando il codice di autorizzazione.
+        
+        Args:
+            code: Codice di autorizzazione
+        
+        Returns:
+            Token di accesso
+        """
+        try:
+            async with httpx.AsyncClient(timeout=settings.SHOPIFY_TIMEOUT) as client:
+                response = await client.post(
+                    f"{self.base_url}/admin/oauth/access_token",
+                    json={"client_id": self.api_key, "client_secret": self.api_secret, "code": code},
+                )
+            if response.is_error:
+                raise ShopifyAPIError(response.status_code, _error_message(response))
+        except Exception as e:
+            logger.error(f"Errore nella richiesta del token di accesso Shopify: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Errore nella richiesta del token di accesso Shopify: {str(e)}",
+            )
+        
+        self.access_token = response.json()["access_token"]
+        
+        # Il pool esistente non ha l'header del token: verrà ricreato alla prossima richiesta
+        await self.close()
+        
+        return self.access_token
+    
+    async def get_products(self, limit: int = 50, **params: Any) -> List[Dict[str, Any]]:
+        """
+        Recupera i prodotti dal negozio Shopify.
+        
+        Args:
+            limit: Numero massimo di prodotti da recuperare
+            params: Filtri di query aggiuntivi (es. updated_at_min, page_info)
+        
+        Returns:
+            Lista di prodotti
+        """
+        try:
+            return (await self._get_json("products.json", {"limit": limit, **params}))["products"]
+        except Exception as e:
+            logger.error(f"Errore nel recupero dei prodotti Shopify: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Errore nel recupero dei prodotti Shopify: {str(e)}",
+            )
+    
+    async def get_product(self, product_id: int) -> Dict[str, Any]:
+        """
+        Recupera un prodotto specifico dal negozio Shopify.
+        
+        Args:
+            product_id: ID del prodotto
+        
+        Returns:
+            Dettagli del prodotto
+        """
+        try:
+            return (await self._get_cached_json(f"products/{product_id}.json"))["product"]
+        except Exception as e:
+            logger.error(f"Errore nel recupero del prodotto Shopify {product_id}: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Errore nel recupero del prodotto Shopify: {str(e)}",
+            )
+    
+    async def create_product(self, product_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Crea un nuovo prodotto nel negozio Shopify.
+        
+        Args:
+            product_data: Dati del prodotto
+        
+        Returns:
+            Dettagli del prodotto creato
+        """
+        try:
+            response = await self._request("POST", "products.json", json={"product": product_data})
+            return response.json()["product"]
+        except Exception as e:
+            logger.error(f"Errore nella creazione del prodotto Shopify: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Errore nella creazione del prodotto Shopify: {str(e)}",
+            )
+    
+    async def update_product(self, product_id: int, product_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Aggiorna un prodotto nel negozio Shopify.
+        
+        Args:
+            product_id: ID del prodotto
+            product_data: Dati del prodotto da aggiornare
+        
+        Returns:
+            Dettagli del prodotto aggiornato
+        """
+        try:
+            response = await self._request(
+                "PUT",
+                f"products/{product_id}.json",
+                json={"product": {**product_data, "id": product_id}},
+            )
+            return response.json()["product"]
+        except Exception as e:
+            logger.error(f"Errore nell'aggiornamento del prodotto Shopify {product_id}: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Errore nell'aggiornamento del prodotto Shopify: {str(e)}",
+            )
+    
+    async def delete_product(self, product_id: int) -> bool:
+        """
+        Elimina un prodotto dal negozio Shopify.
+        
+        Args:
+            product_id: ID del prodotto
+        
+        Returns:
+            True se l'eliminazione è avvenuta con successo
+        """
+        try:
+            await self._request("DELETE", f"products/{product_id}.json")
+            return True
+        except Exception as e:
+            logger.error(f"Errore nell'eliminazione del prodotto Shopify {product_id}: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Errore nell'eliminazione del prodotto Shopify: {str(e)}",
+            )
+    
+    async def get_orders(self, limit: int = 50, **params: Any) -> List[Dict[str, Any]]:
+        """
+        Recupera gli ordini dal negozio Shopify.
+        
+        Args:
+            limit: Numero massimo di ordini da recuperare
+            params: Filtri di query aggiuntivi (es. status, predefinito "any"; updated_at_min, page_info)
+        
+        Returns:
+            Lista di ordini
+        """
+        try:
+            return (await self._get_json("orders.json", {"limit": limit, "status": "any", **params}))["orders"]
+        except Exception as e:
+            logger.error(f"Errore nel recupero degli ordini Shopify: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Errore nel recupero degli ordini Shopify: {str(e)}",
+            )
+    
+    async def get_order(self, order_id: int) -> Dict[str, Any]:
+        """
+        Recupera un ordine specifico dal negozio Shopify.
+        
+        Args:
+            order_id: ID dell'ordine
+        
+        Returns:
+            Dettagli dell'ordine
+        """
+        try:
+            return (await self._get_cached_json(f"orders/{order_id}.json"))["order"]
+        except Exception as e:
+            logger.error(f"Errore nel recupero dell'ordine Shopify {order_id}: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Errore nel recupero dell'ordine Shopify: {str(e)}",
+            )
+    
+    async def get_customers(self, limit: int = 50, **params: Any) -> List[Dict[str, Any]]:
+        """
+        Recupera i clienti dal negozio Shopify.
+        
+        Args:
+            limit: Numero massimo di clienti da recuperare
+            params: Filtri di query aggiuntivi (es. updated_at_min, page_info)
+        
+        Returns:
+            Lista di clienti
+        """
+        try:
+            return (await self._get_json("customers.json", {"limit": limit, **params}))["customers"]
+        except Exception as e:
+            logger.error(f"Errore nel recupero dei clienti Shopify: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Errore nel recupero dei clienti Shopify: {str(e)}",
+            )
+    
+    async def get_customer(self, customer_id: int) -> Dict[str, Any]:
+        """
+        Recupera un cliente specifico dal negozio Shopify.
+        
+        Args:
+            customer_id: ID del cliente
+        
+        Returns:
+            Dettagli del cliente
+        """
+        try:
+            return (await self._get_cached_json(f"customers/{customer_id}.json"))["customer"]
+        except Exception as e:
+            logger.error(f"Errore nel recupero del cliente Shopify {customer_id}: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Errore nel recupero del cliente Shopify: {str(e)}",
+            )
+    
+    async def get_inventory_quantities(self, inventory_item_ids: List[int]) -> List[Dict[str, Any]]:
+        """
+        Recupera SKU e disponibilità totale (somma su tutte le sedi) di un insieme
+        di inventory item, con due chiamate ogni INVENTORY_ITEMS_BATCH_SIZE item.
+        
+        Args:
+            inventory_item_ids: ID degli inventory item
+        
+        Returns:
+            Lista di dizionari con sku e quantity
+        """
+        try:
+            quantities = []
+            for start in range(0, len(inventory_item_ids), INVENTORY_ITEMS_BATCH_SIZE):
+                ids = ",".join(str(item_id) for item_id in inventory_item_ids[start:start + INVENTORY_ITEMS_BATCH_SIZE])
+                
+                totals: Dict[int, int] = {}
+                async for level in self._iter_resource(
+                    "inventory_levels.json",
+                    "inventory_levels",
+                    "delle giacenze",
+                    {"inventory_item_ids": ids, "limit": MAX_PAGE_SIZE},
+                ):
+                    item_id = level["inventory_item_id"]
+                    totals[item_id] = totals.get(item_id, 0) + (level.get("available") or 0)
+                
+                items = (await self._get_json("inventory_items.json", {"ids": ids}))["inventory_items"]
+                for item in items:
+                    if item.get("sku"):
+                        quantities.append({"sku": item["sku"], "quantity": totals.get(item["id"], 0)})
+            
+            return quantities
+        except Exception as e:
+            logger.error(f"Errore nel recupero delle giacenze Shopify: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Errore nel recupero delle giacenze Shopify: {str(e)}",
+            )
+    
+    async def execute_graphql(self, query: str, variables: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Esegue una query o una mutation sull'API GraphQL Admin di Shopify.
+        
+        Il limite dell'API GraphQL è a costo (extensions.cost) e non passa dal
+        rate limiter REST: il chiamante gestisce il budget e gli errori THROTTLED.
+        
+        Args:
+            query: Documento GraphQL
+            variables: Variabili della query (opzionale)
+        
+        Returns:
+            Risposta completa (data, errors, extensions con il costo della query)
+        """
+        response = await self._get_http_client().post("graphql.json", json={"query": query, "variables": variables})
+        if response.is_error:
+            raise ShopifyAPIError(response.status_code, _error_message(response))
+        return response.json()
+    
+    async def update_variant_prices(self, product_id: int, variants: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Aggiorna i prezzi di più varianti di un prodotto con una sola mutation
+        productVariantsBulkUpdate.
+        
+        Args:
+            product_id: ID del prodotto
+            variants: Varianti da aggiornare, con id, price e (opzionale) compareAtPrice
+        
+        Returns:
+            Risposta completa della mutation; gli userErrors indicano nel campo
+            field la posizione della variante in errore
+        """
+        try:
+            return await self.execute_graphql(
+                UPDATE_VARIANT_PRICES_MUTATION,
+                {
+                    "productId": f"gid://shopify/Product/{product_id}",
+                    "variants": [
+                        {**variant, "id": f"gid://shopify/ProductVariant/{variant['id']}"}
+                        for variant in variants
+                    ],
+                },
+            )
+        except Exception as e:
+            logger.error(f"Errore nell'aggiornamento dei prezzi delle varianti Shopify del prodotto {product_id}: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Errore nell'aggiornamento dei prezzi delle varianti Shopify: {str(e)}",
+            )
+    
+    async def start_bulk_query(self, query: str) -> str:
+        """
+        Avvia una bulk operation di esportazione e ne restituisce l'ID.
+        
+        Shopify consente una sola bulk query alla volta per negozio: se ne è già
+        in corso un'altra viene sollevato ShopifyBulkOperationError.
+        
+        Args:
+            query: Query GraphQL senza paginazione (le connessioni vengono esportate per intero)
+        
+        Returns:
+            ID globale della bulk operation
+        """
+        response = await self.execute_graphql(BULK_OPERATION_RUN_QUERY_MUTATION, {"query": query})
+        result = (response.get("data") or {}).get("bulkOperationRunQuery") or {}
+        errors = response.get("errors") or result.get("userErrors") or []
+        if errors or not result.get("bulkOperation"):
+            message = "; ".join(error.get("message", "") for error in errors) or "risposta senza bulk operation"
+            raise ShopifyBulkOperationError(f"Bulk operation Shopify non avviata per {self.shop_url}: {message}")
+        
+        return result["bulkOperation"]["id"]
+    
+    async def wait_for_bulk_operation(self, operation_id: str) -> Dict[str, Any]:
+        """
+        Interroga lo stato di una bulk operation ogni SHOPIFY_BULK_POLL_INTERVAL
+        secondi fino al completamento.
+        
+        Args:
+            operation_id: ID globale della bulk operation
+        
+        Returns:
+            Bulk operation completata (status, objectCount, url del file JSONL)
+        """
+        started_at = time.monotonic()
+        while True:
+            response = await self.execute_graphql(BULK_OPERATION_STATUS_QUERY, {"id": operation_id})
+            operation = (response.get("data") or {}).get("node") or {}
+            if operation.get("status") in BULK_OPERATION_FINAL_STATUSES:
+                break
+            if time.monotonic() - started_at > settings.SHOPIFY_BULK_TIMEOUT:
+                raise ShopifyBulkOperationError(
+                    f"Bulk operation Shopify {operation_id} non completata entro {settings.SHOPIFY_BULK_TIMEOUT}s"
+                )
+            await asyncio.sleep(settings.SHOPIFY_BULK_POLL_INTERVAL)
+        
+        duration = time.monotonic() - started_at
+        metrics.observe("shopify_bulk_operation_seconds", duration, status=operation["status"])
+        if operation["status"] != "COMPLETED":
+            raise ShopifyBulkOperationError(
+                f"Bulk operation Shopify {operation_id} terminata con stato {operation['status']}"
+                f" ({operation.get('errorCode') or 'nessun codice di errore'})"
+            )
+        
+        logger.info(
+            f"Bulk operation Shopify {operation_id} di {self.shop_url} completata in {duration:.1f}s: "
+            f"{operation.get('objectCount')} oggetti"
+        )
+        return operation
+    
+    async def iter_bulk_results(self, url: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Scarica in streaming il file JSONL di una bulk operation e ne restituisce
+        le righe una alla volta, in memoria costante.
+        
+        Args:
+            url: URL firmato del file dei risultati
+        
+        Returns:
+            Iteratore asincrono sulle righe (i nodi annidati hanno __parentId)
+        """
+        # L'URL è firmato e su un altro host: il token del negozio non va inviato
+        timeout = httpx.Timeout(settings.SHOPIFY_TIMEOUT, connect=settings.SHOPIFY_CONNECT_TIMEOUT)
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            async with client.stream("GET", url) as response:
+                if response.is_error:
+                    raise ShopifyBulkOperationError(
+                        f"Download dei risultati della bulk operation Shopify fallito: {response.status_code}"
+                    )
+                async for record in parse_jsonl(response.aiter_lines()):
+                    yield record
+    
+    async def iter_bulk_operation(self, operation_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Attende il completamento di una bulk operation già avviata e ne restituisce
+        i risultati in streaming.
+        """
+        operation = await self.wait_for_bulk_operation(operation_id)
+        # Senza oggetti esportati Shopify non produce alcun file
+        if not operation.get("url"):
+            return
+        
+        async for record in self.iter_bulk_results(operation["url"]):
+            yield record
+    
+    async def bulk_export(self, query: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Esporta con una bulk operation GraphQL il risultato di una query
+        sull'intero catalogo, senza paginazione REST né consumo del rate limit:
+        avvia l'operazione, ne attende il completamento e restituisce le righe
+        del file JSONL in streaming.
+        
+        Args:
+            query: Query GraphQL senza paginazione
+        
+        Returns:
+            Iteratore asincrono sulle righe (raggruppabili con group_bulk_records)
+        """
+        operation_id = await self.start_bulk_query(query)
+        async for record in self.iter_bulk_operation(operation_id):
+            yield record
+    
+    async def _iter_resource(
+        self,
+        path: str,
+        key: str,
+        label: str,
+        params: Dict[str, Any],
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Itera tutti gli elementi di una risorsa con la paginazione a cursore di
+        Shopify: l'URL della pagina successiva (con page_info) è nell'header Link.
+        """
+        async def fetch_page(next_url: Optional[str]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+            try:
+                if next_url is None:
+                    response = await self._request("GET", path, params=params)
+                else:
+                    response = await self._request("GET", next_url)
+            except Exception as e:
+                logger.error(f"Errore nel recupero {label} Shopify: {str(e)}")
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Errore nel recupero {label} Shopify: {str(e)}",
+                )
+            
+            return response.json()[key], response.links.get("next", {}).get("url")
+        
+        async for item in prefetch_pages(fetch_page):
+            yield item
+    
+    async def iter_products(self, page_size: int = MAX_PAGE_SIZE, **params: Any) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Itera tutti i prodotti del negozio Shopify, scaricando la pagina successiva
+        mentre viene elaborata quella corrente.
+        
+        Args:
+            page_size: Numero di prodotti per pagina (massimo 250)
+            params: Filtri di query aggiuntivi (es. updated_at_min)
+        
+        Returns:
+            Iteratore asincrono sui prodotti
+        """
+        params = {"limit": page_size, **params}
+        async for product in self._iter_resource("products.json", "products", "dei prodotti", params):
+            yield product
+    
+    async def iter_orders(
+        self,
+        page_size: int = MAX_PAGE_SIZE,
+        status: str = "any",
+        **params: Any,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Itera tutti gli ordini del negozio Shopify, scaricando la pagina successiva
+        mentre viene elaborata quella corrente.
+        
+        Args:
+            page_size: Numero di ordini per pagina (massimo 250)
+            status: Stato degli ordini (any, open, closed, cancelled)
+            params: Filtri di query aggiuntivi (es. updated_at_min)
+        
+        Returns:
+            Iteratore asincrono sugli ordini
+        """
+        params = {"limit": page_size, "status": status, **params}
+        async for order in self._iter_resource("orders.json", "orders", "degli ordini", params):
+            yield order
+    
+    async def iter_customers(self, page_size: int = MAX_PAGE_SIZE, **params: Any) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Itera tutti i clienti del negozio Shopify, scaricando la pagina successiva
+        mentre viene elaborata quella corrente.
+        
+        Args:
+            page_size: Numero di clienti per pagina (massimo 250)
+            params: Filtri di query aggiuntivi (es. updated_at_min)
+        
+        Returns:
+            Iteratore asincrono sui clienti
+        """
+        params = {"limit": page_size, **params}
+        async for customer in self._iter_resource("customers.json", "customers", "dei clienti", params):
+            yield customer
+
+def _error_message(response: httpx.Response) -> str:
+    """
+    Estrae il messaggio di errore da una risposta Shopify ({"errors": ...}).
+    """
+    try:
+        return str(response.json().get("errors", response.text))
+    except ValueError:
+        return response.text
@@ -0,0 +1,162 @@
+import json
+import logging
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Stati finali di una bulk operation
+BULK_OPERATION_FINAL_STATUSES = {"COMPLETED", "CANCELED", "EXPIRED", "FAILED"}
+
+BULK_OPERATION_RUN_QUERY_MUTATION = """
+mutation bulkOperationRunQuery($query: String!) {
+  bulkOperationRunQuery(query: $query) {
+    bulkOperation {
+      id
+      status
+    }
+    userErrors {
+      field
+      message
+    }
+  }
+}
+"""
+
+BULK_OPERATION_STATUS_QUERY = """
+query bulkOperation($id: ID!) {
+  node(id: $id) {
+    ... on BulkOperation {
+      id
+      status
+      errorCode
+      objectCount
+      url
+    }
+  }
+}
+"""
+
+# Solo SKU e disponibilità delle varianti, per la sincronizzazione dell'inventario
+BULK_VARIANT_QUANTITIES_QUERY = """
+{
+  productVariants {
+    edges {
+      node {
+        id
+        sku
+        inventoryQuantity
+      }
+    }
+  }
+}
+"""
+
+# Prodotti con le loro varianti, per l'importazione del catalogo; nel file JSONL
+# ogni variante è una riga separata con __parentId uguale all'id del prodotto
+BULK_PRODUCTS_QUERY = """
+{
+  products {
+    edges {
+      node {
+        id
+        title
+        descriptionHtml
+        tags
+        status
+        images(first: 10) {
+          edges {
+            node {
+              url
+            }
+          }
+        }
+        variants {
+          edges {
+            node {
+              id
+              title
+              sku
+              barcode
+              price
+              compareAtPrice
+              inventoryQuantity
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+class ShopifyBulkOperationError(Exception):
+    """
+    Bulk operation non avviata o terminata senza risultati.
+    """
+
+def shopify_id(gid: Optional[str]) -> Optional[int]:
+    """
+    Ricava l'ID numerico da un ID globale GraphQL (es. gid://shopify/Product/123).
+    """
+    if not gid:
+        return None
+    try:
+        return int(gid.rsplit("/", 1)[-1])
+    except ValueError:
+        return None
+
+def _child_collection(gid: Optional[str]) -> str:
+    """
+    Nome della collezione in cui raggruppare una riga figlia, dal tipo del suo ID
+    globale (ProductVariant -> variants, ProductImage/MediaImage -> images).
+    """
+    parts = (gid or "").rsplit("/", 2)
+    resource = parts[-2] if len(parts) == 3 else ""
+    if resource == "ProductVariant":
+        return "variants"
+    if resource in ("ProductImage", "MediaImage", "Image"):
+        return "images"
+    return "children"
+
+async def parse_jsonl(lines: AsyncIterable[str]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Interpreta un file JSONL riga per riga; le righe vuote o non valide vengono
+    scartate. In memoria resta una riga alla volta.
+    """
+    async for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            logger.warning(f"Riga JSONL non valida nel risultato della bulk operation: {line[:200]}")
+
+async def group_bulk_records(records: AsyncIterable[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Ricompone gli oggetti annidati di un risultato JSONL.
+    
+    Shopify scrive ogni nodo delle connessioni annidate come una riga a sé con
+    __parentId, subito dopo la riga del padre: ogni oggetto di primo livello
+    viene restituito con i figli raccolti in liste (variants, images...) non
+    appena inizia il successivo, così in memoria resta un solo oggetto.
+    Le immagini, richieste senza id, sono riconosciute dalla chiave url.
+    """
+    current: Optional[Dict[str, Any]] = None
+    async for record in records:
+        parent_id = record.pop("__parentId", None)
+        if parent_id is None:
+            if current is not None:
+                yield current
+            current = record
+            continue
+        
+        if current is None or current.get("id") != parent_id:
+            logger.warning(f"Riga figlia senza padre nel risultato della bulk operation: {parent_id}")
+            continue
+        
+        collection = "images" if "id" not in record and "url" in record else _child_collection(record.get("id"))
+        current.setdefault(collection, []).append(record)
+    
+    if current is not None:
+        yield current
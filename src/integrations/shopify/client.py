@@ -1,11 +1,17 @@
 import logging
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, TypeVar
 
 import shopify
 from fastapi import HTTPException, status
+from pyactiveresource.connection import ConnectionError as ActiveResourceConnectionError
+
+from src.core.config import settings
+from src.integrations.rate_limit import shopify_rate_limiter
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 class ShopifyClient:
     """
     Client per l'integrazione con Shopify.
@@ -39,6 +45,32 @@ class ShopifyClient:
             self.session = shopify.Session(shop_url, "2023-07", access_token)
             shopify.ShopifyResource.activate_session(self.session)
     
+    def _call(self, function: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Esegue una chiamata all'API REST di Shopify attendendo il turno nel rate
+        limiter del negozio; le risposte 429/503 vengono ritardate e ripetute.
+        """
+        for attempt in range(settings.MARKETPLACE_RATE_LIMIT_MAX_ATTEMPTS):
+            shopify_rate_limiter.acquire_sync(self.shop_url)
+            try:
+                result = function(*args, **kwargs)
+            except ActiveResourceConnectionError as e:
+                response = e.response
+                throttled = shopify_rate_limiter.observe_sync(
+                    self.shop_url,
+                    getattr(response, "code", 0),
+                    getattr(response, "headers", None),
+                )
+                if not throttled or attempt == settings.MARKETPLACE_RATE_LIMIT_MAX_ATTEMPTS - 1:
+                    raise
+                continue
+            
+            # L'ultima risposta della connessione (legata al thread) riporta l'header del bucket
+            response = getattr(shopify.ShopifyResource.connection, "response", None)
+            if response is not None:
+                shopify_rate_limiter.observe_sync(self.shop_url, getattr(response, "code", 200), getattr(response, "headers", None))
+            return result
+    
     def create_auth_url(self, redirect_uri: str, scopes: List[str]) -> str:
         """
         Crea un URL di autorizzazione OAuth.
@@ -85,7 +117,7 @@ class ShopifyClient:
             Lista di prodotti
         """
         try:
-            products = shopify.Product.find(limit=limit, page=page)
+            products = self._call(shopify.Product.find, limit=limit, page=page)
             return [product.to_dict() for product in products]
         except Exception as e:
             logger.error(f"Errore nel recupero dei prodotti Shopify: {str(e)}")
@@ -105,7 +137,7 @@ class ShopifyClient:
             Dettagli del prodotto
         """
         try:
-            product = shopify.Product.find(product_id)
+            product = self._call(shopify.Product.find, product_id)
             return product.to_dict()
         except Exception as e:
             logger.error(f"Errore nel recupero del prodotto Shopify {product_id}: {str(e)}")
@@ -132,7 +164,7 @@ class ShopifyClient:
                 setattr(product, key, value)
             
             # Salva il prodotto
-            product.save()
+            self._call(product.save)
             
             return product.to_dict()
         except Exception as e:
@@ -154,14 +186,14 @@ class ShopifyClient:
             Dettagli del prodotto aggiornato
         """
         try:
-            product = shopify.Product.find(product_id)
+            product = self._call(shopify.Product.find, product_id)
             
             # Aggiorna i dati del prodotto
             for key, value in product_data.items():
                 setattr(product, key, value)
             
             # Salva le modifiche
-            product.save()
+            self._call(product.save)
             
             return product.to_dict()
         except Exception as e:
@@ -182,8 +214,8 @@ class ShopifyClient:
             True se l'eliminazione è avvenuta con successo
         """
         try:
-            product = shopify.Product.find(product_id)
-            return product.destroy()
+            product = self._call(shopify.Product.find, product_id)
+            return self._call(product.destroy)
         except Exception as e:
             logger.error(f"Errore nell'eliminazione del prodotto Shopify {product_id}: {str(e)}")
             raise HTTPException(
@@ -204,7 +236,7 @@ class ShopifyClient:
             Lista di ordini
         """
         try:
-            orders = shopify.Order.find(limit=limit, page=page, status=status)
+            orders = self._call(shopify.Order.find, limit=limit, page=page, status=status)
             return [order.to_dict() for order in orders]
         except Exception as e:
             logger.error(f"Errore nel recupero degli ordini Shopify: {str(e)}")
@@ -224,7 +256,7 @@ class ShopifyClient:
             Dettagli dell'ordine
         """
         try:
-            order = shopify.Order.find(order_id)
+            order = self._call(shopify.Order.find, order_id)
             return order.to_dict()
         except Exception as e:
             logger.error(f"Errore nel recupero dell'ordine Shopify {order_id}: {str(e)}")
@@ -245,7 +277,7 @@ class ShopifyClient:
             Lista di clienti
         """
         try:
-            customers = shopify.Customer.find(limit=limit, page=page)
+            customers = self._call(shopify.Customer.find, limit=limit, page=page)
             return [customer.to_dict() for customer in customers]
         except Exception as e:
             logger.error(f"Errore nel recupero dei clienti Shopify: {str(e)}")
@@ -265,7 +297,7 @@ class ShopifyClient:
             Dettagli del cliente
         """
         try:
-            customer = shopify.Customer.find(customer_id)
+            customer = self._call(shopify.Customer.find, customer_id)
             return customer.to_dict()
         except Exception as e:
             logger.error(f"Errore nel recupero del cliente Shopify {customer_id}: {str(e)}")
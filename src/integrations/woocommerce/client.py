@@ -1,11 +1,25 @@
+import asyncio
+import json
 import logging
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
 
+import requests
 from woocommerce import API
 from fastapi import HTTPException, status
 
+from src.core.config import settings
+from src.integrations.http_cache import woocommerce_http_cache
+from src.integrations.pagination import prefetch_pages
+from src.integrations.rate_limit import woocommerce_rate_limiter
+
 logger = logging.getLogger(__name__)
 
+# Dimensione massima di pagina consentita dall'API REST di WooCommerce
+MAX_PAGE_SIZE = 100
+
+# Numero massimo di elementi per richiesta agli endpoint batch
+BATCH_MAX_SIZE = 100
+
 class WooCommerceClient:
     """
     Client per l'integrazione con WooCommerce.
@@ -40,6 +54,63 @@ class WooCommerceClient:
             version=version,
             timeout=30,
         )
+        
+        # Sessione con pool di connessioni per le letture condizionali
+        self._session = requests.Session()
+    
+    def _throttled(self, send: Callable[[], Any]) -> Any:
+        """
+        Esegue una richiesta attendendo il turno nel rate limiter del negozio;
+        le risposte 429/503 vengono ritardate e ripetute.
+        """
+        for attempt in range(settings.MARKETPLACE_RATE_LIMIT_MAX_ATTEMPTS):
+            woocommerce_rate_limiter.acquire_sync(self.url)
+            response = send()
+            throttled = woocommerce_rate_limiter.observe_sync(self.url, response.status_code, response.headers)
+            if not throttled:
+                break
+        return response
+    
+    def _request(self, method: str, endpoint: str, *args: Any, **kwargs: Any) -> Any:
+        """
+        Esegue una richiesta all'API WooCommerce tramite il rate limiter del negozio.
+        """
+        return self._throttled(lambda: getattr(self.wcapi, method)(endpoint, *args, **kwargs))
+    
+    def _get_cached(self, endpoint: str) -> Dict[str, Any]:
+        """
+        Legge una singola risorsa con una richiesta condizionale: se non è cambiata
+        dall'ultima lettura (304) viene restituito il body in cache.
+        
+        La libreria woocommerce non consente header aggiuntivi: con HTTPS la
+        richiesta viene inviata con la stessa autenticazione Basic tramite una
+        sessione requests propria del client; senza HTTPS (firma OAuth 1.0a)
+        la lettura avviene senza cache.
+        """
+        if not self.wcapi.is_ssl or self.wcapi.query_string_auth:
+            response = self._request("get", endpoint)
+            if response.status_code != 200:
+                raise Exception(response.text)
+            return response.json()
+        
+        url = f"{self.url.rstrip('/')}/wp-json/{self.version}/{endpoint}"
+        entry = woocommerce_http_cache.lookup_sync(url)
+        headers = {"Accept": "application/json", **woocommerce_http_cache.conditional_headers(entry)}
+        response = self._throttled(lambda: self._session.get(
+            url,
+            headers=headers,
+            auth=(self.consumer_key, self.consumer_secret),
+            timeout=self.wcapi.timeout,
+            verify=self.wcapi.verify_ssl,
+        ))
+        
+        if response.status_code not in (200, 304):
+            raise Exception(response.text)
+        
+        cached_body = woocommerce_http_cache.resolve_sync(url, entry, response.status_code, response.headers, response.text)
+        if cached_body is not None:
+            return json.loads(cached_body)
+        return response.json()
     
     def get_products(self, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """
@@ -52,7 +123,7 @@ class WooCommerceClient:
             Lista di prodotti
         """
         try:
-            response = self.wcapi.get("products", params=params)
+            response = self._request("get", "products", params=params)
             
             if response.status_code != 200:
                 logger.error(f"Errore nel recupero dei prodotti WooCommerce: {response.text}")
@@ -80,16 +151,7 @@ class WooCommerceClient:
             Dettagli del prodotto
         """
         try:
-            response = self.wcapi.get(f"products/{product_id}")
-            
-            if response.status_code != 200:
-                logger.error(f"Errore nel recupero del prodotto WooCommerce {product_id}: {response.text}")
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"Errore nel recupero del prodotto WooCommerce: {response.text}",
-                )
-            
-            return response.json()
+            return self._get_cached(f"products/{product_id}")
         except Exception as e:
             logger.error(f"Errore nel recupero del prodotto WooCommerce {product_id}: {str(e)}")
             raise HTTPException(
@@ -108,7 +170,7 @@ class WooCommerceClient:
             Dettagli del prodotto creato
         """
         try:
-            response = self.wcapi.post("products", product_data)
+            response = self._request("post", "products", product_data)
             
             if response.status_code != 201:
                 logger.error(f"Errore nella creazione del prodotto WooCommerce: {response.text}")
@@ -137,7 +199,7 @@ class WooCommerceClient:
             Dettagli del prodotto aggiornato
         """
         try:
-            response = self.wcapi.put(f"products/{product_id}", product_data)
+            response = self._request("put", f"products/{product_id}", product_data)
             
             if response.status_code != 200:
                 logger.error(f"Errore nell'aggiornamento del prodotto WooCommerce {product_id}: {response.text}")
@@ -166,7 +228,7 @@ class WooCommerceClient:
             Risposta dell'eliminazione
         """
         try:
-            response = self.wcapi.delete(f"products/{product_id}", params={"force": force})
+            response = self._request("delete", f"products/{product_id}", params={"force": force})
             
             if response.status_code not in [200, 202]:
                 logger.error(f"Errore nell'eliminazione del prodotto WooCommerce {product_id}: {response.text}")
@@ -194,7 +256,7 @@ class WooCommerceClient:
             Lista di ordini
         """
         try:
-            response = self.wcapi.get("orders", params=params)
+            response = self._request("get", "orders", params=params)
             
             if response.status_code != 200:
                 logger.error(f"Errore nel recupero degli ordini WooCommerce: {response.text}")
@@ -222,16 +284,7 @@ class WooCommerceClient:
             Dettagli dell'ordine
         """
         try:
-            response = self.wcapi.get(f"orders/{order_id}")
-            
-            if response.status_code != 200:
-                logger.error(f"Errore nel recupero dell'ordine WooCommerce {order_id}: {response.text}")
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"Errore nel recupero dell'ordine WooCommerce: {response.text}",
-                )
-            
-            return response.json()
+            return self._get_cached(f"orders/{order_id}")
         except Exception as e:
             logger.error(f"Errore nel recupero dell'ordine WooCommerce {order_id}: {str(e)}")
             raise HTTPException(
@@ -250,7 +303,7 @@ class WooCommerceClient:
             Lista di clienti
         """
         try:
-            response = self.wcapi.get("customers", params=params)
+            response = self._request("get", "customers", params=params)
             
             if response.status_code != 200:
                 logger.error(f"Errore nel recupero dei clienti WooCommerce: {response.text}")
@@ -278,19 +331,242 @@ class WooCommerceClient:
             Dettagli del cliente
         """
         try:
-            response = self.wcapi.get(f"customers/{customer_id}")
-            
-            if response.status_code != 200:
-                logger.error(f"Errore nel recupero del cliente WooCommerce {customer_id}: {response.text}")
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"Errore nel recupero del cliente WooCommerce: {response.text}",
-                )
-            
-            return response.json()
+            return self._get_cached(f"customers/{customer_id}")
         except Exception as e:
             logger.error(f"Errore nel recupero del cliente WooCommerce {customer_id}: {str(e)}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Errore nel recupero del cliente WooCommerce: {str(e)}",
             )
+    
+    def _post_batch(self, endpoint: str, label: str, chunk: List[Tuple[str, str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Invia un blocco di operazioni (azione, ID interno, dati) a un endpoint
+        batch e restituisce l'esito di ciascuna, indicizzato per ID interno.
+        
+        WooCommerce restituisce i risultati di ogni azione nello stesso ordine
+        della richiesta: l'associazione con gli ID interni è posizionale.
+        """
+        payload: Dict[str, List[Any]] = {}
+        for action, _, data in chunk:
+            payload.setdefault(action, []).append(data)
+        
+        try:
+            response = self._request("post", endpoint, payload)
+            
+            if response.status_code != 200:
+                raise Exception(response.text)
+            
+            body = response.json()
+        except Exception as e:
+            # Un blocco fallito non interrompe gli altri: l'errore vale per tutte le sue operazioni
+            logger.error(f"Errore nell'aggiornamento in blocco {label} WooCommerce: {str(e)}")
+            return {local_id: {"action": action, "success": False, "error": str(e)} for action, local_id, _ in chunk}
+        
+        outcomes = {}
+        positions = {action: 0 for action in payload}
+        for action, local_id, _ in chunk:
+            results = body.get(action) or []
+            position = positions[action]
+            positions[action] += 1
+            outcomes[local_id] = _batch_outcome(action, results[position] if position < len(results) else None)
+        return outcomes
+    
+    async def _batch(
+        self,
+        endpoint: str,
+        label: str,
+        create: Optional[Dict[str, Dict[str, Any]]],
+        update: Optional[Dict[str, Dict[str, Any]]],
+        delete: Optional[Dict[str, int]],
+        concurrency: Optional[int],
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Divide le operazioni in blocchi di BATCH_MAX_SIZE e li invia all'endpoint
+        batch, con al più concurrency richieste in corso contemporaneamente.
+        """
+        operations: List[Tuple[str, str, Any]] = []
+        operations.extend(("create", str(local_id), data) for local_id, data in (create or {}).items())
+        operations.extend(("update", str(local_id), data) for local_id, data in (update or {}).items())
+        operations.extend(("delete", str(local_id), marketplace_id) for local_id, marketplace_id in (delete or {}).items())
+        
+        semaphore = asyncio.Semaphore(concurrency or settings.WOOCOMMERCE_BATCH_CONCURRENCY)
+        
+        async def submit(chunk: List[Tuple[str, str, Any]]) -> Dict[str, Dict[str, Any]]:
+            async with semaphore:
+                return await asyncio.to_thread(self._post_batch, endpoint, label, chunk)
+        
+        outcomes: Dict[str, Dict[str, Any]] = {}
+        for chunk_outcomes in await asyncio.gather(*(
+            submit(operations[start:start + BATCH_MAX_SIZE])
+            for start in range(0, len(operations), BATCH_MAX_SIZE)
+        )):
+            outcomes.update(chunk_outcomes)
+        
+        failed_count = sum(1 for outcome in outcomes.values() if not outcome["success"])
+        if failed_count:
+            logger.warning(f"Aggiornamento in blocco {label} WooCommerce: {failed_count} operazioni su {len(outcomes)} non riuscite")
+        
+        return outcomes
+    
+    async def batch_products(
+        self,
+        create: Optional[Dict[str, Dict[str, Any]]] = None,
+        update: Optional[Dict[str, Dict[str, Any]]] = None,
+        delete: Optional[Dict[str, int]] = None,
+        concurrency: Optional[int] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Crea, aggiorna ed elimina più prodotti con l'endpoint products/batch, a
+        blocchi di BATCH_MAX_SIZE operazioni inviati in parallelo.
+        
+        Args:
+            create: Dati dei prodotti da creare, per ID interno (es. Product.id)
+            update: Dati dei prodotti da aggiornare, ciascuno con l'id WooCommerce, per ID interno
+            delete: ID WooCommerce dei prodotti da eliminare, per ID interno
+            concurrency: Richieste in corso contemporaneamente (predefinito WOOCOMMERCE_BATCH_CONCURRENCY)
+        
+        Returns:
+            Esito per ID interno: action, success, id WooCommerce ed eventuale error
+        """
+        return await self._batch("products/batch", "dei prodotti", create, update, delete, concurrency)
+    
+    async def batch_orders(
+        self,
+        create: Optional[Dict[str, Dict[str, Any]]] = None,
+        update: Optional[Dict[str, Dict[str, Any]]] = None,
+        delete: Optional[Dict[str, int]] = None,
+        concurrency: Optional[int] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Crea, aggiorna ed elimina più ordini con l'endpoint orders/batch, a
+        blocchi di BATCH_MAX_SIZE operazioni inviati in parallelo.
+        
+        Args:
+            create: Dati degli ordini da creare, per ID interno (es. Order.id)
+            update: Dati degli ordini da aggiornare, ciascuno con l'id WooCommerce, per ID interno
+            delete: ID WooCommerce degli ordini da eliminare, per ID interno
+            concurrency: Richieste in corso contemporaneamente (predefinito WOOCOMMERCE_BATCH_CONCURRENCY)
+        
+        Returns:
+            Esito per ID interno: action, success, id WooCommerce ed eventuale error
+        """
+        return await self._batch("orders/batch", "degli ordini", create, update, delete, concurrency)
+    
+    def _fetch_page(self, endpoint: str, page: int, params: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        Scarica una pagina di un endpoint e restituisce gli elementi e il numero
+        della pagina successiva, ricavato dall'header X-WP-TotalPages.
+        """
+        response = self._request("get", endpoint, params={**params, "page": page})
+        
+        if response.status_code != 200:
+            raise Exception(response.text)
+        
+        items = response.json()
+        total_pages = response.headers.get("X-WP-TotalPages")
+        if total_pages is not None:
+            has_next_page = page < int(total_pages)
+        else:
+            # Senza l'header si prosegue finché le pagine sono piene
+            has_next_page = len(items) >= params.get("per_page", MAX_PAGE_SIZE)
+        
+        return items, page + 1 if items and has_next_page else None
+    
+    async def _iter_endpoint(
+        self,
+        endpoint: str,
+        label: str,
+        params: Dict[str, Any],
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Itera tutti gli elementi di un endpoint, pagina per pagina, senza bloccare l'event loop.
+        """
+        async def fetch_page(page: Optional[int]) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+            try:
+                return await asyncio.to_thread(self._fetch_page, endpoint, page or 1, params)
+            except Exception as e:
+                logger.error(f"Errore nel recupero {label} WooCommerce: {str(e)}")
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Errore nel recupero {label} WooCommerce: {str(e)}",
+                )
+        
+        async for item in prefetch_pages(fetch_page):
+            yield item
+    
+    async def iter_products(
+        self,
+        params: Optional[Dict[str, Any]] = None,
+        page_size: int = MAX_PAGE_SIZE,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Itera tutti i prodotti del negozio WooCommerce, scaricando la pagina
+        successiva mentre viene elaborata quella corrente.
+        
+        Args:
+            params: Parametri di query (opzionale, es. modified_after)
+            page_size: Numero di prodotti per pagina (massimo 100)
+        
+        Returns:
+            Iteratore asincrono sui prodotti
+        """
+        async for product in self._iter_endpoint("products", "dei prodotti", {"per_page": page_size, **(params or {})}):
+            yield product
+    
+    async def iter_orders(
+        self,
+        params: Optional[Dict[str, Any]] = None,
+        page_size: int = MAX_PAGE_SIZE,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Itera tutti gli ordini del negozio WooCommerce, scaricando la pagina
+        successiva mentre viene elaborata quella corrente.
+        
+        Args:
+            params: Parametri di query (opzionale, es. modified_after)
+            page_size: Numero di ordini per pagina (massimo 100)
+        
+        Returns:
+            Iteratore asincrono sugli ordini
+        """
+        async for order in self._iter_endpoint("orders", "degli ordini", {"per_page": page_size, **(params or {})}):
+            yield order
+    
+    async def iter_customers(
+        self,
+        params: Optional[Dict[str, Any]] = None,
+        page_size: int = MAX_PAGE_SIZE,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Itera tutti i clienti del negozio WooCommerce, scaricando la pagina
+        successiva mentre viene elaborata quella corrente.
+        
+        Args:
+            params: Parametri di query (opzionale)
+            page_size: Numero di clienti per pagina (massimo 100)
+        
+        Returns:
+            Iteratore asincrono sui clienti
+        """
+        async for customer in self._iter_endpoint("customers", "dei clienti", {"per_page": page_size, **(params or {})}):
+            yield customer
+
+def _batch_outcome(action: str, result: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Converte il risultato di una singola operazione batch nell'esito restituito
+    al chiamante; le operazioni non riuscite hanno id 0 e un campo error.
+    """
+    if result is None:
+        return {"action": action, "success": False, "error": "Esito non restituito da WooCommerce"}
+    
+    error = result.get("error")
+    if error:
+        return {
+            "action": action,
+            "success": False,
+            "id": result.get("id") or None,
+            "error": error.get("message", str(error)) if isinstance(error, dict) else str(error),
+        }
+    
+    return {"action": action, "success": True, "id": result.get("id")}
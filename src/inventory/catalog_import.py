@@ -0,0 +1,135 @@
+import logging
+from datetime import datetime
+from typing import Any, AsyncIterable, Dict, List, Tuple
+from uuid import UUID
+
+from sqlalchemy import Float, Integer, String, column, insert, select, update, values
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.models.product import Product
+
+logger = logging.getLogger(__name__)
+
+# Prodotti per blocco: una query per gli SKU esistenti, un INSERT multiplo per i
+# nuovi e un UPDATE ... FROM (VALUES ...) per gli altri (7 parametri per riga)
+IMPORT_BATCH_SIZE = 1000
+
+# Campi aggiornati sui prodotti già presenti
+_UPDATE_COLUMNS = (
+    column("id", PG_UUID(as_uuid=True)),
+    column("name", String),
+    column("description", String),
+    column("barcode", String),
+    column("price", Float),
+    column("compare_at_price", Float),
+    column("quantity", Integer),
+)
+
+def _product_row(store_id: UUID, item: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "store_id": store_id,
+        "sku": item["sku"],
+        "name": item.get("name") or item["sku"],
+        "description": item.get("description"),
+        "barcode": item.get("barcode"),
+        "price": item.get("price") or 0.0,
+        "compare_at_price": item.get("compare_at_price"),
+        "quantity": item.get("quantity") or 0,
+        "is_active": item.get("is_active", True),
+        "categories": item.get("categories"),
+        "tags": item.get("tags"),
+        "images": item.get("images"),
+    }
+
+async def _import_batch(db: AsyncSession, store_id: UUID, batch: Dict[str, Dict[str, Any]]) -> Tuple[int, int]:
+    result = await db.execute(
+        select(Product.sku, Product.id).where(Product.store_id == store_id, Product.sku.in_(list(batch)))
+    )
+    existing = {sku: product_id for sku, product_id in result.all()}
+    
+    new_rows = [_product_row(store_id, item) for sku, item in batch.items() if sku not in existing]
+    if new_rows:
+        await db.execute(insert(Product), new_rows)
+    
+    changes: List[Tuple[Any, ...]] = []
+    for sku, product_id in existing.items():
+        row = _product_row(store_id, batch[sku])
+        changes.append((
+            product_id,
+            row["name"],
+            row["description"],
+            row["barcode"],
+            row["price"],
+            row["compare_at_price"],
+            row["quantity"],
+        ))
+    if changes:
+        imported = values(*_UPDATE_COLUMNS, name="imported_products").data(changes)
+        await db.execute(
+            update(Product)
+            .where(Product.id == imported.c.id)
+            .values(
+                name=imported.c.name,
+                description=imported.c.description,
+                barcode=imported.c.barcode,
+                price=imported.c.price,
+                compare_at_price=imported.c.compare_at_price,
+                quantity=imported.c.quantity,
+                updated_at=datetime.utcnow(),
+            )
+            .execution_options(synchronize_session=False)
+        )
+    
+    return len(new_rows), len(changes)
+
+async def import_catalog(
+    db: AsyncSession,
+    store_id: UUID,
+    marketplace_products: AsyncIterable[Dict[str, Any]],
+) -> Dict[str, int]:
+    """
+    Importa nel database il catalogo del marketplace, associando i prodotti per SKU.
+    
+    I prodotti (sku, name, description, barcode, price, compare_at_price,
+    quantity, is_active, categories, tags, images) vengono consumati in streaming
+    e scritti a blocchi di IMPORT_BATCH_SIZE: quelli nuovi con un INSERT
+    multiplo, quelli esistenti con un solo UPDATE; in memoria resta un blocco
+    alla volta. I prodotti senza SKU vengono ignorati; per gli SKU duplicati
+    nello stesso blocco vale il primo.
+    
+    Non esegue il commit: la transazione resta al chiamante.
+    """
+    created_count = 0
+    updated_count = 0
+    skipped_count = 0
+    batch: Dict[str, Dict[str, Any]] = {}
+    
+    async for item in marketplace_products:
+        sku = item.get("sku")
+        if not sku or sku in batch:
+            skipped_count += 1
+            continue
+        
+        batch[sku] = item
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            created, updated = await _import_batch(db, store_id, batch)
+            created_count += created
+            updated_count += updated
+            batch = {}
+    
+    if batch:
+        created, updated = await _import_batch(db, store_id, batch)
+        created_count += created
+        updated_count += updated
+    
+    logger.info(
+        f"Catalogo del negozio {store_id} importato: "
+        f"{created_count} prodotti creati, {updated_count} aggiornati, {skipped_count} ignorati"
+    )
+    
+    return {
+        "created_count": created_count,
+        "updated_count": updated_count,
+        "skipped_count": skipped_count,
+    }
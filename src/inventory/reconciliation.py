@@ -0,0 +1,147 @@
+import logging
+from datetime import datetime
+from typing import Any, AsyncIterable, Dict, Iterable, List, Tuple, Union
+from uuid import UUID
+
+from sqlalchemy import Integer, column, select, update, values
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.models.product import Product
+
+logger = logging.getLogger(__name__)
+
+# Righe lette per volta dalla proiezione dei prodotti
+PROJECTION_BATCH_SIZE = 10000
+
+# Righe per singolo UPDATE ... FROM (VALUES ...): 2 parametri per riga, entro il
+# limite di 32767 parametri per istruzione di PostgreSQL
+UPDATE_BATCH_SIZE = 5000
+
+# SKU per singola query IN (...) nella riconciliazione incrementale
+SKU_LOOKUP_BATCH_SIZE = 5000
+
+def _add_to_index(index: Dict[str, int], product: Dict[str, Any]) -> None:
+    sku = product.get("sku")
+    quantity = product.get("quantity")
+    if sku and quantity is not None and sku not in index:
+        index[sku] = int(quantity)
+
+def build_sku_index(marketplace_products: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Costruisce l'indice SKU -> quantità dei prodotti del marketplace.
+    
+    Per gli SKU duplicati vale il primo prodotto, come nella ricerca lineare
+    usata in precedenza; i prodotti senza SKU o senza quantità vengono ignorati.
+    """
+    index: Dict[str, int] = {}
+    for product in marketplace_products:
+        _add_to_index(index, product)
+    return index
+
+async def build_sku_index_from_stream(marketplace_products: AsyncIterable[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Come build_sku_index, ma consumando un iteratore asincrono (es. il catalogo
+    paginato del marketplace) senza tenere in memoria i prodotti completi.
+    """
+    index: Dict[str, int] = {}
+    async for product in marketplace_products:
+        _add_to_index(index, product)
+    return index
+
+def diff_quantities(
+    rows: Iterable[Tuple[UUID, str, int]],
+    sku_index: Dict[str, int],
+) -> List[Tuple[UUID, int]]:
+    """
+    Confronta le righe (id, sku, quantità) del database con l'indice del marketplace
+    e restituisce le coppie (id, nuova quantità) dei soli prodotti cambiati.
+    """
+    changes = []
+    for product_id, sku, quantity in rows:
+        if sku is None:
+            continue
+        marketplace_quantity = sku_index.get(sku)
+        if marketplace_quantity is not None and marketplace_quantity != quantity:
+            changes.append((product_id, marketplace_quantity))
+    return changes
+
+async def apply_quantity_changes(db: AsyncSession, changes: List[Tuple[UUID, int]]) -> int:
+    """
+    Applica le nuove quantità con UPDATE ... FROM (VALUES ...) a blocchi.
+    
+    Non esegue il commit: la transazione resta al chiamante.
+    """
+    now = datetime.utcnow()
+    for start in range(0, len(changes), UPDATE_BATCH_SIZE):
+        chunk = changes[start:start + UPDATE_BATCH_SIZE]
+        new_quantities = values(
+            column("id", PG_UUID(as_uuid=True)),
+            column("quantity", Integer),
+            name="new_quantities",
+        ).data(chunk)
+        
+        await db.execute(
+            update(Product)
+            .where(Product.id == new_quantities.c.id)
+            .values(quantity=new_quantities.c.quantity, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+    
+    return len(changes)
+
+async def reconcile_inventory(
+    db: AsyncSession,
+    store_id: UUID,
+    marketplace_products: Union[Iterable[Dict[str, Any]], AsyncIterable[Dict[str, Any]]],
+    incremental: bool = False,
+) -> Dict[str, int]:
+    """
+    Allinea le quantità dei prodotti di un negozio a quelle del marketplace.
+    
+    Costruisce l'indice SKU una sola volta, legge dal database solo la proiezione
+    (id, sku, quantità) a blocchi invece degli oggetti Product completi e aggiorna
+    soltanto le righe cambiate: il costo è lineare nel numero di prodotti.
+    
+    Con incremental=True marketplace_products contiene solo i prodotti modificati:
+    dal database vengono letti soltanto i loro SKU invece dell'intero catalogo.
+    """
+    if hasattr(marketplace_products, "__aiter__"):
+        sku_index = await build_sku_index_from_stream(marketplace_products)
+    else:
+        sku_index = build_sku_index(marketplace_products)
+    
+    products_count = 0
+    changes: List[Tuple[UUID, int]] = []
+    if incremental:
+        skus = list(sku_index)
+        for start in range(0, len(skus), SKU_LOOKUP_BATCH_SIZE):
+            result = await db.execute(
+                select(Product.id, Product.sku, Product.quantity)
+                .where(Product.store_id == store_id, Product.sku.in_(skus[start:start + SKU_LOOKUP_BATCH_SIZE]))
+            )
+            rows = result.all()
+            products_count += len(rows)
+            changes.extend(diff_quantities(rows, sku_index))
+    else:
+        result = await db.stream(
+            select(Product.id, Product.sku, Product.quantity)
+            .where(Product.store_id == store_id)
+            .execution_options(yield_per=PROJECTION_BATCH_SIZE)
+        )
+        async for rows in result.partitions():
+            products_count += len(rows)
+            changes.extend(diff_quantities(rows, sku_index))
+    
+    updated_count = await apply_quantity_changes(db, changes)
+    
+    logger.info(
+        f"Inventario del negozio {store_id} riconciliato: "
+        f"{updated_count} prodotti aggiornati su {products_count}"
+    )
+    
+    return {
+        "products_count": products_count,
+        "marketplace_count": len(sku_index),
+        "updated_count": updated_count,
+    }
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.config import settings
+from src.models.sync_state import SyncState
+
+async def get_sync_state(db: AsyncSession, store_id: UUID, resource: str) -> SyncState:
+    """
+    Restituisce lo stato di sincronizzazione di una risorsa del negozio, creandolo se non esiste.
+    """
+    result = await db.execute(
+        select(SyncState).where(SyncState.store_id == store_id, SyncState.resource == resource)
+    )
+    state = result.scalars().first()
+    if state is None:
+        state = SyncState(store_id=store_id, resource=resource, items_synced=0)
+        db.add(state)
+    return state
+
+def get_incremental_since(state: SyncState, now: datetime) -> Optional[datetime]:
+    """
+    Restituisce l'istante da cui scaricare le modifiche, oppure None se serve
+    una riconciliazione completa (prima sincronizzazione o ultima riconciliazione
+    completa più vecchia di INVENTORY_FULL_SYNC_INTERVAL_HOURS).
+    """
+    if state.last_synced_at is None or state.last_full_sync_at is None:
+        return None
+    
+    if now - state.last_full_sync_at >= timedelta(hours=settings.INVENTORY_FULL_SYNC_INTERVAL_HOURS):
+        return None
+    
+    return state.last_synced_at - timedelta(seconds=settings.INVENTORY_SYNC_OVERLAP_SECONDS)
+
+def mark_synced(
+    state: SyncState,
+    started_at: datetime,
+    full: bool,
+    items_synced: int,
+    cursor: Optional[str] = None,
+) -> None:
+    """
+    Aggiorna il watermark dopo una sincronizzazione riuscita.
+    
+    Il watermark è l'istante di inizio della sincronizzazione, così le modifiche
+    avvenute mentre era in corso vengono riprese dalla successiva.
+    """
+    state.last_synced_at = started_at
+    if full:
+        state.last_full_sync_at = started_at
+    state.cursor = cursor
+    state.items_synced = items_synced
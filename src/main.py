@@ -5,7 +5,12 @@ from starlette.middleware.sessions import SessionMiddleware
 from src.api.routes import api_router
 from src.core.config import settings
 from src.core.dependencies import get_db
+from src.core.metrics import metrics
+from src.core.redis import close_redis
 from src.db.init_db import init_db
+from src.integrations.payment.executor import shutdown_payment_executor
+from src.integrations.registry import marketplace_clients
+from src.mcp.client import mcp_client
 
 app = FastAPI(
     title="CommerceAI Agent",
@@ -41,6 +46,19 @@ async def startup_event():
     # Inizializza il database se necessario
     db = next(get_db())
     await init_db(db)
+    
+    # Apre il pool di connessioni verso il server MCP
+    await mcp_client.startup()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    Rilascio delle risorse alla chiusura dell'applicazione.
+    """
+    await mcp_client.shutdown()
+    await marketplace_clients.shutdown()
+    shutdown_payment_executor()
+    await close_redis()
 
 @app.get("/")
 async def root():
@@ -54,6 +72,13 @@ async def root():
         "docs": f"{settings.API_PREFIX}/docs"
     }
 
+@app.get("/metrics")
+async def read_metrics():
+    """
+    Endpoint con le metriche interne del processo (cache MCP, code, circuit breaker, ecc.).
+    """
+    return metrics.snapshot()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
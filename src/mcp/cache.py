@@ -0,0 +1,199 @@
+import fnmatch
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from src.core.config import settings
+from src.core.metrics import metrics
+from src.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+def canonicalize(value: Any) -> str:
+    """
+    Serializza un valore JSON in forma canonica (chiavi ordinate, senza spazi).
+    """
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+class LocalLRUCache:
+    """
+    Cache LRU in memoria con scadenza per singola voce.
+    """
+    
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        # chiave -> (scadenza, valore), dalla meno recente
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            
+            self._entries.move_to_end(key)
+            return value
+    
+    def set(self, key: str, value: str, ttl: float) -> int:
+        """
+        Memorizza una voce e restituisce il numero di voci rimosse per fare spazio.
+        """
+        evicted = 0
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        return evicted
+    
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class MCPResponseCache:
+    """
+    Cache delle risposte MCP indirizzata per contenuto.
+    
+    La chiave è calcolata dal nome della funzione e dai parametri canonicalizzati.
+    Le risposte sono cercate prima nella cache LRU locale e poi in Redis; solo le
+    funzioni con un TTL positivo in MCP_CACHE_TTLS vengono memorizzate.
+    """
+    
+    def __init__(self):
+        self.local = LocalLRUCache(settings.MCP_CACHE_LOCAL_MAX_ENTRIES)
+    
+    @property
+    def enabled(self) -> bool:
+        return settings.MCP_CACHE_ENABLED
+    
+    def get_ttl(self, function_name: str) -> int:
+        """
+        Restituisce il TTL in secondi per una funzione (0 se non va memorizzata).
+        
+        Le chiavi di MCP_CACHE_TTLS possono contenere caratteri jolly (es. "*_agent_capabilities");
+        il nome esatto ha la precedenza sui pattern.
+        """
+        ttls = settings.MCP_CACHE_TTLS
+        if function_name in ttls:
+            return max(0, int(ttls[function_name]))
+        
+        for pattern, ttl in ttls.items():
+            if fnmatch.fnmatchcase(function_name, pattern):
+                return max(0, int(ttl))
+        
+        return 0
+    
+    def is_cacheable(self, function_name: str) -> bool:
+        return self.enabled and self.get_ttl(function_name) > 0
+    
+    def make_key(
+        self,
+        function_name: str,
+        parameters: Dict[str, Any],
+        cache_context: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """
+        Calcola la chiave di cache per una chiamata.
+        
+        cache_context contiene dati che non vengono inviati al server ma che
+        invalidano la voce quando cambiano (es. la data di modifica del prodotto).
+        """
+        payload = canonicalize({"parameters": parameters, "context": cache_context or {}})
+        digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        return f"mcp:cache:{function_name}:{digest}"
+    
+    async def get(self, function_name: str, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Cerca una risposta nella cache locale e poi in Redis.
+        """
+        value = self.local.get(key)
+        if value is not None:
+            metrics.inc("mcp_cache_hits_total", function=function_name, tier="local")
+            return json.loads(value)
+        
+        if settings.MCP_CACHE_REDIS_ENABLED:
+            try:
+                async with get_redis().pipeline(transaction=False) as pipe:
+                    pipe.get(key)
+                    pipe.ttl(key)
+                    value, ttl = await pipe.execute()
+            except Exception as e:
+                logger.warning(f"Errore nella lettura della cache MCP da Redis: {str(e)}")
+                value = None
+            
+            if value is not None:
+                metrics.inc("mcp_cache_hits_total", function=function_name, tier="redis")
+                # Ripopola la cache locale con il TTL residuo della voce Redis
+                self._set_local(function_name, key, value, ttl if ttl and ttl > 0 else self.get_ttl(function_name))
+                return json.loads(value)
+        
+        metrics.inc("mcp_cache_misses_total", function=function_name)
+        return None
+    
+    async def set(self, function_name: str, key: str, response: Dict[str, Any]) -> None:
+        """
+        Memorizza una risposta in entrambi i livelli di cache.
+        """
+        ttl = self.get_ttl(function_name)
+        if ttl <= 0:
+            return
+        
+        value = canonicalize(response)
+        self._set_local(function_name, key, value, ttl)
+        
+        if settings.MCP_CACHE_REDIS_ENABLED:
+            try:
+                await get_redis().set(key, value, ex=ttl)
+            except Exception as e:
+                logger.warning(f"Errore nella scrittura della cache MCP su Redis: {str(e)}")
+        
+        metrics.inc("mcp_cache_stores_total", function=function_name)
+    
+    def _set_local(self, function_name: str, key: str, value: str, ttl: float) -> None:
+        evicted = self.local.set(key, value, ttl)
+        if evicted:
+            metrics.inc("mcp_cache_evictions_total", evicted, function=function_name, tier="local")
+        metrics.set_gauge("mcp_cache_local_entries", len(self.local))
+    
+    async def invalidate(self, key: str) -> None:
+        """
+        Rimuove una voce da entrambi i livelli di cache.
+        """
+        self.local.delete(key)
+        if settings.MCP_CACHE_REDIS_ENABLED:
+            try:
+                await get_redis().delete(key)
+            except Exception as e:
+                logger.warning(f"Errore nella rimozione della cache MCP da Redis: {str(e)}")
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Restituisce i contatori di hit, miss ed eviction della cache.
+        """
+        snapshot = metrics.snapshot()["counters"]
+        return {
+            name: value
+            for name, value in snapshot.items()
+            if name.startswith("mcp_cache_")
+        }
+
+# Istanza della cache delle risposte MCP
+mcp_response_cache = MCPResponseCache()
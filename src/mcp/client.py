@@ -1,51 +1,534 @@
+import asyncio
+import fnmatch
 import json
 import logging
-from typing import Any, Dict, List, Optional, Union
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
 
 import httpx
 
 from src.core.config import settings
+from src.core.metrics import metrics
+from src.mcp.cache import mcp_response_cache
+from src.mcp.limiter import mcp_limits
+from src.mcp.resilience import MCPRequestError, mcp_resilience
+from src.mcp.singleflight import mcp_singleflight
 
 logger = logging.getLogger(__name__)
 
+# Codici di stato con cui il server MCP segnala di essere sovraccarico
+OVERLOAD_STATUS_CODES = (429, 503)
+
+# Suffisso delle chiavi di breaker, latenze e limiti delle richieste batch
+BATCH_KEY_SUFFIX = ":batch"
+
+def _http2_available() -> bool:
+    """
+    Verifica se HTTP/2 è abilitato e se il pacchetto h2 è installato.
+    """
+    if not settings.MCP_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def _parse_stream_data(data: str, event_type: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Interpreta i dati di un evento in streaming: JSON se possibile, altrimenti testo.
+    """
+    try:
+        event = json.loads(data)
+    except ValueError:
+        event = None
+    
+    if not isinstance(event, dict):
+        event = {"delta": data}
+    
+    if event_type == "error" and "error" not in event:
+        event = {"error": event.get("delta", data)}
+    
+    return event
+
 class MCPClient:
     """
     Client per l'interazione con il Model Context Protocol (MCP).
+    
+    Mantiene un unico pool di connessioni HTTP (keep-alive, HTTP/2 se disponibile)
+    condiviso da tutte le chiamate del processo.
     """
     def __init__(self, server_url: str = None):
         self.server_url = server_url or settings.MCP_SERVER_URL
         self.enabled = settings.MCP_ENABLED
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._http_client_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._batch_functions: Optional[set] = None
+        self._batch_functions_expires_at = 0.0
+    
+    def _build_http_client(self) -> httpx.AsyncClient:
+        """
+        Crea il client HTTP con il pool di connessioni configurato nelle impostazioni.
+        """
+        limits = httpx.Limits(
+            max_connections=settings.MCP_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.MCP_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=settings.MCP_POOL_KEEPALIVE_EXPIRY,
+        )
+        return httpx.AsyncClient(
+            base_url=self.server_url,
+            limits=limits,
+            http2=_http2_available(),
+            timeout=httpx.Timeout(settings.MCP_TIMEOUT, connect=settings.MCP_CONNECT_TIMEOUT),
+        )
+    
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """
+        Restituisce il client HTTP condiviso, creandolo se necessario.
+        
+        Le connessioni di httpx sono legate all'event loop in cui sono state aperte:
+        se il loop corrente è diverso (es. un nuovo asyncio.run) il pool viene ricreato.
+        """
+        loop = asyncio.get_running_loop()
+        if (
+            self._http_client is None
+            or self._http_client.is_closed
+            or self._http_client_loop is not loop
+        ):
+            self._http_client = self._build_http_client()
+            self._http_client_loop = loop
+        return self._http_client
+    
+    async def startup(self) -> None:
+        """
+        Apre il pool di connessioni verso il server MCP.
+        """
+        if self.enabled:
+            self._get_http_client()
+    
+    async def shutdown(self) -> None:
+        """
+        Chiude il pool di connessioni verso il server MCP.
+        """
+        client, loop = self._http_client, self._http_client_loop
+        self._http_client = None
+        self._http_client_loop = None
+        
+        if client is None or client.is_closed:
+            return
+        
+        # Un pool aperto in un loop diverso (o già chiuso) non può essere chiuso in modo pulito
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if loop is not running_loop or loop.is_closed():
+            return
+        
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.warning(f"Errore nella chiusura del pool di connessioni MCP: {str(e)}")
+    
+    def reset(self) -> None:
+        """
+        Scarta il pool di connessioni senza chiuderlo (es. dopo un fork del processo).
+        """
+        self._http_client = None
+        self._http_client_loop = None
     
     async def call_function(
         self,
         function_name: str,
         parameters: Dict[str, Any],
-        timeout: int = 60
+        timeout: Optional[float] = None,
+        use_cache: bool = True,
+        cache_context: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """
         Chiama una funzione MCP sul server.
+        
+        Le risposte delle funzioni configurate in MCP_CACHE_TTLS vengono servite
+        dalla cache quando possibile; use_cache=False forza la chiamata al server.
+        Le chiamate concorrenti identiche alle funzioni in MCP_SINGLEFLIGHT_FUNCTIONS
+        condividono un'unica richiesta al server.
         """
         if not self.enabled:
             logger.warning("MCP è disabilitato nelle impostazioni")
             return {"error": "MCP è disabilitato nelle impostazioni"}
         
+        cache_key = None
+        if use_cache and mcp_response_cache.is_cacheable(function_name):
+            cache_key = mcp_response_cache.make_key(function_name, parameters, cache_context)
+            cached = await mcp_response_cache.get(function_name, cache_key)
+            if cached is not None:
+                return cached
+        
+        if self._is_singleflight(function_name):
+            call_key = cache_key or mcp_response_cache.make_key(function_name, parameters, cache_context)
+            
+            async def request() -> Dict[str, Any]:
+                return await self._request_function(function_name, parameters, timeout)
+            
+            if settings.MCP_SINGLEFLIGHT_DISTRIBUTED:
+                result = await mcp_singleflight.do_distributed(call_key, request, label=function_name)
+            else:
+                result = await mcp_singleflight.do(call_key, request, label=function_name)
+        else:
+            result = await self._request_function(function_name, parameters, timeout)
+        
+        if cache_key and "error" not in result:
+            await mcp_response_cache.set(function_name, cache_key, result)
+        
+        return result
+    
+    @staticmethod
+    def _is_singleflight(function_name: str) -> bool:
+        return any(
+            fnmatch.fnmatchcase(function_name, pattern)
+            for pattern in settings.MCP_SINGLEFLIGHT_FUNCTIONS
+        )
+    
+    async def _request_function(
+        self,
+        function_name: str,
+        parameters: Dict[str, Any],
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Esegue la richiesta HTTP di una funzione MCP con retry, hedging e circuit breaker.
+        """
+        async def attempt() -> Dict[str, Any]:
+            return await self._post(function_name, f"/function/{function_name}", parameters, timeout)
+        
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.server_url}/function/{function_name}",
+            return await mcp_resilience.execute(function_name, attempt)
+        
+        except MCPRequestError as e:
+            logger.error(f"Errore nella chiamata MCP: {str(e)}")
+            return {"error": f"Errore nella chiamata MCP: {e.status_code or str(e)}"}
+        
+        except Exception as e:
+            logger.error(f"Eccezione durante la chiamata MCP: {str(e)}")
+            return {"error": f"Eccezione durante la chiamata MCP: {str(e)}"}
+    
+    async def _post(
+        self,
+        function_name: str,
+        path: str,
+        payload: Dict[str, Any],
+        timeout: Optional[float] = None
+    ) -> Any:
+        """
+        Invia una richiesta POST al server MCP occupando uno slot di concorrenza.
+        
+        Timeout e risposte 429/503 vengono segnalati al limitatore adattivo; le
+        risposte diverse da 200 e gli errori di rete diventano MCPRequestError.
+        """
+        async with mcp_limits.slot(function_name) as slot:
+            try:
+                response = await self._get_http_client().post(
+                    path,
+                    json=payload,
+                    timeout=timeout or settings.MCP_TIMEOUT
+                )
+            except httpx.TimeoutException as e:
+                slot.overloaded = True
+                raise MCPRequestError(f"Timeout della chiamata MCP {function_name}: {str(e)}") from e
+            except httpx.TransportError as e:
+                raise MCPRequestError(f"Errore di rete nella chiamata MCP {function_name}: {str(e)}") from e
+            
+            slot.overloaded = response.status_code in OVERLOAD_STATUS_CODES
+        
+        if response.status_code == 200:
+            return response.json()
+        
+        retry_after = response.headers.get("Retry-After")
+        raise MCPRequestError(
+            f"{response.status_code} - {response.text}",
+            status_code=response.status_code,
+            retryable=response.status_code in OVERLOAD_STATUS_CODES or response.status_code >= 500,
+            retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None,
+        )
+    
+    async def stream_function(
+        self,
+        function_name: str,
+        parameters: Dict[str, Any],
+        timeout: Optional[float] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Chiama una funzione MCP in streaming, restituendo gli eventi man mano che arrivano.
+        
+        Il server può rispondere con Server-Sent Events (text/event-stream) o con
+        JSON delimitato da newline in chunked encoding; i dati non JSON vengono
+        restituiti come {"delta": testo}. Se il server non espone l'endpoint di
+        streaming per la funzione, viene eseguita la chiamata normale e il risultato
+        restituito come unico evento. Gli errori sono restituiti come evento
+        {"error": ...} che chiude lo stream.
+        
+        Lo stream non viene ripetuto in caso di errore, perché una parte della
+        risposta potrebbe essere già stata consegnata al chiamante.
+        """
+        if not self.enabled:
+            logger.warning("MCP è disabilitato nelle impostazioni")
+            yield {"error": "MCP è disabilitato nelle impostazioni"}
+            return
+        
+        breaker = mcp_resilience.get_breaker(function_name)
+        if not breaker.allow_request():
+            metrics.inc("mcp_circuit_rejected_total", function=function_name)
+            yield {"error": f"Errore nella chiamata MCP: Circuit breaker aperto per la funzione MCP {function_name}"}
+            return
+        
+        fallback = False
+        try:
+            async with mcp_limits.slot(function_name) as slot:
+                started_at = time.monotonic()
+                request = self._get_http_client().build_request(
+                    "POST",
+                    f"/function/{function_name}/stream",
                     json=parameters,
-                    timeout=timeout
+                    headers={"Accept": "text/event-stream, application/x-ndjson"},
+                    timeout=timeout or settings.MCP_TIMEOUT,
                 )
+                try:
+                    response = await self._get_http_client().send(request, stream=True)
+                except httpx.TimeoutException:
+                    slot.overloaded = True
+                    raise
                 
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    logger.error(f"Errore nella chiamata MCP: {response.status_code} - {response.text}")
-                    return {"error": f"Errore nella chiamata MCP: {response.status_code}"}
+                try:
+                    slot.overloaded = response.status_code in OVERLOAD_STATUS_CODES
+                    
+                    if response.status_code in (404, 405):
+                        fallback = True
+                    elif response.status_code != 200:
+                        await response.aread()
+                        if response.status_code in OVERLOAD_STATUS_CODES or response.status_code >= 500:
+                            breaker.record_failure()
+                        else:
+                            breaker.record_success()
+                        logger.error(f"Errore nella chiamata MCP in streaming: {response.status_code} - {response.text}")
+                        yield {"error": f"Errore nella chiamata MCP: {response.status_code}"}
+                        return
+                    else:
+                        breaker.record_success()
+                        first_event = True
+                        async for event in self._iter_stream_events(response):
+                            if first_event:
+                                first_event = False
+                                slot.latency = time.monotonic() - started_at
+                                metrics.observe("mcp_stream_first_event_seconds", slot.latency, function=function_name)
+                            yield event
+                            if "error" in event:
+                                return
+                finally:
+                    await response.aclose()
+        
+        except httpx.TransportError as e:
+            breaker.record_failure()
+            logger.error(f"Eccezione durante la chiamata MCP in streaming: {str(e)}")
+            yield {"error": f"Eccezione durante la chiamata MCP: {str(e)}"}
+            return
+        
+        if fallback:
+            # Il server non supporta lo streaming per la funzione: si torna alla chiamata normale
+            breaker.record_success()
+            logger.warning(f"Endpoint di streaming non disponibile per la funzione MCP {function_name}")
+            yield await self.call_function(function_name, parameters, timeout=timeout, use_cache=False)
+    
+    @staticmethod
+    async def _iter_stream_events(response: httpx.Response) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Converte una risposta in streaming (SSE, NDJSON o JSON semplice) in eventi.
+        """
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        
+        if content_type == "application/json":
+            # Il server ha risposto in un unico blocco
+            await response.aread()
+            yield response.json()
+            return
+        
+        if content_type != "text/event-stream":
+            async for line in response.aiter_lines():
+                if line.strip():
+                    yield _parse_stream_data(line)
+            return
+        
+        event_type = None
+        data_lines: List[str] = []
+        async for line in response.aiter_lines():
+            if line:
+                field, _, value = line.partition(":")
+                value = value[1:] if value.startswith(" ") else value
+                if field == "data":
+                    data_lines.append(value)
+                elif field == "event":
+                    event_type = value
+                # Le righe di commento (":") e gli altri campi SSE vengono ignorati
+                continue
+            
+            if data_lines:
+                data = "\n".join(data_lines)
+                if data == "[DONE]":
+                    return
+                yield _parse_stream_data(data, event_type)
+            event_type = None
+            data_lines = []
+        
+        if data_lines and "\n".join(data_lines) != "[DONE]":
+            yield _parse_stream_data("\n".join(data_lines), event_type)
+    
+    async def call_batch(
+        self,
+        function_name: str,
+        items: List[Dict[str, Any]],
+        concurrency: Optional[int] = None,
+        timeout: Optional[float] = None,
+        use_cache: bool = True,
+        cache_contexts: Optional[List[Optional[Dict[str, Any]]]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Chiama una funzione MCP su più insiemi di parametri.
+        
+        Se il server dichiara il supporto batch per la funzione, gli elementi vengono
+        inviati in blocchi di MCP_BATCH_MAX_SIZE per richiesta; altrimenti vengono
+        eseguite chiamate singole concorrenti (al massimo `concurrency` alla volta).
+        I risultati sono restituiti nello stesso ordine degli elementi in input;
+        gli elementi già presenti nella cache non vengono inviati al server.
+        """
+        if not items:
+            return []
+        
+        if not self.enabled:
+            logger.warning("MCP è disabilitato nelle impostazioni")
+            return [{"error": "MCP è disabilitato nelle impostazioni"} for _ in items]
+        
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        cache_keys: List[Optional[str]] = [None] * len(items)
+        
+        if use_cache and mcp_response_cache.is_cacheable(function_name):
+            for index, parameters in enumerate(items):
+                cache_context = cache_contexts[index] if cache_contexts else None
+                cache_keys[index] = mcp_response_cache.make_key(function_name, parameters, cache_context)
+                results[index] = await mcp_response_cache.get(function_name, cache_keys[index])
+        
+        pending = [index for index, result in enumerate(results) if result is None]
+        if pending:
+            fetched = await self._call_batch_uncached(
+                function_name,
+                [items[index] for index in pending],
+                concurrency,
+                timeout,
+            )
+            for index, result in zip(pending, fetched):
+                results[index] = result
+                if cache_keys[index] and "error" not in result:
+                    await mcp_response_cache.set(function_name, cache_keys[index], result)
+        
+        return results
+    
+    async def _call_batch_uncached(
+        self,
+        function_name: str,
+        items: List[Dict[str, Any]],
+        concurrency: Optional[int] = None,
+        timeout: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Esegue le chiamate di un batch senza passare dalla cache.
+        """
+        semaphore = asyncio.Semaphore(concurrency or settings.MCP_BATCH_CONCURRENCY)
+        
+        if await self.supports_batch(function_name):
+            chunk_size = max(1, settings.MCP_BATCH_MAX_SIZE)
+            chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+            
+            async def _run_chunk(chunk: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+                async with semaphore:
+                    return await self._call_batch_chunk(function_name, chunk, timeout)
+            
+            chunk_results = await asyncio.gather(*(_run_chunk(chunk) for chunk in chunks))
+            return [result for results in chunk_results for result in results]
+        
+        async def _run_single(parameters: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._request_function(function_name, parameters, timeout)
+        
+        return list(await asyncio.gather(*(_run_single(parameters) for parameters in items)))
+    
+    async def _call_batch_chunk(
+        self,
+        function_name: str,
+        chunk: List[Dict[str, Any]],
+        timeout: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Invia un blocco di elementi all'endpoint batch di una funzione MCP.
+        
+        Le richieste batch hanno circuit breaker, latenze (per l'hedging) e limite
+        di concorrenza separati da quelli delle chiamate singole della funzione:
+        la loro durata copre più elementi e non è confrontabile.
+        """
+        batch_key = f"{function_name}{BATCH_KEY_SUFFIX}"
+        
+        async def attempt() -> Dict[str, Any]:
+            return await self._post(batch_key, f"/function/{function_name}/batch", {"items": chunk}, timeout)
+        
+        try:
+            response = await mcp_resilience.execute(
+                batch_key,
+                attempt,
+                idempotent=mcp_resilience.is_idempotent(function_name),
+            )
+        
+        except MCPRequestError as e:
+            if e.status_code in (404, 405):
+                # Il server non espone più l'endpoint batch: si torna alle chiamate singole
+                logger.warning(f"Endpoint batch non disponibile per la funzione MCP {function_name}")
+                if self._batch_functions is not None:
+                    self._batch_functions.discard(function_name)
+                return list(await asyncio.gather(
+                    *(self._request_function(function_name, parameters, timeout) for parameters in chunk)
+                ))
+            
+            logger.error(f"Errore nella chiamata MCP batch: {str(e)}")
+            return [{"error": f"Errore nella chiamata MCP: {e.status_code or str(e)}"} for _ in chunk]
         
         except Exception as e:
-            logger.error(f"Eccezione durante la chiamata MCP: {str(e)}")
-            return {"error": f"Eccezione durante la chiamata MCP: {str(e)}"}
+            logger.error(f"Eccezione durante la chiamata MCP batch: {str(e)}")
+            return [{"error": f"Eccezione durante la chiamata MCP: {str(e)}"} for _ in chunk]
+        
+        results = response.get("results") if isinstance(response, dict) else None
+        if not isinstance(results, list) or len(results) != len(chunk):
+            received = len(results) if isinstance(results, list) else 0
+            logger.error(f"Risposta MCP batch incompleta per {function_name}: {received} risultati per {len(chunk)} elementi")
+            return [{"error": "Risposta MCP batch incompleta"} for _ in chunk]
+        
+        return [
+            result if isinstance(result, dict) else {"error": "Risposta MCP batch non valida"}
+            for result in results
+        ]
+    
+    async def supports_batch(self, function_name: str) -> bool:
+        """
+        Verifica se il server MCP dichiara il supporto batch per una funzione.
+        
+        L'elenco delle funzioni viene memorizzato per MCP_FUNCTIONS_CACHE_TTL secondi.
+        """
+        now = time.monotonic()
+        if self._batch_functions is None or now >= self._batch_functions_expires_at:
+            functions = await self.get_available_functions()
+            self._batch_functions = {
+                function.get("name")
+                for function in functions
+                if isinstance(function, dict) and function.get("batch")
+            }
+            self._batch_functions_expires_at = now + settings.MCP_FUNCTIONS_CACHE_TTL
+        
+        return function_name in self._batch_functions
     
     async def get_available_functions(self) -> List[Dict[str, Any]]:
         """
@@ -56,14 +539,14 @@ class MCPClient:
             return []
         
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{self.server_url}/functions")
-                
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    logger.error(f"Errore nel recupero delle funzioni MCP: {response.status_code} - {response.text}")
-                    return []
+            client = self._get_http_client()
+            response = await client.get("/functions")
+            
+            if response.status_code == 200:
+                return response.json()
+            else:
+                logger.error(f"Errore nel recupero delle funzioni MCP: {response.status_code} - {response.text}")
+                return []
         
         except Exception as e:
             logger.error(f"Eccezione durante il recupero delle funzioni MCP: {str(e)}")
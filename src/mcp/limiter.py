@@ -0,0 +1,210 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional
+
+from src.core.config import settings
+from src.core.metrics import metrics
+
+# Campioni della media di lungo periodo delle latenze e campioni minimi prima
+# di valutare la congestione dalla latenza
+LATENCY_LONG_WINDOW = 100
+LATENCY_WARMUP_SAMPLES = 20
+
+class AdaptiveLimiter:
+    """
+    Semaforo con limite di concorrenza adattivo (AIMD).
+    
+    Il limite cresce di circa 1 ogni `limit` richieste completate senza segnali
+    di sovraccarico (incremento additivo) e viene moltiplicato per
+    MCP_ADAPTIVE_DECREASE_FACTOR quando il server risponde 429/503, va in timeout
+    o la latenza media recente supera di MCP_ADAPTIVE_LATENCY_TOLERANCE volte
+    quella di lungo periodo (decremento moltiplicativo). Il confronto tra le due
+    medie mobili, come in Gradient2, non scambia per congestione la variabilità
+    naturale delle latenze (es. le risposte dei modelli). Con
+    latency_sensitive=False contano solo gli errori di sovraccarico.
+    """
+    
+    def __init__(self, name: str, max_limit: int, adaptive: bool = True, latency_sensitive: bool = True):
+        self.name = name
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(settings.MCP_ADAPTIVE_MIN_CONCURRENCY, self.max_limit))
+        self.adaptive = adaptive
+        self.latency_sensitive = latency_sensitive
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._latency_ewma: Optional[float] = None
+        self._latency_long: Optional[float] = None
+        self._samples = 0
+        self._last_decrease = 0.0
+        self._publish()
+    
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+    
+    async def acquire(self) -> None:
+        """
+        Attende uno slot libero entro il limite corrente.
+        """
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            self._publish()
+            return
+        
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self._publish()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future in self._waiters:
+                self._waiters.remove(future)
+            elif future.done() and not future.cancelled():
+                # Lo slot era già stato assegnato: va restituito
+                self.in_flight -= 1
+                self._wake()
+            self._publish()
+            raise
+    
+    def release(self, latency: Optional[float] = None, overloaded: bool = False) -> None:
+        """
+        Libera uno slot e aggiorna il limite con l'esito della richiesta.
+        """
+        self.in_flight -= 1
+        if latency is not None and self.adaptive:
+            self._record(latency, overloaded)
+        self._wake()
+        self._publish()
+    
+    def _record(self, latency: float, overloaded: bool) -> None:
+        self._samples += 1
+        self._latency_ewma = latency if self._latency_ewma is None else 0.8 * self._latency_ewma + 0.2 * latency
+        
+        # Media di lungo periodo: si adatta lentamente ai cambi di latenza e
+        # scende più in fretta quando la congestione è rientrata
+        if self._latency_long is None:
+            self._latency_long = latency
+        else:
+            self._latency_long += (latency - self._latency_long) / LATENCY_LONG_WINDOW
+            if self._latency_long > self._latency_ewma * 2:
+                self._latency_long = 0.9 * self._latency_long + 0.1 * self._latency_ewma
+        
+        congested = (
+            self.latency_sensitive
+            and self._samples >= LATENCY_WARMUP_SAMPLES
+            and self._latency_ewma > self._latency_long * settings.MCP_ADAPTIVE_LATENCY_TOLERANCE
+        )
+        now = time.monotonic()
+        
+        if overloaded or congested:
+            # Un solo decremento per tempo di risposta medio (come per TCP), per non
+            # azzerare il limite a causa delle risposte di richieste già in volo
+            if now - self._last_decrease >= self._latency_ewma:
+                self.limit = max(self.min_limit, self.limit * settings.MCP_ADAPTIVE_DECREASE_FACTOR)
+                self._last_decrease = now
+                metrics.inc("mcp_concurrency_decreases_total", limiter=self.name)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+    
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            future = self._waiters.popleft()
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+    
+    def _publish(self) -> None:
+        metrics.set_gauge("mcp_queue_depth", len(self._waiters), limiter=self.name)
+        metrics.set_gauge("mcp_in_flight", self.in_flight, limiter=self.name)
+        metrics.set_gauge("mcp_concurrency_limit", int(self.limit), limiter=self.name)
+
+class RequestSlot:
+    """
+    Slot di esecuzione di una richiesta MCP; il chiamante segnala il sovraccarico del server.
+    
+    latency può essere impostata dal chiamante quando la durata dello slot non è
+    rappresentativa (es. per lo streaming conta il tempo fino al primo evento).
+    """
+    
+    def __init__(self):
+        self.overloaded = False
+        self.latency: Optional[float] = None
+
+class ConcurrencyLimits:
+    """
+    Limiti di concorrenza globali e per funzione delle chiamate MCP.
+    
+    Lo slot della funzione viene acquisito prima di quello globale, così una funzione
+    lenta in coda non occupa posti globali a scapito delle funzioni veloci.
+    """
+    
+    def __init__(self):
+        self._global: Optional[AdaptiveLimiter] = None
+        self._functions: Dict[str, AdaptiveLimiter] = {}
+    
+    def get_global_limiter(self) -> AdaptiveLimiter:
+        if self._global is None:
+            # Le latenze delle diverse funzioni non sono confrontabili: il limite globale
+            # reagisce solo agli errori di sovraccarico
+            self._global = AdaptiveLimiter(
+                "__global__",
+                settings.MCP_MAX_CONCURRENCY,
+                adaptive=settings.MCP_ADAPTIVE_LIMITS,
+                latency_sensitive=False,
+            )
+        return self._global
+    
+    def get_function_limiter(self, function_name: str) -> AdaptiveLimiter:
+        limiter = self._functions.get(function_name)
+        if limiter is None:
+            max_limit = settings.MCP_FUNCTION_MAX_CONCURRENCY.get(
+                function_name,
+                settings.MCP_DEFAULT_FUNCTION_CONCURRENCY,
+            )
+            limiter = self._functions[function_name] = AdaptiveLimiter(
+                function_name,
+                max_limit,
+                adaptive=settings.MCP_ADAPTIVE_LIMITS,
+            )
+        return limiter
+    
+    @asynccontextmanager
+    async def slot(self, function_name: str) -> AsyncIterator[RequestSlot]:
+        """
+        Esegue il blocco entro i limiti di concorrenza della funzione e globali.
+        """
+        function_limiter = self.get_function_limiter(function_name)
+        global_limiter = self.get_global_limiter()
+        
+        queued_at = time.monotonic()
+        await function_limiter.acquire()
+        try:
+            await global_limiter.acquire()
+        except BaseException:
+            function_limiter.release()
+            raise
+        
+        started_at = time.monotonic()
+        metrics.observe("mcp_queue_wait_seconds", started_at - queued_at, function=function_name)
+        
+        slot = RequestSlot()
+        latency = None
+        try:
+            yield slot
+            latency = time.monotonic() - started_at
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            latency = time.monotonic() - started_at
+            raise
+        finally:
+            if latency is not None and slot.latency is not None:
+                latency = slot.latency
+            global_limiter.release(latency, slot.overloaded)
+            function_limiter.release(latency, slot.overloaded)
+
+# Limiti di concorrenza delle chiamate MCP del processo
+mcp_limits = ConcurrencyLimits()
@@ -0,0 +1,244 @@
+import asyncio
+import fnmatch
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from src.core.config import settings
+from src.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class MCPRequestError(Exception):
+    """
+    Errore di una richiesta al server MCP.
+    
+    retryable indica se la richiesta può essere ripetuta (errori di rete, timeout,
+    5xx, 429); gli errori non ripetibili (4xx) non contano come guasti del server.
+    """
+    
+    def __init__(
+        self,
+        message: str,
+        status_code: Optional[int] = None,
+        retryable: bool = True,
+        retry_after: Optional[float] = None,
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+class CircuitOpenError(MCPRequestError):
+    """
+    Richiesta rifiutata perché il circuit breaker della funzione è aperto.
+    """
+    
+    def __init__(self, function_name: str):
+        super().__init__(f"Circuit breaker aperto per la funzione MCP {function_name}", retryable=False)
+
+class CircuitBreaker:
+    """
+    Circuit breaker per una funzione MCP.
+    
+    Dopo MCP_BREAKER_FAILURE_THRESHOLD guasti consecutivi il circuito si apre e le
+    richieste falliscono subito per MCP_BREAKER_RESET_TIMEOUT secondi; poi il
+    circuito passa a semi-aperto e lascia passare un numero limitato di richieste
+    di prova: un successo lo richiude, un guasto lo riapre.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._publish()
+    
+    def allow_request(self) -> bool:
+        """
+        Indica se una richiesta può essere inviata, riservando uno slot di prova se semi-aperto.
+        """
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            if now - self._opened_at < settings.MCP_BREAKER_RESET_TIMEOUT:
+                return False
+            self._opened_at = now
+            self._set_state(self.HALF_OPEN)
+        
+        if self.state == self.HALF_OPEN:
+            if self._half_open_calls >= settings.MCP_BREAKER_HALF_OPEN_MAX_CALLS:
+                # Le prove senza esito (es. annullate) non devono bloccare il circuito per sempre
+                if now - self._opened_at < settings.MCP_BREAKER_RESET_TIMEOUT:
+                    return False
+                self._opened_at = now
+                self._half_open_calls = 0
+            self._half_open_calls += 1
+        
+        return True
+    
+    def record_success(self) -> None:
+        self._failures = 0
+        if self.state != self.CLOSED:
+            self._set_state(self.CLOSED)
+    
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= settings.MCP_BREAKER_FAILURE_THRESHOLD:
+            if self.state != self.OPEN:
+                logger.warning(f"Circuit breaker aperto per la funzione MCP {self.name}")
+                metrics.inc("mcp_circuit_opened_total", function=self.name)
+            self._opened_at = time.monotonic()
+            self._set_state(self.OPEN)
+    
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        self._half_open_calls = 0
+        self._publish()
+    
+    def _publish(self) -> None:
+        metrics.set_gauge("mcp_circuit_state", self._STATE_VALUES[self.state], function=self.name)
+
+class ResilienceLayer:
+    """
+    Retry con backoff esponenziale e jitter, richieste hedged e circuit breaker
+    per le chiamate MCP.
+    
+    Retry e hedging si applicano solo alle funzioni idempotenti elencate in
+    MCP_IDEMPOTENT_FUNCTIONS; il circuit breaker si applica a tutte le funzioni.
+    """
+    
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+    
+    def get_breaker(self, function_name: str) -> CircuitBreaker:
+        breaker = self._breakers.get(function_name)
+        if breaker is None:
+            breaker = self._breakers[function_name] = CircuitBreaker(function_name)
+        return breaker
+    
+    @staticmethod
+    def is_idempotent(function_name: str) -> bool:
+        return any(
+            fnmatch.fnmatchcase(function_name, pattern)
+            for pattern in settings.MCP_IDEMPOTENT_FUNCTIONS
+        )
+    
+    async def execute(
+        self,
+        function_name: str,
+        attempt: Callable[[], Awaitable[T]],
+        idempotent: Optional[bool] = None,
+    ) -> T:
+        """
+        Esegue una richiesta applicando circuit breaker, retry e hedging.
+        
+        function_name identifica circuit breaker e latenze; idempotent, se
+        indicato, sostituisce la verifica su MCP_IDEMPOTENT_FUNCTIONS.
+        """
+        breaker = self.get_breaker(function_name)
+        if idempotent is None:
+            idempotent = self.is_idempotent(function_name)
+        max_attempts = max(1, settings.MCP_RETRY_MAX_ATTEMPTS) if idempotent else 1
+        
+        for attempt_number in range(1, max_attempts + 1):
+            if not breaker.allow_request():
+                metrics.inc("mcp_circuit_rejected_total", function=function_name)
+                raise CircuitOpenError(function_name)
+            
+            try:
+                if idempotent and settings.MCP_HEDGING_ENABLED:
+                    result = await self._hedged(function_name, attempt)
+                else:
+                    result = await self._timed(function_name, attempt)
+            except MCPRequestError as e:
+                if e.retryable:
+                    breaker.record_failure()
+                else:
+                    # Il server ha risposto: l'errore riguarda la richiesta, non la sua disponibilità
+                    breaker.record_success()
+                
+                if not e.retryable or attempt_number == max_attempts:
+                    raise
+                
+                delay = self._backoff(attempt_number, e.retry_after)
+                metrics.inc("mcp_retries_total", function=function_name)
+                logger.warning(
+                    f"Nuovo tentativo {attempt_number + 1}/{max_attempts} per la funzione MCP "
+                    f"{function_name} tra {delay:.2f}s: {str(e)}"
+                )
+                await asyncio.sleep(delay)
+            else:
+                breaker.record_success()
+                return result
+    
+    async def _timed(self, function_name: str, attempt: Callable[[], Awaitable[T]]) -> T:
+        started_at = time.monotonic()
+        result = await attempt()
+        metrics.observe("mcp_request_seconds", time.monotonic() - started_at, function=function_name)
+        return result
+    
+    async def _hedged(self, function_name: str, attempt: Callable[[], Awaitable[T]]) -> T:
+        """
+        Invia una seconda richiesta identica se la prima supera il p95 delle latenze
+        recenti, e restituisce la prima risposta riuscita.
+        """
+        delay = self._hedge_delay(function_name)
+        if delay is None:
+            return await self._timed(function_name, attempt)
+        
+        tasks = [asyncio.ensure_future(self._timed(function_name, attempt))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                metrics.inc("mcp_hedged_requests_total", function=function_name)
+                tasks.append(asyncio.ensure_future(self._timed(function_name, attempt)))
+            
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    @staticmethod
+    def _hedge_delay(function_name: str) -> Optional[float]:
+        if metrics.sample_count("mcp_request_seconds", function=function_name) < settings.MCP_HEDGE_MIN_SAMPLES:
+            return None
+        return metrics.percentile("mcp_request_seconds", settings.MCP_HEDGE_PERCENTILE, function=function_name)
+    
+    @staticmethod
+    def _backoff(attempt_number: int, retry_after: Optional[float] = None) -> float:
+        """
+        Backoff esponenziale con full jitter, rispettando l'eventuale Retry-After del server.
+        """
+        ceiling = min(settings.MCP_RETRY_MAX_DELAY, settings.MCP_RETRY_BASE_DELAY * 2 ** (attempt_number - 1))
+        delay = random.uniform(0, ceiling)
+        if retry_after:
+            delay = max(delay, min(retry_after, settings.MCP_RETRY_MAX_DELAY))
+        return delay
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Restituisce lo stato dei circuit breaker per funzione.
+        """
+        return {name: breaker.state for name, breaker in self._breakers.items()}
+
+# Livello di resilienza delle chiamate MCP
+mcp_resilience = ResilienceLayer()
@@ -0,0 +1,162 @@
+import asyncio
+import copy
+import json
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from src.core.config import settings
+from src.core.metrics import metrics
+from src.core.redis import get_redis
+from src.mcp.cache import canonicalize
+
+logger = logging.getLogger(__name__)
+
+# Rilascia il lock solo se è ancora posseduto da chi lo ha acquisito
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+class _LeaderCancelled(Exception):
+    """
+    La chiamata che eseguiva fn è stata annullata prima di produrre un risultato.
+    """
+
+class SingleFlight:
+    """
+    De-duplicazione delle chiamate concorrenti identiche (single-flight).
+    
+    Le chiamate con la stessa chiave avviate mentre una è già in corso attendono
+    il risultato di quella, invece di eseguire una nuova richiesta. La variante
+    distribuita estende il meccanismo a più worker tramite un lock Redis.
+    """
+    
+    def __init__(self):
+        self._inflight: Dict[Tuple[int, str], asyncio.Future] = {}
+    
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Dict[str, Any]]],
+        label: str = "",
+    ) -> Dict[str, Any]:
+        """
+        Esegue fn una sola volta per le chiamate concorrenti con la stessa chiave nel processo.
+        """
+        loop = asyncio.get_running_loop()
+        # I future sono legati al loop: la chiave include l'identità del loop corrente
+        inflight_key = (id(loop), key)
+        
+        future = self._inflight.get(inflight_key)
+        while future is not None:
+            metrics.inc("mcp_singleflight_coalesced_total", function=label, scope="local")
+            try:
+                result = await asyncio.shield(future)
+            except _LeaderCancelled:
+                # Il chiamante che eseguiva fn è stato annullato: chi attendeva non
+                # lo è, e riprova diventando a sua volta leader o seguendo il nuovo
+                future = self._inflight.get(inflight_key)
+                continue
+            return copy.deepcopy(result)
+        
+        future = loop.create_future()
+        # Evita l'avviso "exception was never retrieved" quando nessuno è in attesa
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[inflight_key] = future
+        
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._inflight.get(inflight_key) is future:
+                del self._inflight[inflight_key]
+    
+    async def do_distributed(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Dict[str, Any]]],
+        label: str = "",
+    ) -> Dict[str, Any]:
+        """
+        Come do(), ma coordinando anche i worker di processi diversi tramite Redis.
+        
+        Il primo worker che acquisisce il lock esegue fn e pubblica il risultato;
+        gli altri attendono il risultato fino a MCP_SINGLEFLIGHT_WAIT_TIMEOUT secondi
+        e, se non arriva, eseguono la chiamata in autonomia.
+        """
+        return await self.do(key, lambda: self._run_distributed(key, fn, label), label)
+    
+    async def _run_distributed(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Dict[str, Any]]],
+        label: str,
+    ) -> Dict[str, Any]:
+        lock_key = f"mcp:singleflight:lock:{key}"
+        result_key = f"mcp:singleflight:result:{key}"
+        token = uuid.uuid4().hex
+        
+        try:
+            redis_client = get_redis()
+            acquired = await redis_client.set(
+                lock_key,
+                token,
+                nx=True,
+                px=int(settings.MCP_SINGLEFLIGHT_LOCK_TTL * 1000),
+            )
+        except Exception as e:
+            logger.warning(f"Lock Redis single-flight non disponibile, esecuzione locale: {str(e)}")
+            return await fn()
+        
+        if acquired:
+            try:
+                # Un risultato rimasto da un volo precedente non deve essere letto da chi attende questo
+                await redis_client.delete(result_key)
+                result = await fn()
+                try:
+                    await redis_client.set(
+                        result_key,
+                        canonicalize(result),
+                        px=int(settings.MCP_SINGLEFLIGHT_RESULT_TTL * 1000),
+                    )
+                except Exception as e:
+                    logger.warning(f"Errore nella pubblicazione del risultato single-flight: {str(e)}")
+                return result
+            finally:
+                try:
+                    await redis_client.eval(_RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+                except Exception as e:
+                    logger.warning(f"Errore nel rilascio del lock single-flight: {str(e)}")
+        
+        deadline = time.monotonic() + settings.MCP_SINGLEFLIGHT_WAIT_TIMEOUT
+        try:
+            while time.monotonic() < deadline:
+                value = await redis_client.get(result_key)
+                if value is not None:
+                    metrics.inc("mcp_singleflight_coalesced_total", function=label, scope="redis")
+                    return json.loads(value)
+                
+                # Il worker che possedeva il lock è terminato senza pubblicare un risultato
+                if not await redis_client.exists(lock_key):
+                    break
+                
+                await asyncio.sleep(settings.MCP_SINGLEFLIGHT_POLL_INTERVAL)
+        except Exception as e:
+            logger.warning(f"Errore nell'attesa del risultato single-flight: {str(e)}")
+        
+        return await fn()
+
+# Istanza del gestore single-flight
+mcp_singleflight = SingleFlight()
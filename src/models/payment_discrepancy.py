@@ -0,0 +1,33 @@
+from sqlalchemy import Column, String, Float, Boolean, DateTime, ForeignKey, JSON, Index
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import relationship
+
+from src.models.base import BaseModel
+
+class PaymentDiscrepancy(BaseModel):
+    """
+    Modello per le discrepanze tra i pagamenti di un provider (Stripe, PayPal)
+    e gli ordini, rilevate dalla riconciliazione dei pagamenti.
+    """
+    __table_args__ = (
+        Index("ix_paymentdiscrepancys_integration_occurred", "integration_id", "occurred_at"),
+    )
+    
+    provider = Column(String, nullable=False)  # stripe, paypal
+    kind = Column(String, nullable=False)  # amount_mismatch, currency_mismatch, missing_payment, unmatched_payment
+    order_reference = Column(String, nullable=True)  # Riferimento all'ordine nei metadati del pagamento
+    payment_ids = Column(JSON, nullable=True)  # ID dei pagamenti presso il provider
+    expected_amount = Column(Float, nullable=True)  # Importo atteso dall'ordine
+    actual_amount = Column(Float, nullable=True)  # Importo netto incassato
+    currency = Column(String, nullable=True)
+    occurred_at = Column(DateTime, nullable=False)  # Data del pagamento o dell'ordine (UTC)
+    is_resolved = Column(Boolean, default=False, nullable=False)
+    
+    # Relazioni
+    integration_id = Column(UUID(as_uuid=True), ForeignKey("integrations.id", ondelete="CASCADE"), nullable=False)
+    integration = relationship("Integration")
+    order_id = Column(UUID(as_uuid=True), ForeignKey("orders.id", ondelete="SET NULL"), nullable=True)
+    order = relationship("Order")
+    
+    def __repr__(self):
+        return f"<PaymentDiscrepancy {self.provider} {self.kind} ({self.order_reference})>"
@@ -0,0 +1,27 @@
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import relationship
+
+from src.models.base import BaseModel
+
+class SyncState(BaseModel):
+    """
+    Modello per lo stato della sincronizzazione incrementale di una risorsa
+    (prodotti, ordini, clienti) di un negozio con il marketplace.
+    """
+    __table_args__ = (
+        UniqueConstraint("store_id", "resource", name="uq_syncstates_store_resource"),
+    )
+    
+    resource = Column(String, nullable=False)  # products, orders, customers
+    last_synced_at = Column(DateTime, nullable=True)  # Inizio dell'ultima sincronizzazione riuscita (UTC)
+    last_full_sync_at = Column(DateTime, nullable=True)  # Inizio dell'ultima riconciliazione completa (UTC)
+    cursor = Column(String, nullable=True)  # Filtro inviato al marketplace nell'ultima sincronizzazione
+    items_synced = Column(Integer, default=0, nullable=False)  # Elementi ricevuti nell'ultima sincronizzazione
+    
+    # Relazioni
+    store_id = Column(UUID(as_uuid=True), ForeignKey("stores.id", ondelete="CASCADE"), nullable=False)
+    store = relationship("Store")
+    
+    def __repr__(self):
+        return f"<SyncState {self.store_id} {self.resource} ({self.last_synced_at})>"
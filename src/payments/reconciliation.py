@@ -0,0 +1,323 @@
+import logging
+from datetime import datetime, timezone
+from typing import Any, AsyncIterable, AsyncIterator, Dict, List, Optional
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.models.integration import Integration
+from src.models.order import Order, OrderStatus
+from src.models.payment_discrepancy import PaymentDiscrepancy
+from src.models.store import Store
+
+logger = logging.getLogger(__name__)
+
+# Chiavi dei metadati Stripe con il riferimento all'ordine, in ordine di priorità
+ORDER_METADATA_KEYS = ("order_id", "order_number")
+
+# Valute Stripe senza decimali: gli importi non sono in centesimi
+ZERO_DECIMAL_CURRENCIES = {
+    "BIF", "CLP", "DJF", "GNF", "JPY", "KMF", "KRW", "MGA",
+    "PYG", "RWF", "UGX", "VND", "VUV", "XAF", "XOF", "XPF",
+}
+
+# Differenza massima tollerata tra importo atteso e incassato
+AMOUNT_TOLERANCE = 0.01
+
+# Ordini letti per blocco dal cursore lato server e discrepanze per INSERT multiplo
+ORDERS_STREAM_BATCH_SIZE = 1000
+DISCREPANCY_BATCH_SIZE = 1000
+
+# Ordini per cui non è atteso alcun incasso netto
+_UNPAID_STATUSES = (OrderStatus.CANCELLED, OrderStatus.REFUNDED)
+
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def stripe_payment_record(payment_intent: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Normalizza un PaymentIntent Stripe riuscito: importo netto dei rimborsi
+    (dall'addebito latest_charge espanso o dalla lista charges delle versioni
+    dell'API precedenti) e riferimento all'ordine dai metadati.
+    """
+    if payment_intent.get("status") != "succeeded":
+        return None
+    
+    refunded = 0
+    latest_charge = payment_intent.get("latest_charge")
+    if isinstance(latest_charge, dict):
+        refunded = latest_charge.get("amount_refunded") or 0
+    else:
+        charges = (payment_intent.get("charges") or {}).get("data") or []
+        refunded = sum(charge.get("amount_refunded") or 0 for charge in charges)
+    
+    currency = (payment_intent.get("currency") or "").upper()
+    divisor = 1 if currency in ZERO_DECIMAL_CURRENCIES else 100
+    metadata = payment_intent.get("metadata") or {}
+    
+    return {
+        "payment_id": payment_intent["id"],
+        "order_reference": next((str(metadata[key]) for key in ORDER_METADATA_KEYS if metadata.get(key)), None),
+        "amount": ((payment_intent.get("amount_received") or 0) - refunded) / divisor,
+        "currency": currency,
+        "occurred_at": datetime.utcfromtimestamp(payment_intent["created"]),
+        "is_refund": False,
+    }
+
+def paypal_payment_record(transaction: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Normalizza una transazione PayPal completata di pagamento (T00xx) o di
+    rimborso (T11xx, con importo negativo); il riferimento all'ordine è
+    l'invoice_id o, in sua assenza, il custom_field.
+    """
+    info = transaction.get("transaction_info") or {}
+    event_code = info.get("transaction_event_code") or ""
+    if not event_code.startswith(("T00", "T11")) or info.get("transaction_status") != "S":
+        return None
+    
+    amount = info.get("transaction_amount") or {}
+    return {
+        "payment_id": info.get("transaction_id"),
+        "order_reference": info.get("invoice_id") or info.get("custom_field") or None,
+        "amount": float(amount.get("value") or 0),
+        "currency": (amount.get("currency_code") or "").upper(),
+        "occurred_at": _naive_utc(datetime.strptime(info["transaction_initiation_date"], "%Y-%m-%dT%H:%M:%S%z")),
+        "is_refund": event_code.startswith("T11"),
+    }
+
+async def iter_payment_records(
+    integration: Integration,
+    since: datetime,
+    until: datetime,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Esporta in streaming i pagamenti di un'integrazione Stripe o PayPal nella
+    finestra indicata, normalizzati per la riconciliazione.
+    
+    Per Stripe vengono restituiti anche i PaymentIntent precedenti alla finestra
+    con rimborsi nella finestra, con l'importo netto aggiornato; per PayPal i
+    rimborsi sono transazioni a sé e il pagamento originale può esserne escluso.
+    """
+    credentials = integration.credentials or {}
+    
+    if integration.provider == "stripe":
+        from src.integrations.payment.stripe_client import StripeClient
+        
+        client = StripeClient(api_key=credentials.get("api_key"))
+        seen = set()
+        async for payment_intent in client.iter_payment_intents(since, until, expand=["data.latest_charge"]):
+            seen.add(payment_intent["id"])
+            record = stripe_payment_record(payment_intent)
+            if record is not None:
+                yield record
+        
+        async for refund in client.iter_refunds(since, until, expand=["data.payment_intent.latest_charge"]):
+            payment_intent = refund.get("payment_intent")
+            if not isinstance(payment_intent, dict) or payment_intent["id"] in seen:
+                continue
+            seen.add(payment_intent["id"])
+            record = stripe_payment_record(payment_intent)
+            if record is not None:
+                yield record
+        return
+    
+    if integration.provider == "paypal":
+        from src.integrations.payment.paypal_client import PayPalClient
+        
+        client = PayPalClient(
+            client_id=credentials.get("client_id"),
+            client_secret=credentials.get("client_secret"),
+            mode=credentials.get("mode", "sandbox"),
+        )
+        try:
+            async for transaction in client.iter_transactions(since, until, transaction_status="S"):
+                record = paypal_payment_record(transaction)
+                if record is not None:
+                    yield record
+        finally:
+            client.close()
+        return
+    
+    raise ValueError(f"Provider di pagamento non supportato: {integration.provider}")
+
+def _discrepancy(
+    integration: Integration,
+    kind: str,
+    occurred_at: datetime,
+    payment: Optional[Dict[str, Any]] = None,
+    order: Optional[Any] = None,
+) -> Dict[str, Any]:
+    return {
+        "integration_id": integration.id,
+        "provider": integration.provider,
+        "kind": kind,
+        "order_id": order.id if order is not None else None,
+        "order_reference": payment["order_reference"] if payment is not None else order.order_number,
+        "payment_ids": payment["payment_ids"] if payment is not None else None,
+        "expected_amount": (0.0 if order.status in _UNPAID_STATUSES else order.total_price) if order is not None else None,
+        "actual_amount": payment["amount"] if payment is not None else None,
+        "currency": payment["currency"] if payment is not None else order.currency,
+        "occurred_at": occurred_at,
+        "is_resolved": False,
+    }
+
+async def reconcile_payments(
+    db: AsyncSession,
+    integration: Integration,
+    payments: AsyncIterable[Dict[str, Any]],
+    since: datetime,
+    until: datetime,
+) -> Dict[str, int]:
+    """
+    Riconcilia i pagamenti di un'integrazione con gli ordini dei negozi del suo utente.
+    
+    È un hash join in un solo passaggio: i pagamenti (payment_id,
+    order_reference, amount, currency, occurred_at) vengono consumati in
+    streaming e aggregati per riferimento all'ordine, poi gli ordini vengono
+    letti una sola volta con un cursore lato server e confrontati con
+    l'aggregato del loro ID o, in sua assenza, del loro numero. In memoria
+    restano solo gli aggregati dei pagamenti della finestra.
+    
+    Le discrepanze non ancora risolte della finestra [since, until) e degli
+    ordini e dei riferimenti riconciliati con il pagamento completo vengono
+    sostituite con quelle rilevate, scritte con INSERT multipli:
+    amount_mismatch e currency_mismatch per gli ordini con un incasso netto
+    diverso dal totale (zero per gli ordini annullati o rimborsati) o, se nella
+    finestra ci sono solo rimborsi del pagamento, con rimborsi superiori al
+    totale; missing_payment per gli ordini della finestra pagati con questo
+    provider senza pagamenti, unmatched_payment per i pagamenti senza ordine.
+    
+    Non esegue il commit: la transazione resta al chiamante.
+    """
+    since = _naive_utc(since)
+    until = _naive_utc(until)
+    
+    # Fase di build: aggregati dei pagamenti per riferimento all'ordine
+    aggregates: Dict[str, Dict[str, Any]] = {}
+    unreferenced: List[Dict[str, Any]] = []
+    payments_count = 0
+    async for payment in payments:
+        payments_count += 1
+        reference = payment.get("order_reference")
+        aggregate = {
+            "order_reference": reference,
+            "payment_ids": [payment["payment_id"]],
+            "amount": payment["amount"],
+            "currency": payment["currency"],
+            "occurred_at": payment["occurred_at"],
+            "refund_only": payment.get("is_refund", False),
+        }
+        if not reference:
+            unreferenced.append(aggregate)
+            continue
+        
+        existing = aggregates.get(reference)
+        if existing is None:
+            aggregates[reference] = aggregate
+            continue
+        existing["payment_ids"].append(payment["payment_id"])
+        existing["amount"] += payment["amount"]
+        existing["occurred_at"] = min(existing["occurred_at"], payment["occurred_at"])
+        existing["refund_only"] = existing["refund_only"] and payment.get("is_refund", False)
+        if existing["currency"] != payment["currency"]:
+            existing["currency"] = None  # Pagamenti in valute diverse per lo stesso ordine
+    
+    # Riferimenti con il pagamento completo, riconciliati di nuovo anche se fuori finestra
+    references = [reference for reference, aggregate in aggregates.items() if not aggregate["refund_only"]]
+    
+    # Fase di probe: un passaggio sugli ordini dei negozi dell'utente
+    discrepancies: List[Dict[str, Any]] = []
+    matched_count = 0
+    reconciled_order_ids: List[Any] = []
+    orders = await db.stream(
+        select(
+            Order.id,
+            Order.order_number,
+            Order.status,
+            Order.total_price,
+            Order.currency,
+            Order.payment_method,
+            Order.created_at,
+        )
+        .where(Order.store_id.in_(select(Store.id).where(Store.owner_id == integration.user_id)))
+        .execution_options(yield_per=ORDERS_STREAM_BATCH_SIZE)
+    )
+    async for order in orders:
+        by_id = aggregates.pop(str(order.id), None)
+        by_number = aggregates.pop(order.order_number, None)
+        payment = by_id or by_number
+        if by_id is not None and by_number is not None:
+            by_id["payment_ids"].extend(by_number["payment_ids"])
+            by_id["amount"] += by_number["amount"]
+            by_id["occurred_at"] = min(by_id["occurred_at"], by_number["occurred_at"])
+            by_id["refund_only"] = by_id["refund_only"] and by_number["refund_only"]
+            if by_id["currency"] != by_number["currency"]:
+                by_id["currency"] = None
+        
+        if payment is None:
+            if (
+                order.payment_method == integration.provider
+                and since <= order.created_at < until
+                and order.status not in _UNPAID_STATUSES
+                and order.status != OrderStatus.PENDING
+            ):
+                discrepancies.append(_discrepancy(integration, "missing_payment", order.created_at, order=order))
+            continue
+        
+        matched_count += 1
+        if payment["refund_only"]:
+            # Il pagamento originale è fuori dalla finestra: i rimborsi non possono
+            # superare il totale dell'ordine
+            mismatch = -payment["amount"] > order.total_price + AMOUNT_TOLERANCE
+        else:
+            reconciled_order_ids.append(order.id)
+            expected = 0.0 if order.status in _UNPAID_STATUSES else order.total_price
+            mismatch = abs(payment["amount"] - expected) > AMOUNT_TOLERANCE
+        
+        if payment["currency"] != (order.currency or "").upper():
+            discrepancies.append(_discrepancy(integration, "currency_mismatch", payment["occurred_at"], payment, order))
+        elif mismatch:
+            discrepancies.append(_discrepancy(integration, "amount_mismatch", payment["occurred_at"], payment, order))
+    
+    for payment in [*aggregates.values(), *unreferenced]:
+        discrepancies.append(_discrepancy(integration, "unmatched_payment", payment["occurred_at"], payment))
+    
+    # Sostituisce in blocco le discrepanze aperte della finestra e quelle, anche
+    # precedenti, degli ordini e dei riferimenti riconciliati con il pagamento completo
+    open_discrepancies = delete(PaymentDiscrepancy).where(
+        PaymentDiscrepancy.integration_id == integration.id,
+        PaymentDiscrepancy.is_resolved == False,
+    ).execution_options(synchronize_session=False)
+    await db.execute(
+        open_discrepancies.where(
+            PaymentDiscrepancy.occurred_at >= since,
+            PaymentDiscrepancy.occurred_at < until,
+        )
+    )
+    for start in range(0, len(reconciled_order_ids), DISCREPANCY_BATCH_SIZE):
+        await db.execute(
+            open_discrepancies.where(
+                PaymentDiscrepancy.order_id.in_(reconciled_order_ids[start:start + DISCREPANCY_BATCH_SIZE])
+            )
+        )
+    for start in range(0, len(references), DISCREPANCY_BATCH_SIZE):
+        await db.execute(
+            open_discrepancies.where(
+                PaymentDiscrepancy.order_reference.in_(references[start:start + DISCREPANCY_BATCH_SIZE])
+            )
+        )
+    for start in range(0, len(discrepancies), DISCREPANCY_BATCH_SIZE):
+        await db.execute(insert(PaymentDiscrepancy), discrepancies[start:start + DISCREPANCY_BATCH_SIZE])
+    
+    logger.info(
+        f"Pagamenti dell'integrazione {integration.id} ({integration.provider}) riconciliati: "
+        f"{payments_count} pagamenti, {matched_count} ordini associati, {len(discrepancies)} discrepanze"
+    )
+    
+    return {
+        "payments_count": payments_count,
+        "matched_count": matched_count,
+        "discrepancies_count": len(discrepancies),
+    }
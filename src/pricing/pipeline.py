@@ -0,0 +1,210 @@
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import Float, column, select, update, values
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.agents.pricing.agent import pricing_agent
+from src.core.config import settings
+from src.inventory.sync_state import get_sync_state
+from src.models.product import Product
+from src.models.store import Store
+from src.pricing.publisher import PricePublisher
+
+logger = logging.getLogger(__name__)
+
+# Risorsa di SyncState in cui viene salvato il checkpoint del repricing
+PRICING_RESOURCE = "pricing"
+
+# Righe per singolo UPDATE ... FROM (VALUES ...): 3 parametri per riga, entro il
+# limite di 32767 parametri per istruzione di PostgreSQL
+PRICE_UPDATE_BATCH_SIZE = 5000
+
+def compute_price_changes(
+    rows: List[Tuple[UUID, Optional[str], float]],
+    optimization_results: List[Dict[str, Any]],
+    threshold: float,
+) -> List[Tuple[UUID, float, float]]:
+    """
+    Restituisce le terne (id, nuovo prezzo, prezzo precedente) dei prodotti il cui
+    prezzo ottimizzato si discosta dall'attuale più della soglia relativa.
+    """
+    changes = []
+    for (product_id, _, price), optimization_result in zip(rows, optimization_results):
+        if not optimization_result.get("success") or "optimized_price" not in optimization_result:
+            continue
+        if not price:
+            continue
+        
+        optimized_price = optimization_result["optimized_price"]
+        if abs(optimized_price - price) / price > threshold:
+            changes.append((product_id, optimized_price, price))
+    return changes
+
+async def apply_price_changes(db: AsyncSession, changes: List[Tuple[UUID, float, float]]) -> int:
+    """
+    Applica i nuovi prezzi con UPDATE ... FROM (VALUES ...) a blocchi, spostando
+    il prezzo precedente in compare_at_price.
+    
+    Non esegue il commit: la transazione resta al chiamante.
+    """
+    now = datetime.utcnow()
+    for start in range(0, len(changes), PRICE_UPDATE_BATCH_SIZE):
+        chunk = changes[start:start + PRICE_UPDATE_BATCH_SIZE]
+        new_prices = values(
+            column("id", PG_UUID(as_uuid=True)),
+            column("price", Float),
+            column("compare_at_price", Float),
+            name="new_prices",
+        ).data(chunk)
+        
+        await db.execute(
+            update(Product)
+            .where(Product.id == new_prices.c.id)
+            .values(price=new_prices.c.price, compare_at_price=new_prices.c.compare_at_price, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+    
+    return len(changes)
+
+async def _fetch_page(
+    db: AsyncSession,
+    store_id: UUID,
+    after: Optional[UUID],
+    page_size: int,
+) -> List[Tuple[UUID, Optional[str], float]]:
+    """
+    Legge una pagina della proiezione (id, sku, prezzo) in ordine di id, a partire
+    dall'id successivo ad after (paginazione keyset, riprendibile).
+    """
+    query = select(Product.id, Product.sku, Product.price).where(Product.store_id == store_id)
+    if after is not None:
+        query = query.where(Product.id > after)
+    
+    result = await db.execute(query.order_by(Product.id).limit(page_size))
+    return [tuple(row) for row in result.all()]
+
+async def _optimize_page(store_id: UUID, rows: List[Tuple[UUID, Optional[str], float]]) -> List[Dict[str, Any]]:
+    return await pricing_agent.optimize_prices(
+        product_ids=[str(product_id) for product_id, _, _ in rows],
+        store_id=str(store_id),
+    )
+
+async def run_pricing_pipeline(
+    db: AsyncSession,
+    store: Store,
+    page_size: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    publisher: Optional[PricePublisher] = None,
+) -> Dict[str, Any]:
+    """
+    Ottimizza i prezzi di tutti i prodotti di un negozio.
+    
+    I prodotti vengono letti a pagine e ottimizzati con al più `concurrency`
+    pagine in corso contemporaneamente; le pagine completate vengono applicate
+    in ordine con un UPDATE in blocco, seguito dal commit e dal checkpoint
+    (ultimo id elaborato, in SyncState). Se un'esecuzione si interrompe, la
+    successiva riprende dal checkpoint purché più recente di
+    PRICING_CHECKPOINT_MAX_AGE_HOURS.
+    
+    Con un publisher i nuovi prezzi di ogni pagina vengono pubblicati sul
+    marketplace prima del commit: in caso di interruzione la pagina viene
+    ripubblicata, mai persa. Nel database vengono applicati solo i prezzi
+    pubblicati (o dei prodotti assenti dal marketplace): quelli non pubblicati
+    vengono ritentati dall'esecuzione successiva.
+    """
+    page_size = page_size or settings.PRICING_PAGE_SIZE
+    concurrency = concurrency or settings.PRICING_CONCURRENCY
+    threshold = (store.settings or {}).get("price_change_threshold", 0.05)
+    
+    started_at = datetime.utcnow()
+    state = await get_sync_state(db, store.id, PRICING_RESOURCE)
+    
+    after: Optional[UUID] = None
+    resumed = False
+    if state.cursor and state.updated_at and started_at - state.updated_at < timedelta(
+        hours=settings.PRICING_CHECKPOINT_MAX_AGE_HOURS
+    ):
+        after = UUID(state.cursor)
+        resumed = True
+        logger.info(f"Repricing del negozio {store.id} ripreso dal prodotto {after}")
+    
+    products_count = 0
+    updated_count = 0
+    publish_outcomes: List[Dict[str, Any]] = []
+    in_flight: Deque[Tuple[List[Tuple[UUID, Optional[str], float]], asyncio.Task]] = deque()
+    exhausted = False
+    
+    try:
+        while in_flight or not exhausted:
+            # Riempie la finestra di pagine in ottimizzazione
+            while not exhausted and len(in_flight) < concurrency:
+                rows = await _fetch_page(db, store.id, after, page_size)
+                if not rows:
+                    exhausted = True
+                    break
+                after = rows[-1][0]
+                in_flight.append((rows, asyncio.create_task(_optimize_page(store.id, rows))))
+            
+            if not in_flight:
+                break
+            
+            # Applica le pagine nell'ordine di lettura, così il checkpoint è sempre
+            # l'ultimo id di una pagina interamente elaborata
+            rows, task = in_flight.popleft()
+            optimization_results = await task
+            
+            changes = compute_price_changes(rows, optimization_results, threshold)
+            if publisher is not None and changes:
+                skus = {product_id: sku for product_id, sku, _ in rows}
+                outcomes = await publisher.publish([
+                    {"product_id": product_id, "sku": skus[product_id], "price": price, "compare_at_price": compare_at_price}
+                    for product_id, price, compare_at_price in changes
+                ])
+                publish_outcomes.extend(outcomes)
+                
+                # I prezzi non pubblicati restano invariati nel database, così
+                # l'esecuzione successiva li ricalcola e ritenta la pubblicazione
+                changes = [
+                    change for change, outcome in zip(changes, outcomes)
+                    if outcome["success"] or outcome.get("not_found")
+                ]
+            
+            updated_count += await apply_price_changes(db, changes)
+            products_count += len(rows)
+            state.cursor = str(rows[-1][0])
+            state.items_synced = products_count
+            await db.commit()
+    
+    finally:
+        for _, task in in_flight:
+            task.cancel()
+    
+    # Esecuzione completata: il checkpoint viene azzerato
+    state.cursor = None
+    state.last_synced_at = started_at
+    state.last_full_sync_at = started_at
+    await db.commit()
+    
+    logger.info(
+        f"Prezzi del negozio {store.id} ottimizzati: "
+        f"{updated_count} prodotti aggiornati su {products_count}"
+    )
+    
+    result = {
+        "products_count": products_count,
+        "updated_count": updated_count,
+        "resumed": resumed,
+    }
+    if publisher is not None:
+        result["published_count"] = sum(1 for outcome in publish_outcomes if outcome["success"])
+        result["publish_failures"] = [
+            outcome for outcome in publish_outcomes if not outcome["success"] and not outcome.get("not_found")
+        ]
+        result["not_found_count"] = sum(1 for outcome in publish_outcomes if outcome.get("not_found"))
+    return result
@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.core.config import settings
+from src.integrations.registry import marketplace_clients
+from src.models.store import Store
+
+logger = logging.getLogger(__name__)
+
+class PricePublisher:
+    """
+    Pubblica in blocco sul marketplace del negozio i prezzi aggiornati dal
+    pricing dinamico.
+    
+    I prodotti vengono associati a quelli del marketplace tramite SKU, con un
+    indice costruito una sola volta per istanza scorrendo il catalogo. Insieme al
+    prezzo viene pubblicato il prezzo precedente (compare_at_price), come nel
+    database: compareAtPrice su Shopify, regular_price con il nuovo prezzo come
+    sale_price su WooCommerce quando il prezzo scende. WooCommerce
+    viene aggiornato con products/batch (100 prodotti per richiesta), Shopify con
+    una mutation productVariantsBulkUpdate per prodotto, rispettando il budget di
+    costo dell'API GraphQL. Ogni prezzo ha il proprio esito.
+    """
+    
+    def __init__(self, store: Store, concurrency: Optional[int] = None):
+        self.store = store
+        self.concurrency = concurrency or settings.PRICE_PUBLISH_CONCURRENCY
+        self._client: Any = None
+        self._sku_index: Optional[Dict[str, Any]] = None
+        
+        # Stato del leaky bucket GraphQL di Shopify, aggiornato da ogni risposta
+        self._available: Optional[float] = None
+        self._maximum: float = 1000.0
+        self._restore_rate: float = 50.0
+        self._updated_at: float = 0.0
+        self._budget_lock = asyncio.Lock()
+    
+    async def publish(self, updates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Pubblica i prezzi e restituisce l'esito di ciascun aggiornamento.
+        
+        Args:
+            updates: Aggiornamenti con product_id, sku, price e (opzionale) compare_at_price
+        
+        Returns:
+            Esiti con product_id, sku, success ed eventuale error (e not_found per
+            gli SKU assenti dal marketplace), nello stesso ordine
+        """
+        if not updates:
+            return []
+        
+        try:
+            if self.store.platform == "shopify":
+                return await self._publish_shopify(updates)
+            if self.store.platform == "woocommerce":
+                return await self._publish_woocommerce(updates)
+            return [_outcome(update, "Piattaforma non supportata") for update in updates]
+        except Exception as e:
+            logger.error(f"Errore nella pubblicazione dei prezzi del negozio {self.store.id}: {str(e)}")
+            return [_outcome(update, str(e)) for update in updates]
+    
+    async def _publish_woocommerce(self, updates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if self._client is None:
+            self._client = await marketplace_clients.get_for_store(self.store)
+        
+        if self._sku_index is None:
+            self._sku_index = {}
+            async for product in self._client.iter_products(params={"_fields": "id,sku"}):
+                if product.get("sku"):
+                    self._sku_index.setdefault(product["sku"], product["id"])
+        
+        outcomes: List[Optional[Dict[str, Any]]] = [None] * len(updates)
+        matched: Dict[str, Dict[str, Any]] = {}
+        for index, update in enumerate(updates):
+            marketplace_id = self._sku_index.get(update.get("sku"))
+            if marketplace_id is None:
+                outcomes[index] = _outcome(update, "SKU non trovato sul marketplace", not_found=True)
+            else:
+                matched[str(update["product_id"])] = {"id": marketplace_id, **_woocommerce_prices(update)}
+        
+        results = await self._client.batch_products(update=matched, concurrency=self.concurrency)
+        for index, update in enumerate(updates):
+            result = results.get(str(update["product_id"]))
+            if outcomes[index] is None and result is not None:
+                outcomes[index] = _outcome(update, None if result["success"] else result.get("error"))
+        
+        return [outcome or _outcome(update, "Esito non disponibile") for update, outcome in zip(updates, outcomes)]
+    
+    async def _publish_shopify(self, updates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if self._client is None:
+            self._client = await marketplace_clients.get_for_store(self.store)
+        
+        if self._sku_index is None:
+            self._sku_index = {}
+            async for product in self._client.iter_products(fields="id,variants"):
+                for variant in product.get("variants") or []:
+                    if variant.get("sku"):
+                        self._sku_index.setdefault(variant["sku"], (product["id"], variant["id"]))
+        
+        outcomes: List[Optional[Dict[str, Any]]] = [None] * len(updates)
+        by_product: Dict[int, List[Tuple[int, Dict[str, Any]]]] = {}
+        for index, update in enumerate(updates):
+            ids = self._sku_index.get(update.get("sku"))
+            if ids is None:
+                outcomes[index] = _outcome(update, "SKU non trovato sul marketplace", not_found=True)
+            else:
+                product_id, variant_id = ids
+                variant = {"id": variant_id, "price": f"{update['price']:.2f}"}
+                if update.get("compare_at_price") is not None:
+                    variant["compareAtPrice"] = f"{update['compare_at_price']:.2f}"
+                by_product.setdefault(product_id, []).append((index, variant))
+        
+        semaphore = asyncio.Semaphore(self.concurrency)
+        
+        async def submit(product_id: int, variants: List[Tuple[int, Dict[str, Any]]]) -> None:
+            async with semaphore:
+                errors = await self._update_shopify_variants(product_id, [variant for _, variant in variants])
+            for position, (index, _) in enumerate(variants):
+                outcomes[index] = _outcome(updates[index], errors.get(position))
+        
+        await asyncio.gather(*(submit(product_id, variants) for product_id, variants in by_product.items()))
+        
+        return [outcome or _outcome(update, "Esito non disponibile") for update, outcome in zip(updates, outcomes)]
+    
+    async def _update_shopify_variants(self, product_id: int, variants: List[Dict[str, Any]]) -> Dict[int, str]:
+        """
+        Esegue la mutation per un prodotto e restituisce gli errori per posizione
+        della variante; una risposta THROTTLED viene ripetuta dopo l'attesa necessaria.
+        """
+        for attempt in range(settings.PRICE_PUBLISH_MAX_ATTEMPTS):
+            await self._wait_for_budget(settings.SHOPIFY_VARIANTS_UPDATE_COST)
+            response = await self._client.update_variant_prices(product_id, variants)
+            self._update_budget(response.get("extensions", {}).get("cost", {}))
+            
+            errors = response.get("errors") or []
+            if any((error.get("extensions") or {}).get("code") == "THROTTLED" for error in errors):
+                continue
+            if errors:
+                message = "; ".join(error.get("message", "") for error in errors)
+                return {position: message for position in range(len(variants))}
+            
+            result = (response.get("data") or {}).get("productVariantsBulkUpdate") or {}
+            position_errors: Dict[int, str] = {}
+            for user_error in result.get("userErrors") or []:
+                field = user_error.get("field") or []
+                # field ha la forma ["variants", "<posizione>", "<campo>"]
+                if len(field) > 1 and field[0] == "variants" and str(field[1]).isdigit():
+                    position_errors[int(field[1])] = user_error.get("message")
+                else:
+                    return {position: user_error.get("message") for position in range(len(variants))}
+            return position_errors
+        
+        return {position: "Limite di richieste Shopify superato" for position in range(len(variants))}
+    
+    async def _wait_for_budget(self, cost: float) -> None:
+        """
+        Attende che il bucket GraphQL abbia punti sufficienti per una richiesta
+        del costo indicato e li riserva.
+        """
+        async with self._budget_lock:
+            if self._available is None:
+                return
+            
+            available = min(self._maximum, self._available + (time.monotonic() - self._updated_at) * self._restore_rate)
+            if available < cost:
+                await asyncio.sleep((cost - available) / self._restore_rate)
+                available = cost
+            
+            self._available = available - cost
+            self._updated_at = time.monotonic()
+    
+    def _update_budget(self, cost: Dict[str, Any]) -> None:
+        throttle_status = cost.get("throttleStatus")
+        if not throttle_status:
+            return
+        
+        self._maximum = float(throttle_status.get("maximumAvailable", self._maximum))
+        self._available = float(throttle_status.get("currentlyAvailable", self._maximum))
+        self._restore_rate = float(throttle_status.get("restoreRate", self._restore_rate)) or self._restore_rate
+        self._updated_at = time.monotonic()
+
+def _woocommerce_prices(update: Dict[str, Any]) -> Dict[str, str]:
+    # WooCommerce mostra il prezzo barrato solo con un sale_price inferiore al regular_price
+    compare_at_price = update.get("compare_at_price")
+    if compare_at_price is not None and compare_at_price > update["price"]:
+        return {"regular_price": f"{compare_at_price:.2f}", "sale_price": f"{update['price']:.2f}"}
+    return {"regular_price": f"{update['price']:.2f}", "sale_price": ""}
+
+def _outcome(update: Dict[str, Any], error: Optional[str], not_found: bool = False) -> Dict[str, Any]:
+    outcome = {
+        "product_id": str(update.get("product_id")),
+        "sku": update.get("sku"),
+        "success": error is None,
+    }
+    if error is not None:
+        outcome["error"] = error
+    if not_found:
+        # Prodotto assente dal marketplace: non c'è un prezzo da tenere allineato
+        outcome["not_found"] = True
+    return outcome
@@ -0,0 +1,12 @@
+from typing import Optional, Dict, Any
+from uuid import UUID
+from pydantic import BaseModel
+
+class CustomerServiceQuery(BaseModel):
+    """
+    Schema per una domanda di un cliente al servizio clienti.
+    """
+    store_id: UUID
+    query: str
+    customer_id: Optional[UUID] = None
+    context: Optional[Dict[str, Any]] = None
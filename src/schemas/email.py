@@ -49,3 +49,12 @@ class EmailSend(BaseModel):
     customer_ids: Optional[List[UUID]] = None
     email_addresses: Optional[List[EmailStr]] = None
     context: Optional[Dict[str, Any]] = None
+
+class EmailResponseGenerate(BaseModel):
+    """
+    Schema per la generazione di una risposta a un'email.
+    """
+    store_id: UUID
+    email_content: str
+    customer_id: Optional[UUID] = None
+    tone: str = "professional"
@@ -6,6 +6,7 @@ from jinja2 import Template
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.core.celery_app import celery_app
+from src.core.worker_loop import async_task
 from src.core.config import settings
 from src.db.session import SessionLocal
 from src.models.customer import Customer
@@ -64,8 +65,7 @@ async def send_email_async(
         logger.error(f"Errore nell'invio dell'email a {recipient}: {str(e)}")
         return False
 
-@celery_app.task(name="src.tasks.email.send_email_task")
-def send_email_task(
+async def _send_email(
     template_id: str,
     store_id: str,
     customer_ids: Optional[List[str]] = None,
@@ -73,175 +73,189 @@ def send_email_task(
     context: Optional[Dict[str, Any]] = None,
 ) -> Dict[str, Any]:
     """
-    Task per inviare email utilizzando un template.
+    Invia email utilizzando un template, dal task send_email_task o
+    direttamente da altri task già in esecuzione nel loop del worker.
     """
-    async def _send_email():
-        db = SessionLocal()
-        try:
-            # Recupera il template
-            template = await db.query(EmailTemplate).filter(EmailTemplate.id == UUID(template_id)).first()
-            if not template:
-                logger.error(f"Template email {template_id} non trovato")
-                return {"success": False, "error": "Template email non trovato"}
-            
-            # Recupera il negozio
-            store = await db.query(Store).filter(Store.id == UUID(store_id)).first()
-            if not store:
-                logger.error(f"Negozio {store_id} non trovato")
-                return {"success": False, "error": "Negozio non trovato"}
-            
-            # Prepara il contesto base
-            base_context = {
-                "store_name": store.name,
-                "store_url": store.url,
-                **(context or {})
-            }
-            
-            # Recupera i clienti se sono stati specificati gli ID
-            recipients = []
-            if customer_ids:
-                customers = await db.query(Customer).filter(
-                    Customer.id.in_([UUID(cid) for cid in customer_ids]),
-                    Customer.store_id == UUID(store_id)
-                ).all()
-                
-                for customer in customers:
-                    recipients.append({
-                        "email": customer.email,
-                        "context": {
-                            **base_context,
-                            "customer_name": f"{customer.first_name or ''} {customer.last_name or ''}".strip(),
-                            "customer_email": customer.email,
-                        }
-                    })
-            
-            # Aggiungi gli indirizzi email specificati direttamente
-            if email_addresses:
-                for email in email_addresses:
-                    recipients.append({
-                        "email": email,
-                        "context": {
-                            **base_context,
-                            "customer_name": "Cliente",
-                            "customer_email": email,
-                        }
-                    })
+    db = SessionLocal()
+    try:
+        # Recupera il template
+        template = await db.query(EmailTemplate).filter(EmailTemplate.id == UUID(template_id)).first()
+        if not template:
+            logger.error(f"Template email {template_id} non trovato")
+            return {"success": False, "error": "Template email non trovato"}
+        
+        # Recupera il negozio
+        store = await db.query(Store).filter(Store.id == UUID(store_id)).first()
+        if not store:
+            logger.error(f"Negozio {store_id} non trovato")
+            return {"success": False, "error": "Negozio non trovato"}
+        
+        # Prepara il contesto base
+        base_context = {
+            "store_name": store.name,
+            "store_url": store.url,
+            **(context or {})
+        }
+        
+        # Recupera i clienti se sono stati specificati gli ID
+        recipients = []
+        if customer_ids:
+            customers = await db.query(Customer).filter(
+                Customer.id.in_([UUID(cid) for cid in customer_ids]),
+                Customer.store_id == UUID(store_id)
+            ).all()
             
-            # Invia le email
-            results = []
-            for recipient in recipients:
-                # Renderizza il template
-                subject = await render_template(template.subject, recipient["context"])
-                body = await render_template(template.body, recipient["context"])
-                
-                # Invia l'email
-                success = await send_email_async(
-                    recipient=recipient["email"],
-                    subject=subject,
-                    body=body,
-                    sender=settings.EMAIL_FROM,
-                    sender_name=f"{store.name} via CommerceAI",
-                )
-                
-                results.append({
-                    "email": recipient["email"],
-                    "success": success,
+            for customer in customers:
+                recipients.append({
+                    "email": customer.email,
+                    "context": {
+                        **base_context,
+                        "customer_name": f"{customer.first_name or ''} {customer.last_name or ''}".strip(),
+                        "customer_email": customer.email,
+                    }
                 })
+        
+        # Aggiungi gli indirizzi email specificati direttamente
+        if email_addresses:
+            for email in email_addresses:
+                recipients.append({
+                    "email": email,
+                    "context": {
+                        **base_context,
+                        "customer_name": "Cliente",
+                        "customer_email": email,
+                    }
+                })
+        
+        # Invia le email
+        results = []
+        for recipient in recipients:
+            # Renderizza il template
+            subject = await render_template(template.subject, recipient["context"])
+            body = await render_template(template.body, recipient["context"])
             
-            return {
-                "success": True,
-                "total": len(results),
-                "sent": sum(1 for r in results if r["success"]),
-                "failed": sum(1 for r in results if not r["success"]),
-                "results": results,
-            }
+            # Invia l'email
+            success = await send_email_async(
+                recipient=recipient["email"],
+                subject=subject,
+                body=body,
+                sender=settings.EMAIL_FROM,
+                sender_name=f"{store.name} via CommerceAI",
+            )
+            
+            results.append({
+                "email": recipient["email"],
+                "success": success,
+            })
         
-        except Exception as e:
-            logger.error(f"Errore nell'invio delle email: {str(e)}")
-            return {"success": False, "error": str(e)}
-        finally:
-            await db.close()
+        return {
+            "success": True,
+            "total": len(results),
+            "sent": sum(1 for r in results if r["success"]),
+            "failed": sum(1 for r in results if not r["success"]),
+            "results": results,
+        }
     
-    import asyncio
-    return asyncio.run(_send_email())
+    except Exception as e:
+        logger.error(f"Errore nell'invio delle email: {str(e)}")
+        return {"success": False, "error": str(e)}
+    finally:
+        await db.close()
+
+@celery_app.task(name="src.tasks.email.send_email_task")
+@async_task
+async def send_email_task(
+    template_id: str,
+    store_id: str,
+    customer_ids: Optional[List[str]] = None,
+    email_addresses: Optional[List[str]] = None,
+    context: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Task per inviare email utilizzando un template.
+    """
+    return await _send_email(
+        template_id=template_id,
+        store_id=store_id,
+        customer_ids=customer_ids,
+        email_addresses=email_addresses,
+        context=context,
+    )
 
 @celery_app.task(name="src.tasks.email.send_newsletter_task")
-def send_newsletter_task(
+@async_task
+async def send_newsletter_task(
     template_id: str,
     store_id: str,
 ) -> Dict[str, Any]:
     """
     Task per inviare una newsletter a tutti i clienti che hanno accettato il marketing.
     """
-    async def _send_newsletter():
-        db = SessionLocal()
-        try:
-            # Recupera il template
-            template = await db.query(EmailTemplate).filter(EmailTemplate.id == UUID(template_id)).first()
-            if not template:
-                logger.error(f"Template email {template_id} non trovato")
-                return {"success": False, "error": "Template email non trovato"}
-            
-            # Recupera il negozio
-            store = await db.query(Store).filter(Store.id == UUID(store_id)).first()
-            if not store:
-                logger.error(f"Negozio {store_id} non trovato")
-                return {"success": False, "error": "Negozio non trovato"}
-            
-            # Recupera tutti i clienti che hanno accettato il marketing
-            customers = await db.query(Customer).filter(
-                Customer.store_id == UUID(store_id),
-                Customer.accepts_marketing == True,
-                Customer.is_active == True
-            ).all()
-            
-            # Prepara il contesto base
-            base_context = {
-                "store_name": store.name,
-                "store_url": store.url,
+    db = SessionLocal()
+    try:
+        # Recupera il template
+        template = await db.query(EmailTemplate).filter(EmailTemplate.id == UUID(template_id)).first()
+        if not template:
+            logger.error(f"Template email {template_id} non trovato")
+            return {"success": False, "error": "Template email non trovato"}
+        
+        # Recupera il negozio
+        store = await db.query(Store).filter(Store.id == UUID(store_id)).first()
+        if not store:
+            logger.error(f"Negozio {store_id} non trovato")
+            return {"success": False, "error": "Negozio non trovato"}
+        
+        # Recupera tutti i clienti che hanno accettato il marketing
+        customers = await db.query(Customer).filter(
+            Customer.store_id == UUID(store_id),
+            Customer.accepts_marketing == True,
+            Customer.is_active == True
+        ).all()
+        
+        # Prepara il contesto base
+        base_context = {
+            "store_name": store.name,
+            "store_url": store.url,
+        }
+        
+        # Invia le email
+        results = []
+        for customer in customers:
+            # Prepara il contesto specifico per il cliente
+            context = {
+                **base_context,
+                "customer_name": f"{customer.first_name or ''} {customer.last_name or ''}".strip(),
+                "customer_email": customer.email,
             }
             
-            # Invia le email
-            results = []
-            for customer in customers:
-                # Prepara il contesto specifico per il cliente
-                context = {
-                    **base_context,
-                    "customer_name": f"{customer.first_name or ''} {customer.last_name or ''}".strip(),
-                    "customer_email": customer.email,
-                }
-                
-                # Renderizza il template
-                subject = await render_template(template.subject, context)
-                body = await render_template(template.body, context)
-                
-                # Invia l'email
-                success = await send_email_async(
-                    recipient=customer.email,
-                    subject=subject,
-                    body=body,
-                    sender=settings.EMAIL_FROM,
-                    sender_name=f"{store.name} via CommerceAI",
-                )
-                
-                results.append({
-                    "email": customer.email,
-                    "success": success,
-                })
+            # Renderizza il template
+            subject = await render_template(template.subject, context)
+            body = await render_template(template.body, context)
             
-            return {
-                "success": True,
-                "total": len(results),
-                "sent": sum(1 for r in results if r["success"]),
-                "failed": sum(1 for r in results if not r["success"]),
-                "results": results,
-            }
+            # Invia l'email
+            success = await send_email_async(
+                recipient=customer.email,
+                subject=subject,
+                body=body,
+                sender=settings.EMAIL_FROM,
+                sender_name=f"{store.name} via CommerceAI",
+            )
+            
+            results.append({
+                "email": customer.email,
+                "success": success,
+            })
         
-        except Exception as e:
-            logger.error(f"Errore nell'invio della newsletter: {str(e)}")
-            return {"success": False, "error": str(e)}
-        finally:
-            await db.close()
+        return {
+            "success": True,
+            "total": len(results),
+            "sent": sum(1 for r in results if r["success"]),
+            "failed": sum(1 for r in results if not r["success"]),
+            "results": results,
+        }
     
-    import asyncio
-    return asyncio.run(_send_newsletter())
+    except Exception as e:
+        logger.error(f"Errore nell'invio della newsletter: {str(e)}")
+        return {"success": False, "error": str(e)}
+    finally:
+        await db.close()
@@ -0,0 +1,104 @@
+import logging
+from typing import Any, Dict, List, Sequence
+from uuid import UUID
+
+from celery import chord
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.celery_app import celery_app
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+async def count_by_store(db: AsyncSession, store_column: Any, store_ids: Sequence[UUID], *criteria: Any) -> Dict[UUID, int]:
+    """
+    Conta con una sola query GROUP BY le righe di ogni negozio (prodotti, clienti,
+    ordini...), come stima del lavoro da svolgere per negozio.
+    """
+    if not store_ids:
+        return {}
+    
+    result = await db.execute(
+        select(store_column, func.count())
+        .where(store_column.in_(store_ids), *criteria)
+        .group_by(store_column)
+    )
+    return {store_id: count for store_id, count in result.all()}
+
+def partition_stores(
+    store_ids: Sequence[UUID],
+    sizes: Dict[UUID, int],
+    small_threshold: int = None,
+    chunk_size: int = None,
+) -> List[List[str]]:
+    """
+    Divide i negozi in gruppi da elaborare in sotto-task separati.
+    
+    I negozi con almeno small_threshold elementi hanno un sotto-task ciascuno;
+    quelli più piccoli vengono raggruppati a chunk_size per volta, così il costo
+    di accodamento non supera quello del lavoro.
+    """
+    small_threshold = settings.STORE_FANOUT_SMALL_THRESHOLD if small_threshold is None else small_threshold
+    chunk_size = settings.STORE_FANOUT_CHUNK_SIZE if chunk_size is None else chunk_size
+    
+    groups: List[List[str]] = []
+    small: List[str] = []
+    for store_id in store_ids:
+        if sizes.get(store_id, 0) >= small_threshold:
+            groups.append([str(store_id)])
+            continue
+        small.append(str(store_id))
+        if len(small) >= chunk_size:
+            groups.append(small)
+            small = []
+    if small:
+        groups.append(small)
+    
+    return groups
+
+def dispatch_store_groups(job: str, task: Any, groups: List[List[str]], queue: str, **kwargs: Any) -> Dict[str, Any]:
+    """
+    Accoda un sotto-task per gruppo di negozi sulla coda del task e un callback
+    (chord) che ne aggrega i risultati al termine di tutti i gruppi.
+    """
+    if not groups:
+        return {"success": True, "job": job, "stores_count": 0, "subtasks_count": 0}
+    
+    callback = aggregate_store_results.s(job).set(queue=queue)
+    result = chord(task.s(store_ids, **kwargs) for store_ids in groups)(callback)
+    
+    stores_count = sum(len(store_ids) for store_ids in groups)
+    logger.info(f"{job}: {stores_count} negozi distribuiti su {len(groups)} sotto-task")
+    
+    return {
+        "success": True,
+        "job": job,
+        "stores_count": stores_count,
+        "subtasks_count": len(groups),
+        "chord_id": result.id,
+    }
+
+@celery_app.task(name="src.tasks.fanout.aggregate_store_results")
+def aggregate_store_results(group_results: List[Dict[str, Any]], job: str) -> Dict[str, Any]:
+    """
+    Callback del chord: unisce i riepiloghi per negozio dei sotto-task.
+    """
+    results = []
+    for group_result in group_results:
+        results.extend(group_result.get("results", []))
+        if not group_result.get("success", False):
+            for store_id in group_result.get("store_ids", []):
+                results.append({"store_id": store_id, "success": False, "error": group_result.get("error")})
+    
+    failed_count = sum(1 for result in results if not result.get("success"))
+    if failed_count:
+        logger.warning(f"{job}: {failed_count} negozi su {len(results)} non elaborati correttamente")
+    
+    return {
+        "success": True,
+        "job": job,
+        "stores_count": len(results),
+        "failed_count": failed_count,
+        "results": results,
+    }
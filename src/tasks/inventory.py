@@ -1,198 +1,335 @@
 import logging
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
 from datetime import datetime, timedelta
+from uuid import UUID
+
+import httpx
+from sqlalchemy import select
 
 from src.core.celery_app import celery_app
+from src.core.config import settings
+from src.core.worker_loop import async_task
 from src.db.session import SessionLocal
+from src.integrations.registry import marketplace_clients
+from src.integrations.shopify.async_client import ShopifyAPIError
+from src.integrations.shopify.bulk import (
+    BULK_PRODUCTS_QUERY,
+    BULK_VARIANT_QUANTITIES_QUERY,
+    ShopifyBulkOperationError,
+    group_bulk_records,
+)
+from src.inventory.catalog_import import import_catalog
+from src.inventory.reconciliation import reconcile_inventory
+from src.inventory.sync_state import get_incremental_since, get_sync_state, mark_synced
 from src.models.product import Product
 from src.models.store import Store
 from src.models.order import Order
+from src.tasks.fanout import count_by_store, dispatch_store_groups, partition_stores
 from src.agents.inventory.agent import inventory_agent
 
 logger = logging.getLogger(__name__)
 
 @celery_app.task(name="src.tasks.inventory.sync_inventory")
-def sync_inventory() -> Dict[str, Any]:
+@async_task
+async def sync_inventory(full: bool = False) -> Dict[str, Any]:
     """
     Task periodico per sincronizzare l'inventario tra il database e i marketplace.
+    
+    Distribuisce i negozi attivi tra i worker della coda inventory con un
+    sotto-task sync_inventory_stores per negozio (o per gruppo di negozi piccoli).
     """
-    async def _sync_inventory():
-        db = SessionLocal()
-        try:
-            # Recupera tutti i negozi attivi
-            stores = await db.query(Store).filter(Store.is_active == True).all()
-            
-            results = []
-            for store in stores:
-                try:
-                    # Recupera i prodotti del negozio
-                    products = await db.query(Product).filter(Product.store_id == store.id).all()
-                    
-                    # Recupera i dati dal marketplace
-                    marketplace_products = await _get_marketplace_products(store)
-                    
-                    # Aggiorna i prodotti nel database
-                    updated_count = 0
-                    for product in products:
-                        marketplace_product = next(
-                            (p for p in marketplace_products if p.get("sku") == product.sku),
-                            None
-                        )
-                        
-                        if marketplace_product and marketplace_product.get("quantity") != product.quantity:
-                            product.quantity = marketplace_product.get("quantity")
-                            updated_count += 1
-                    
-                    await db.commit()
-                    
-                    results.append({
-                        "store_id": str(store.id),
-                        "store_name": store.name,
-                        "products_count": len(products),
-                        "updated_count": updated_count,
-                        "success": True,
-                    })
+    db = SessionLocal()
+    try:
+        result = await db.execute(select(Store.id).where(Store.is_active == True))
+        store_ids = result.scalars().all()
+        sizes = await count_by_store(db, Product.store_id, store_ids)
+        
+        return dispatch_store_groups(
+            "sync_inventory",
+            sync_inventory_stores,
+            partition_stores(store_ids, sizes),
+            queue="inventory",
+            full=full,
+        )
+    
+    except Exception as e:
+        logger.error(f"Errore nella sincronizzazione dell'inventario: {str(e)}")
+        return {"success": False, "error": str(e)}
+    finally:
+        await db.close()
+
+@celery_app.task(name="src.tasks.inventory.sync_inventory_stores")
+@async_task
+async def sync_inventory_stores(store_ids: List[str], full: bool = False) -> Dict[str, Any]:
+    """
+    Sincronizza l'inventario di un gruppo di negozi.
+    
+    Per ogni negozio scarica solo i prodotti modificati dall'ultima sincronizzazione
+    riuscita (watermark in SyncState); ogni INVENTORY_FULL_SYNC_INTERVAL_HOURS, o
+    se full è True, esegue una riconciliazione completa del catalogo.
+    """
+    db = SessionLocal()
+    try:
+        # Recupera i negozi del gruppo
+        result = await db.execute(select(Store).where(Store.id.in_([UUID(store_id) for store_id in store_ids])))
+        stores = result.scalars().all()
+        # I negozi vengono staccati dalla sessione: il rollback dopo l'errore di un
+        # negozio non li fa scadere e i successivi restano leggibili senza lazy load
+        db.expunge_all()
+        
+        results = []
+        for store in stores:
+            store_id, store_name = store.id, store.name
+            try:
+                started_at = datetime.utcnow()
+                sync_state = await get_sync_state(db, store.id, "products")
+                since = None if full else get_incremental_since(sync_state, started_at)
+                
+                # Aggiorna nel database solo i prodotti con quantità diverse, leggendo
+                # il catalogo del marketplace (o le sole modifiche) in streaming
+                reconciliation = await reconcile_inventory(
+                    db,
+                    store.id,
+                    _iter_marketplace_products(store, since=since),
+                    incremental=since is not None,
+                )
                 
-                except Exception as e:
-                    logger.error(f"Errore nella sincronizzazione dell'inventario per il negozio {store.id}: {str(e)}")
-                    results.append({
-                        "store_id": str(store.id),
-                        "store_name": store.name,
-                        "success": False,
-                        "error": str(e),
-                    })
+                mark_synced(
+                    sync_state,
+                    started_at,
+                    full=since is None,
+                    items_synced=reconciliation["marketplace_count"],
+                    cursor=since.isoformat() if since else None,
+                )
+                await db.commit()
+                
+                results.append({
+                    "store_id": str(store_id),
+                    "store_name": store_name,
+                    "full_sync": since is None,
+                    "products_count": reconciliation["products_count"],
+                    "updated_count": reconciliation["updated_count"],
+                    "success": True,
+                })
             
-            return {
-                "success": True,
-                "stores_count": len(stores),
-                "results": results,
-            }
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"Errore nella sincronizzazione dell'inventario per il negozio {store_id}: {str(e)}")
+                results.append({
+                    "store_id": str(store_id),
+                    "store_name": store_name,
+                    "success": False,
+                    "error": str(e),
+                })
         
-        except Exception as e:
-            logger.error(f"Errore nella sincronizzazione dell'inventario: {str(e)}")
-            return {"success": False, "error": str(e)}
-        finally:
-            await db.close()
+        return {
+            "success": True,
+            "store_ids": store_ids,
+            "results": results,
+        }
     
-    import asyncio
-    return asyncio.run(_sync_inventory())
+    except Exception as e:
+        logger.error(f"Errore nella sincronizzazione dell'inventario dei negozi {store_ids}: {str(e)}")
+        return {"success": False, "store_ids": store_ids, "error": str(e)}
+    finally:
+        await db.close()
 
-async def _get_marketplace_products(store: Store) -> List[Dict[str, Any]]:
+async def _iter_marketplace_products(store: Store, since: Optional[datetime] = None) -> AsyncIterator[Dict[str, Any]]:
     """
-    Recupera i prodotti dal marketplace.
+    Itera i prodotti del marketplace, pagina per pagina.
+    
+    Con since (UTC) vengono restituiti solo i prodotti modificati da quell'istante.
     """
     # Implementazione specifica per ogni piattaforma
     if store.platform == "shopify":
-        from src.integrations.shopify.client import ShopifyClient
+        params = {}
+        if since is not None:
+            params["updated_at_min"] = since.strftime("%Y-%m-%dT%H:%M:%S+00:00")
         
-        # Recupera le credenziali dal database
-        credentials = store.settings.get("credentials", {})
+        # Client del negozio dal registro: il pool di connessioni resta aperto tra
+        # una sincronizzazione e l'altra
+        client = await marketplace_clients.get_for_store(store)
         
-        client = ShopifyClient(
-            api_key=credentials.get("api_key"),
-            api_secret=credentials.get("api_secret"),
-            shop_url=credentials.get("shop_url"),
-            access_token=credentials.get("access_token"),
-        )
+        # Sincronizzazione completa: il catalogo viene esportato con una bulk
+        # operation GraphQL invece che a pagine REST; se l'operazione non parte
+        # o fallisce prima di restituire righe si ripiega sulle pagine REST
+        if since is None and settings.SHOPIFY_BULK_EXPORT_ENABLED:
+            received = False
+            try:
+                async for variant in client.bulk_export(BULK_VARIANT_QUANTITIES_QUERY):
+                    received = True
+                    if variant.get("sku"):
+                        yield {
+                            "sku": variant.get("sku"),
+                            "quantity": variant.get("inventoryQuantity") or 0,
+                        }
+                return
+            except (ShopifyBulkOperationError, ShopifyAPIError, httpx.HTTPError) as e:
+                if received:
+                    raise
+                logger.warning(f"Bulk operation non riuscita ({str(e)}): sincronizzazione del negozio {store.id} tramite API REST")
+        
+        # Mappa le varianti al formato interno, come la bulk operation
+        async for product in client.iter_products(**params):
+            for variant in product.get("variants") or []:
+                if variant.get("sku"):
+                    yield {
+                        "sku": variant.get("sku"),
+                        "quantity": variant.get("inventory_quantity") or 0,
+                    }
+    
+    elif store.platform == "woocommerce":
+        client = await marketplace_clients.get_for_store(store)
         
-        products = client.get_products()
+        params = {}
+        if since is not None:
+            params = {"modified_after": since.strftime("%Y-%m-%dT%H:%M:%S"), "dates_are_gmt": "true"}
         
         # Mappa i prodotti al formato interno
-        return [
-            {
-                "sku": product.get("variants", [{}])[0].get("sku"),
-                "quantity": product.get("variants", [{}])[0].get("inventory_quantity", 0),
-            }
-            for product in products
-            if product.get("variants") and product.get("variants")[0].get("sku")
-        ]
+        async for product in client.iter_products(params=params):
+            if product.get("sku"):
+                yield {
+                    "sku": product.get("sku"),
+                    "quantity": product.get("stock_quantity", 0),
+                }
     
-    elif store.platform == "woocommerce":
-        from src.integrations.woocommerce.client import WooCommerceClient
+    # Le piattaforme non supportate non restituiscono prodotti
+
+@celery_app.task(name="src.tasks.inventory.import_products")
+@async_task
+async def import_products(store_id: str) -> Dict[str, Any]:
+    """
+    Importa nel database il catalogo completo del marketplace di un negozio,
+    creando i prodotti nuovi e aggiornando quelli esistenti per SKU.
+    """
+    db = SessionLocal()
+    try:
+        result = await db.execute(select(Store).where(Store.id == UUID(store_id)))
+        store = result.scalar_one_or_none()
+        if not store:
+            return {"success": False, "error": "Negozio non trovato"}
         
-        # Recupera le credenziali dal database
-        credentials = store.settings.get("credentials", {})
+        catalog = await import_catalog(db, store.id, _iter_marketplace_catalog(store))
+        await db.commit()
         
-        client = WooCommerceClient(
-            url=credentials.get("url"),
-            consumer_key=credentials.get("consumer_key"),
-            consumer_secret=credentials.get("consumer_secret"),
-        )
+        return {
+            "success": True,
+            "store_id": store_id,
+            **catalog,
+        }
+    
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Errore nell'importazione del catalogo del negozio {store_id}: {str(e)}")
+        return {"success": False, "error": str(e)}
+    finally:
+        await db.close()
+
+async def _iter_marketplace_catalog(store: Store) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Itera il catalogo completo del marketplace nel formato di import_catalog,
+    una riga per variante con SKU.
+    """
+    if store.platform == "shopify":
+        client = await marketplace_clients.get_for_store(store)
         
-        products = client.get_products()
+        # Prodotti e varianti esportati con una bulk operation e ricomposti
+        # dal file JSONL un prodotto alla volta
+        async for product in group_bulk_records(client.bulk_export(BULK_PRODUCTS_QUERY)):
+            images = [image.get("url") for image in product.get("images", []) if image.get("url")]
+            for variant in product.get("variants", []):
+                if not variant.get("sku"):
+                    continue
+                
+                name = product.get("title")
+                if variant.get("title") and variant.get("title") != "Default Title":
+                    name = f"{name} - {variant.get('title')}"
+                
+                yield {
+                    "sku": variant.get("sku"),
+                    "name": name,
+                    "description": product.get("descriptionHtml"),
+                    "barcode": variant.get("barcode"),
+                    "price": float(variant.get("price") or 0),
+                    "compare_at_price": float(variant["compareAtPrice"]) if variant.get("compareAtPrice") else None,
+                    "quantity": variant.get("inventoryQuantity") or 0,
+                    "is_active": product.get("status") == "ACTIVE",
+                    "tags": product.get("tags"),
+                    "images": images,
+                }
+    
+    elif store.platform == "woocommerce":
+        client = await marketplace_clients.get_for_store(store)
         
-        # Mappa i prodotti al formato interno
-        return [
-            {
+        async for product in client.iter_products():
+            if not product.get("sku"):
+                continue
+            
+            yield {
                 "sku": product.get("sku"),
-                "quantity": product.get("stock_quantity", 0),
+                "name": product.get("name"),
+                "description": product.get("description"),
+                "price": float(product.get("price") or 0),
+                "compare_at_price": float(product["regular_price"]) if product.get("sale_price") and product.get("regular_price") else None,
+                "quantity": product.get("stock_quantity") or 0,
+                "is_active": product.get("status") == "publish",
+                "categories": [category.get("name") for category in product.get("categories", [])],
+                "tags": [tag.get("name") for tag in product.get("tags", [])],
+                "images": [image.get("src") for image in product.get("images", []) if image.get("src")],
             }
-            for product in products
-            if product.get("sku")
-        ]
     
-    # Piattaforma non supportata
-    return []
+    # Le piattaforme non supportate non restituiscono prodotti
 
 @celery_app.task(name="src.tasks.inventory.predict_demand")
-def predict_demand(product_id: str, store_id: str, days_ahead: int = 30) -> Dict[str, Any]:
+@async_task
+async def predict_demand(product_id: str, store_id: str, days_ahead: int = 30) -> Dict[str, Any]:
     """
     Task per prevedere la domanda futura per un prodotto.
     """
-    async def _predict_demand():
-        try:
-            # Utilizza l'agente di inventario per prevedere la domanda
-            result = await inventory_agent.predict_demand(
-                product_id=product_id,
-                store_id=store_id,
-                days_ahead=days_ahead,
-            )
-            
-            return result
-        except Exception as e:
-            logger.error(f"Errore nella previsione della domanda: {str(e)}")
-            return {"success": False, "error": str(e)}
-    
-    import asyncio
-    return asyncio.run(_predict_demand())
+    try:
+        # Utilizza l'agente di inventario per prevedere la domanda
+        result = await inventory_agent.predict_demand(
+            product_id=product_id,
+            store_id=store_id,
+            days_ahead=days_ahead,
+        )
+        
+        return result
+    except Exception as e:
+        logger.error(f"Errore nella previsione della domanda: {str(e)}")
+        return {"success": False, "error": str(e)}
 
 @celery_app.task(name="src.tasks.inventory.recommend_restock")
-def recommend_restock(store_id: str, threshold: int = 5) -> Dict[str, Any]:
+@async_task
+async def recommend_restock(store_id: str, threshold: int = 5) -> Dict[str, Any]:
     """
     Task per raccomandare prodotti da riordinare.
     """
-    async def _recommend_restock():
-        try:
-            # Utilizza l'agente di inventario per raccomandare prodotti da riordinare
-            result = await inventory_agent.recommend_restock(
-                store_id=store_id,
-                threshold=threshold,
-            )
-            
-            return result
-        except Exception as e:
-            logger.error(f"Errore nella raccomandazione dei prodotti da riordinare: {str(e)}")
-            return {"success": False, "error": str(e)}
-    
-    import asyncio
-    return asyncio.run(_recommend_restock())
+    try:
+        # Utilizza l'agente di inventario per raccomandare prodotti da riordinare
+        result = await inventory_agent.recommend_restock(
+            store_id=store_id,
+            threshold=threshold,
+        )
+        
+        return result
+    except Exception as e:
+        logger.error(f"Errore nella raccomandazione dei prodotti da riordinare: {str(e)}")
+        return {"success": False, "error": str(e)}
 
 @celery_app.task(name="src.tasks.inventory.optimize_inventory")
-def optimize_inventory(store_id: str) -> Dict[str, Any]:
+@async_task
+async def optimize_inventory(store_id: str) -> Dict[str, Any]:
     """
     Task per ottimizzare i livelli di inventario.
     """
-    async def _optimize_inventory():
-        try:
-            # Utilizza l'agente di inventario per ottimizzare l'inventario
-            result = await inventory_agent.optimize_inventory(
-                store_id=store_id,
-            )
-            
-            return result
-        except Exception as e:
-            logger.error(f"Errore nell'ottimizzazione dell'inventario: {str(e)}")
-            return {"success": False, "error": str(e)}
-    
-    import asyncio
-    return asyncio.run(_optimize_inventory())
+    try:
+        # Utilizza l'agente di inventario per ottimizzare l'inventario
+        result = await inventory_agent.optimize_inventory(
+            store_id=store_id,
+        )
+        
+        return result
+    except Exception as e:
+        logger.error(f"Errore nell'ottimizzazione dell'inventario: {str(e)}")
+        return {"success": False, "error": str(e)}
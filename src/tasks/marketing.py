@@ -1,104 +1,147 @@
+import hashlib
+import json
 import logging
 from typing import Any, Dict, List, Optional
 from datetime import datetime, timedelta
+from uuid import UUID
+
+from sqlalchemy import select
 
 from src.core.celery_app import celery_app
+from src.core.worker_loop import async_task
 from src.db.session import SessionLocal
 from src.models.product import Product
 from src.models.store import Store
 from src.models.customer import Customer
+from src.tasks.email import _send_email
+from src.tasks.fanout import count_by_store, dispatch_store_groups, partition_stores
 from src.agents.marketing.agent import marketing_agent
 
 logger = logging.getLogger(__name__)
 
 @celery_app.task(name="src.tasks.marketing.send_weekly_newsletter")
-def send_weekly_newsletter() -> Dict[str, Any]:
+@async_task
+async def send_weekly_newsletter() -> Dict[str, Any]:
     """
     Task periodico per inviare newsletter settimanali.
+    
+    Distribuisce i negozi con newsletter abilitate, il cui giorno di invio è oggi,
+    tra i worker della coda marketing con un sotto-task send_weekly_newsletter_stores
+    per negozio (o per gruppo di negozi piccoli).
     """
-    async def _send_weekly_newsletter():
-        db = SessionLocal()
-        try:
-            # Recupera tutti i negozi attivi con newsletter abilitate
-            stores = await db.query(Store).filter(
+    db = SessionLocal()
+    try:
+        # Recupera tutti i negozi attivi con newsletter abilitate
+        result = await db.execute(
+            select(Store.id, Store.settings).where(
                 Store.is_active == True,
                 Store.settings.has_key("newsletter_enabled"),
                 Store.settings["newsletter_enabled"].astext == "true"
-            ).all()
-            
-            results = []
-            for store in stores:
-                try:
-                    # Verifica se è il giorno della settimana configurato per l'invio
-                    newsletter_day = store.settings.get("newsletter_day", "monday").lower()
-                    current_day = datetime.now().strftime("%A").lower()
-                    
-                    if current_day != newsletter_day:
-                        continue
-                    
-                    # Recupera i clienti che hanno accettato il marketing
-                    customers = await db.query(Customer).filter(
-                        Customer.store_id == store.id,
-                        Customer.is_active == True,
-                        Customer.accepts_marketing == True
-                    ).all()
-                    
-                    if not customers:
-                        results.append({
-                            "store_id": str(store.id),
-                            "store_name": store.name,
-                            "success": True,
-                            "message": "Nessun cliente ha accettato il marketing",
-                        })
-                        continue
-                    
-                    # Genera il contenuto della newsletter
-                    newsletter_content = await _generate_newsletter_content(store)
-                    
-                    # Invia la newsletter
-                    from src.tasks.email import send_email_task
-                    
-                    email_result = send_email_task(
-                        template_id=store.settings.get("newsletter_template_id"),
-                        store_id=str(store.id),
-                        customer_ids=[str(customer.id) for customer in customers],
-                        context={
-                            "newsletter_content": newsletter_content,
-                            "current_date": datetime.now().strftime("%d/%m/%Y"),
-                        }
-                    )
-                    
-                    results.append({
-                        "store_id": str(store.id),
-                        "store_name": store.name,
-                        "customers_count": len(customers),
-                        "success": email_result.get("success", False),
-                        "email_result": email_result,
-                    })
+            )
+        )
+        
+        # Verifica se è il giorno della settimana configurato per l'invio
+        current_day = datetime.now().strftime("%A").lower()
+        store_ids = [
+            store_id
+            for store_id, store_settings in result.all()
+            if store_settings.get("newsletter_day", "monday").lower() == current_day
+        ]
+        sizes = await count_by_store(
+            db,
+            Customer.store_id,
+            store_ids,
+            Customer.is_active == True,
+            Customer.accepts_marketing == True,
+        )
+        
+        return dispatch_store_groups(
+            "send_weekly_newsletter",
+            send_weekly_newsletter_stores,
+            partition_stores(store_ids, sizes),
+            queue="marketing",
+        )
+    
+    except Exception as e:
+        logger.error(f"Errore nell'invio delle newsletter settimanali: {str(e)}")
+        return {"success": False, "error": str(e)}
+    finally:
+        await db.close()
+
+@celery_app.task(name="src.tasks.marketing.send_weekly_newsletter_stores")
+@async_task
+async def send_weekly_newsletter_stores(store_ids: List[str]) -> Dict[str, Any]:
+    """
+    Invia la newsletter settimanale ai clienti di un gruppo di negozi.
+    """
+    db = SessionLocal()
+    try:
+        # Recupera i negozi del gruppo
+        result = await db.execute(select(Store).where(Store.id.in_([UUID(store_id) for store_id in store_ids])))
+        stores = result.scalars().all()
+        
+        results = []
+        for store in stores:
+            try:
+                # Recupera i clienti che hanno accettato il marketing
+                customers = await db.query(Customer).filter(
+                    Customer.store_id == store.id,
+                    Customer.is_active == True,
+                    Customer.accepts_marketing == True
+                ).all()
                 
-                except Exception as e:
-                    logger.error(f"Errore nell'invio della newsletter per il negozio {store.id}: {str(e)}")
+                if not customers:
                     results.append({
                         "store_id": str(store.id),
                         "store_name": store.name,
-                        "success": False,
-                        "error": str(e),
+                        "success": True,
+                        "message": "Nessun cliente ha accettato il marketing",
                     })
+                    continue
+                
+                # Genera il contenuto della newsletter
+                newsletter_content = await _generate_newsletter_content(store)
+                
+                # Invia la newsletter
+                # Il task è già in esecuzione nel loop del worker: si attende direttamente la coroutine
+                email_result = await _send_email(
+                    template_id=store.settings.get("newsletter_template_id"),
+                    store_id=str(store.id),
+                    customer_ids=[str(customer.id) for customer in customers],
+                    context={
+                        "newsletter_content": newsletter_content,
+                        "current_date": datetime.now().strftime("%d/%m/%Y"),
+                    }
+                )
+                
+                results.append({
+                    "store_id": str(store.id),
+                    "store_name": store.name,
+                    "customers_count": len(customers),
+                    "success": email_result.get("success", False),
+                    "email_result": email_result,
+                })
             
-            return {
-                "success": True,
-                "stores_count": len(stores),
-                "results": results,
-            }
+            except Exception as e:
+                logger.error(f"Errore nell'invio della newsletter per il negozio {store.id}: {str(e)}")
+                results.append({
+                    "store_id": str(store.id),
+                    "store_name": store.name,
+                    "success": False,
+                    "error": str(e),
+                })
         
-        except Exception as e:
-            logger.error(f"Errore nell'invio delle newsletter settimanali: {str(e)}")
-            return {"success": False, "error": str(e)}
-        finally:
-            await db.close()
+        return {
+            "success": True,
+            "store_ids": store_ids,
+            "results": results,
+        }
     
-    import asyncio
-    return asyncio.run(_send_weekly_newsletter())
+    except Exception as e:
+        logger.error(f"Errore nell'invio delle newsletter settimanali dei negozi {store_ids}: {str(e)}")
+        return {"success": False, "store_ids": store_ids, "error": str(e)}
+    finally:
+        await db.close()
 
 async def _generate_newsletter_content(store: Store) -> Dict[str, Any]:
     """
@@ -128,147 +171,166 @@ async def _generate_newsletter_content(store: Store) -> Dict[str, Any]:
             "cta_url": store.url or "#",
         }
 
+def _product_version(product: Product) -> str:
+    """
+    Versione del prodotto per la cache delle descrizioni: hash dei soli dati
+    letti dalla generazione. La descrizione e updated_at sono esclusi, perché
+    cambiano con la scrittura della descrizione stessa e con le
+    sincronizzazioni di inventario e prezzi.
+    """
+    content = {
+        "name": product.name,
+        "sku": product.sku,
+        "barcode": product.barcode,
+        "price": product.price,
+        "compare_at_price": product.compare_at_price,
+        "weight": product.weight,
+        "weight_unit": product.weight_unit,
+        "is_digital": product.is_digital,
+        "categories": product.categories,
+        "tags": product.tags,
+        "images": product.images,
+        "variants": product.variants,
+    }
+    payload = json.dumps(content, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
 @celery_app.task(name="src.tasks.marketing.generate_product_descriptions")
-def generate_product_descriptions(store_id: str, tone: str = "professional") -> Dict[str, Any]:
+@async_task
+async def generate_product_descriptions(store_id: str, tone: str = "professional") -> Dict[str, Any]:
     """
     Task per generare descrizioni ottimizzate per tutti i prodotti di un negozio.
     """
-    async def _generate_product_descriptions():
-        db = SessionLocal()
-        try:
-            # Recupera il negozio
-            store = await db.query(Store).filter(Store.id == store_id).first()
-            if not store:
-                return {"success": False, "error": "Negozio non trovato"}
-            
-            # Recupera i prodotti del negozio
-            products = await db.query(Product).filter(Product.store_id == store.id).all()
-            
-            results = []
-            for product in products:
-                try:
-                    # Genera la descrizione del prodotto
-                    description_result = await marketing_agent.generate_product_description(
-                        product_id=str(product.id),
-                        store_id=str(store.id),
-                        tone=tone,
-                    )
+    db = SessionLocal()
+    try:
+        # Recupera il negozio
+        store = await db.query(Store).filter(Store.id == store_id).first()
+        if not store:
+            return {"success": False, "error": "Negozio non trovato"}
+        
+        # Recupera i prodotti del negozio
+        products = await db.query(Product).filter(Product.store_id == store.id).all()
+        
+        # Genera le descrizioni dei prodotti
+        description_results = await marketing_agent.generate_product_descriptions(
+            product_ids=[str(product.id) for product in products],
+            store_id=str(store.id),
+            tone=tone,
+            product_versions=[_product_version(product) for product in products],
+        )
+        
+        results = []
+        for product, description_result in zip(products, description_results):
+            try:
+                if description_result.get("success") and "description" in description_result:
+                    # Aggiorna la descrizione del prodotto
+                    product.description = description_result["description"]
                     
-                    if description_result.get("success") and "description" in description_result:
-                        # Aggiorna la descrizione del prodotto
-                        product.description = description_result["description"]
-                        
-                        results.append({
-                            "product_id": str(product.id),
-                            "product_name": product.name,
-                            "success": True,
-                        })
-                    else:
-                        results.append({
-                            "product_id": str(product.id),
-                            "product_name": product.name,
-                            "success": False,
-                            "error": "Errore nella generazione della descrizione",
-                        })
-                except Exception as e:
-                    logger.error(f"Errore nella generazione della descrizione per il prodotto {product.id}: {str(e)}")
+                    results.append({
+                        "product_id": str(product.id),
+                        "product_name": product.name,
+                        "success": True,
+                    })
+                else:
                     results.append({
                         "product_id": str(product.id),
                         "product_name": product.name,
                         "success": False,
-                        "error": str(e),
+                        "error": "Errore nella generazione della descrizione",
                     })
-            
-            await db.commit()
-            
-            return {
-                "success": True,
-                "products_count": len(products),
-                "updated_count": sum(1 for r in results if r["success"]),
-                "results": results,
-            }
+            except Exception as e:
+                logger.error(f"Errore nella generazione della descrizione per il prodotto {product.id}: {str(e)}")
+                results.append({
+                    "product_id": str(product.id),
+                    "product_name": product.name,
+                    "success": False,
+                    "error": str(e),
+                })
         
-        except Exception as e:
-            logger.error(f"Errore nella generazione delle descrizioni dei prodotti: {str(e)}")
-            return {"success": False, "error": str(e)}
-        finally:
-            await db.close()
+        await db.commit()
+        
+        return {
+            "success": True,
+            "products_count": len(products),
+            "updated_count": sum(1 for r in results if r["success"]),
+            "results": results,
+        }
     
-    import asyncio
-    return asyncio.run(_generate_product_descriptions())
+    except Exception as e:
+        logger.error(f"Errore nella generazione delle descrizioni dei prodotti: {str(e)}")
+        return {"success": False, "error": str(e)}
+    finally:
+        await db.close()
 
 @celery_app.task(name="src.tasks.marketing.generate_social_posts")
-def generate_social_posts(store_id: str, platform: str = "instagram", count: int = 5) -> Dict[str, Any]:
+@async_task
+async def generate_social_posts(store_id: str, platform: str = "instagram", count: int = 5) -> Dict[str, Any]:
     """
     Task per generare post per i social media.
     """
-    async def _generate_social_posts():
-        db = SessionLocal()
-        try:
-            # Recupera il negozio
-            store = await db.query(Store).filter(Store.id == store_id).first()
-            if not store:
-                return {"success": False, "error": "Negozio non trovato"}
-            
-            # Recupera i prodotti in evidenza del negozio
-            featured_products = await db.query(Product).filter(
-                Product.store_id == store.id,
-                Product.tags.contains(["featured"])
-            ).limit(count).all()
-            
-            posts = []
-            for product in featured_products:
-                try:
-                    # Genera un post per il prodotto
+    db = SessionLocal()
+    try:
+        # Recupera il negozio
+        store = await db.query(Store).filter(Store.id == store_id).first()
+        if not store:
+            return {"success": False, "error": "Negozio non trovato"}
+        
+        # Recupera i prodotti in evidenza del negozio
+        featured_products = await db.query(Product).filter(
+            Product.store_id == store.id,
+            Product.tags.contains(["featured"])
+        ).limit(count).all()
+        
+        posts = []
+        for product in featured_products:
+            try:
+                # Genera un post per il prodotto
+                post_result = await marketing_agent.generate_social_post(
+                    product_id=str(product.id),
+                    store_id=str(store.id),
+                    platform=platform,
+                    objective="sales",
+                )
+                
+                if post_result.get("success") and "content" in post_result:
+                    posts.append({
+                        "product_id": str(product.id),
+                        "product_name": product.name,
+                        "platform": platform,
+                        "content": post_result["content"],
+                        "hashtags": post_result.get("hashtags", []),
+                        "image_url": product.images[0] if product.images else None,
+                    })
+            except Exception as e:
+                logger.error(f"Errore nella generazione del post per il prodotto {product.id}: {str(e)}")
+        
+        # Genera post generici se non ci sono abbastanza prodotti in evidenza
+        if len(posts) < count:
+            try:
+                for i in range(count - len(posts)):
                     post_result = await marketing_agent.generate_social_post(
-                        product_id=str(product.id),
                         store_id=str(store.id),
                         platform=platform,
-                        objective="sales",
+                        objective="engagement",
                     )
                     
                     if post_result.get("success") and "content" in post_result:
                         posts.append({
-                            "product_id": str(product.id),
-                            "product_name": product.name,
                             "platform": platform,
                             "content": post_result["content"],
                             "hashtags": post_result.get("hashtags", []),
-                            "image_url": product.images[0] if product.images else None,
                         })
-                except Exception as e:
-                    logger.error(f"Errore nella generazione del post per il prodotto {product.id}: {str(e)}")
-            
-            # Genera post generici se non ci sono abbastanza prodotti in evidenza
-            if len(posts) < count:
-                try:
-                    for i in range(count - len(posts)):
-                        post_result = await marketing_agent.generate_social_post(
-                            store_id=str(store.id),
-                            platform=platform,
-                            objective="engagement",
-                        )
-                        
-                        if post_result.get("success") and "content" in post_result:
-                            posts.append({
-                                "platform": platform,
-                                "content": post_result["content"],
-                                "hashtags": post_result.get("hashtags", []),
-                            })
-                except Exception as e:
-                    logger.error(f"Errore nella generazione del post generico: {str(e)}")
-            
-            return {
-                "success": True,
-                "posts_count": len(posts),
-                "posts": posts,
-            }
+            except Exception as e:
+                logger.error(f"Errore nella generazione del post generico: {str(e)}")
         
-        except Exception as e:
-            logger.error(f"Errore nella generazione dei post per i social media: {str(e)}")
-            return {"success": False, "error": str(e)}
-        finally:
-            await db.close()
+        return {
+            "success": True,
+            "posts_count": len(posts),
+            "posts": posts,
+        }
     
-    import asyncio
-    return asyncio.run(_generate_social_posts())
+    except Exception as e:
+        logger.error(f"Errore nella generazione dei post per i social media: {str(e)}")
+        return {"success": False, "error": str(e)}
+    finally:
+        await db.close()
@@ -0,0 +1,88 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from sqlalchemy import select
+
+from src.core.celery_app import celery_app
+from src.core.config import settings
+from src.core.worker_loop import async_task
+from src.db.session import SessionLocal
+from src.models.integration import Integration
+from src.payments.reconciliation import iter_payment_records, reconcile_payments as reconcile_integration_payments
+
+logger = logging.getLogger(__name__)
+
+@celery_app.task(name="src.tasks.payments.reconcile_payments")
+@async_task
+async def reconcile_payments(integration_id: Optional[str] = None, days: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Task periodico per riconciliare i pagamenti Stripe e PayPal con gli ordini.
+    
+    Per ogni integrazione di pagamento attiva (o solo per quella indicata)
+    esporta in streaming i pagamenti degli ultimi PAYMENT_RECONCILIATION_WINDOW_DAYS
+    giorni, escluse le ultime PAYMENT_RECONCILIATION_LAG_MINUTES per i ritardi
+    dei provider, e registra le discrepanze con gli ordini.
+    """
+    db = SessionLocal()
+    try:
+        query = select(Integration).where(
+            Integration.type == "payment",
+            Integration.provider.in_(["stripe", "paypal"]),
+            Integration.is_active == True,
+        )
+        if integration_id:
+            query = query.where(Integration.id == UUID(integration_id))
+        result = await db.execute(query)
+        integrations = result.scalars().all()
+        # Le integrazioni vengono staccate dalla sessione: il rollback dopo l'errore
+        # di un'integrazione non le fa scadere e le successive restano leggibili
+        db.expunge_all()
+        
+        until = datetime.utcnow() - timedelta(minutes=settings.PAYMENT_RECONCILIATION_LAG_MINUTES)
+        since = until - timedelta(days=days or settings.PAYMENT_RECONCILIATION_WINDOW_DAYS)
+        
+        results = []
+        for integration in integrations:
+            current_id, provider = integration.id, integration.provider
+            try:
+                reconciliation = await reconcile_integration_payments(
+                    db,
+                    integration,
+                    iter_payment_records(integration, since, until),
+                    since,
+                    until,
+                )
+                await db.commit()
+                
+                results.append({
+                    "integration_id": str(current_id),
+                    "provider": provider,
+                    "success": True,
+                    **reconciliation,
+                })
+            
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"Errore nella riconciliazione dei pagamenti dell'integrazione {current_id}: {str(e)}")
+                results.append({
+                    "integration_id": str(current_id),
+                    "provider": provider,
+                    "success": False,
+                    "error": str(e),
+                })
+        
+        return {
+            "success": True,
+            "since": since.isoformat(),
+            "until": until.isoformat(),
+            "integrations_processed": len(results),
+            "results": results,
+        }
+    
+    except Exception as e:
+        logger.error(f"Errore nella riconciliazione dei pagamenti: {str(e)}")
+        return {"success": False, "error": str(e)}
+    finally:
+        await db.close()
@@ -0,0 +1,163 @@
+import logging
+from typing import Any, Dict, List
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.celery_app import celery_app
+from src.core.config import settings
+from src.core.worker_loop import async_task
+from src.db.session import SessionLocal
+from src.integrations.registry import marketplace_clients
+from src.inventory.reconciliation import reconcile_inventory
+from src.models.customer import Customer
+from src.models.order import Order, OrderStatus
+from src.models.store import Store
+from src.webhooks.buffer import drain_updates, restore_updates
+
+logger = logging.getLogger(__name__)
+
+def schedule_flush(store_id: UUID) -> None:
+    """
+    Pianifica lo svuotamento del buffer dei webhook di un negozio dopo
+    WEBHOOK_FLUSH_DELAY_SECONDS, così gli eventi ravvicinati vengono applicati insieme.
+    """
+    flush_webhook_updates.apply_async(args=[str(store_id)], countdown=settings.WEBHOOK_FLUSH_DELAY_SECONDS)
+
+@celery_app.task(name="src.tasks.webhooks.flush_webhook_updates")
+@async_task
+async def flush_webhook_updates(store_id: str) -> Dict[str, Any]:
+    """
+    Task per applicare in blocco gli aggiornamenti ricevuti via webhook da un negozio.
+    """
+    updates = await drain_updates(UUID(store_id))
+    if updates.is_empty():
+        return {"success": True, "store_id": store_id, "updated_count": 0, "created_orders": 0}
+    
+    db = SessionLocal()
+    try:
+        result = await db.execute(select(Store).where(Store.id == UUID(store_id)))
+        store = result.scalars().first()
+        if not store:
+            return {"success": False, "error": "Negozio non trovato"}
+        
+        quantities = dict(updates.quantities)
+        if updates.inventory_items and store.platform == "shopify":
+            # Le giacenze lette dall'API sono successive agli eventi products/update accumulati
+            for item in await _resolve_shopify_inventory_items(store, updates.inventory_items):
+                quantities[item["sku"]] = item["quantity"]
+        
+        updated_count = 0
+        if quantities:
+            reconciliation = await reconcile_inventory(
+                db,
+                store.id,
+                [{"sku": sku, "quantity": quantity} for sku, quantity in quantities.items()],
+                incremental=True,
+            )
+            updated_count = reconciliation["updated_count"]
+        
+        created_orders = await _create_orders(db, store.id, list(updates.orders.values()))
+        await db.commit()
+        
+        return {
+            "success": True,
+            "store_id": store_id,
+            "updated_count": updated_count,
+            "created_orders": created_orders,
+        }
+    
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Errore nell'applicazione dei webhook per il negozio {store_id}: {str(e)}")
+        
+        # Gli aggiornamenti tornano nel buffer per il prossimo tentativo
+        if await restore_updates(UUID(store_id), updates):
+            schedule_flush(UUID(store_id))
+        return {"success": False, "error": str(e)}
+    finally:
+        await db.close()
+
+async def _resolve_shopify_inventory_items(store: Store, inventory_item_ids: List[str]) -> List[Dict[str, Any]]:
+    """
+    Ricava SKU e giacenza totale degli inventory item Shopify modificati.
+    """
+    client = await marketplace_clients.get_for_store(store)
+    return await client.get_inventory_quantities([int(item_id) for item_id in inventory_item_ids])
+
+async def _create_orders(db: AsyncSession, store_id: UUID, orders: List[Dict[str, Any]]) -> int:
+    """
+    Inserisce gli ordini non ancora presenti, con una query per gli ordini e una
+    per i clienti esistenti invece di una per ordine.
+    
+    Non esegue il commit: la transazione resta al chiamante.
+    """
+    if not orders:
+        return 0
+    
+    result = await db.execute(
+        select(Order.order_number).where(
+            Order.store_id == store_id,
+            Order.order_number.in_([order["order_number"] for order in orders]),
+        )
+    )
+    existing_numbers = set(result.scalars().all())
+    
+    new_orders = []
+    for order in orders:
+        if order["order_number"] in existing_numbers:
+            continue
+        if not order["customer"].get("email"):
+            logger.warning(f"Ordine {order['order_number']} del negozio {store_id} senza email del cliente: ignorato")
+            continue
+        existing_numbers.add(order["order_number"])
+        new_orders.append(order)
+    
+    if not new_orders:
+        return 0
+    
+    emails = {order["customer"]["email"] for order in new_orders}
+    result = await db.execute(
+        select(Customer).where(Customer.store_id == store_id, Customer.email.in_(emails))
+    )
+    customers = {customer.email: customer for customer in result.scalars().all()}
+    
+    for email in emails - customers.keys():
+        data = next(order["customer"] for order in new_orders if order["customer"]["email"] == email)
+        customer = Customer(
+            email=email,
+            first_name=data.get("first_name"),
+            last_name=data.get("last_name"),
+            phone=data.get("phone"),
+            store_id=store_id,
+        )
+        db.add(customer)
+        customers[email] = customer
+    
+    # Assegna gli ID ai nuovi clienti prima di collegarli agli ordini
+    await db.flush()
+    
+    db.add_all([
+        Order(
+            order_number=order["order_number"],
+            status=OrderStatus(order["status"]),
+            total_price=order["total_price"],
+            subtotal=order["subtotal"],
+            shipping_price=order["shipping_price"],
+            tax_price=order["tax_price"],
+            discount_price=order["discount_price"],
+            currency=order["currency"],
+            shipping_address=order["shipping_address"],
+            billing_address=order["billing_address"],
+            payment_method=order["payment_method"],
+            notes=order["notes"],
+            items=order["items"],
+            metadata=order["metadata"],
+            store_id=store_id,
+            customer_id=customers[order["customer"]["email"]].id,
+        )
+        for order in new_orders
+    ])
+    
+    return len(new_orders)
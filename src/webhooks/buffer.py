@@ -0,0 +1,121 @@
+import json
+import logging
+from uuid import UUID
+
+from src.core.config import settings
+from src.core.redis import get_redis
+from src.webhooks.events import WebhookUpdates
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "webhooks"
+
+# Durata dell'istante dell'ultima modifica applicata per SKU: copre i nuovi
+# tentativi di consegna dei webhook (fino a 48 ore per Shopify)
+QUANTITY_MODIFIED_AT_TTL = 48 * 3600
+
+# Accumula le quantità mantenendo per ogni SKU la modifica più recente: una
+# quantità con un istante di modifica precedente all'ultimo visto, anche se già
+# applicato, viene scartata. Le quantità senza istante sostituiscono sempre la
+# precedente. ARGV: durata, poi terne SKU, quantità, istante ("" se assente).
+_BUFFER_QUANTITIES_SCRIPT = """
+for i = 2, #ARGV, 3 do
+    local sku, quantity, modified_at = ARGV[i], ARGV[i + 1], ARGV[i + 2]
+    if modified_at == "" then
+        redis.call("HSET", KEYS[1], sku, quantity)
+    else
+        local last = tonumber(redis.call("HGET", KEYS[2], sku))
+        if last == nil or tonumber(modified_at) >= last then
+            redis.call("HSET", KEYS[1], sku, quantity)
+            redis.call("HSET", KEYS[2], sku, modified_at)
+        end
+    end
+end
+redis.call("EXPIRE", KEYS[2], tonumber(ARGV[1]))
+return 1
+"""
+
+def _key(store_id: UUID, kind: str) -> str:
+    return f"{KEY_PREFIX}:{store_id}:{kind}"
+
+async def buffer_updates(store_id: UUID, updates: WebhookUpdates) -> bool:
+    """
+    Accumula gli aggiornamenti di un negozio nel buffer Redis, unificando quelli
+    sulla stessa entità: per le quantità vale la modifica più recente, per gli
+    ordini l'ultimo ricevuto.
+    
+    Restituisce True se il chiamante deve pianificare lo svuotamento del buffer,
+    cioè se non ce n'è già uno in attesa per il negozio.
+    """
+    redis = get_redis()
+    async with redis.pipeline(transaction=True) as pipe:
+        if updates.quantities:
+            args = [QUANTITY_MODIFIED_AT_TTL]
+            for sku, quantity in updates.quantities.items():
+                modified_at = updates.quantities_modified_at.get(sku)
+                args.extend([sku, quantity, "" if modified_at is None else repr(modified_at)])
+            pipe.eval(
+                _BUFFER_QUANTITIES_SCRIPT,
+                2,
+                _key(store_id, "quantities"),
+                _key(store_id, "quantities_modified_at"),
+                *args,
+            )
+        if updates.inventory_items:
+            pipe.sadd(_key(store_id, "inventory_items"), *updates.inventory_items)
+        if updates.orders:
+            pipe.hset(
+                _key(store_id, "orders"),
+                mapping={external_id: json.dumps(order) for external_id, order in updates.orders.items()},
+            )
+        # Il flag scade comunque: se lo svuotamento pianificato va perso, il webhook
+        # successivo ne pianifica un altro
+        pipe.set(_key(store_id, "scheduled"), "1", nx=True, ex=settings.WEBHOOK_FLUSH_LOCK_TTL)
+        results = await pipe.execute()
+    
+    return bool(results[-1])
+
+async def drain_updates(store_id: UUID) -> WebhookUpdates:
+    """
+    Preleva e svuota in modo atomico il buffer di un negozio.
+    
+    Il flag di pianificazione viene rimosso per primo: i webhook che arrivano
+    durante l'applicazione pianificano un nuovo svuotamento. Gli istanti di
+    modifica delle quantità restano, per scartare i webhook arrivati in ritardo.
+    """
+    redis = get_redis()
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.delete(_key(store_id, "scheduled"))
+        pipe.hgetall(_key(store_id, "quantities"))
+        pipe.smembers(_key(store_id, "inventory_items"))
+        pipe.hgetall(_key(store_id, "orders"))
+        pipe.delete(
+            _key(store_id, "quantities"),
+            _key(store_id, "inventory_items"),
+            _key(store_id, "orders"),
+        )
+        _, quantities, inventory_items, orders, _ = await pipe.execute()
+    
+    updates = WebhookUpdates()
+    updates.quantities = {sku: int(quantity) for sku, quantity in quantities.items()}
+    updates.inventory_items = list(inventory_items)
+    updates.orders = {external_id: json.loads(order) for external_id, order in orders.items()}
+    return updates
+
+async def restore_updates(store_id: UUID, updates: WebhookUpdates) -> bool:
+    """
+    Rimette nel buffer gli aggiornamenti non applicati, senza sovrascrivere quelli
+    più recenti arrivati nel frattempo. Restituisce True come buffer_updates.
+    """
+    redis = get_redis()
+    async with redis.pipeline(transaction=True) as pipe:
+        for sku, quantity in updates.quantities.items():
+            pipe.hsetnx(_key(store_id, "quantities"), sku, quantity)
+        if updates.inventory_items:
+            pipe.sadd(_key(store_id, "inventory_items"), *updates.inventory_items)
+        for external_id, order in updates.orders.items():
+            pipe.hsetnx(_key(store_id, "orders"), external_id, json.dumps(order))
+        pipe.set(_key(store_id, "scheduled"), "1", nx=True, ex=settings.WEBHOOK_FLUSH_LOCK_TTL)
+        results = await pipe.execute()
+    
+    return bool(results[-1])
@@ -0,0 +1,185 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+# Topic gestiti per piattaforma
+SHOPIFY_TOPICS = {"inventory_levels/update", "products/update", "orders/create"}
+WOOCOMMERCE_TOPICS = {"product.updated", "order.created"}
+
+# Mappatura degli stati degli ordini WooCommerce sugli stati interni
+WOOCOMMERCE_ORDER_STATUSES = {
+    "pending": "pending",
+    "on-hold": "pending",
+    "processing": "processing",
+    "completed": "delivered",
+    "cancelled": "cancelled",
+    "failed": "cancelled",
+    "refunded": "refunded",
+}
+
+class WebhookUpdates:
+    """
+    Aggiornamenti estratti da uno o più webhook, già nella forma in cui vengono
+    accumulati nel buffer: le chiavi servono a unificare gli eventi ripetuti
+    sulla stessa entità. Per le quantità vale la modifica più recente secondo il
+    marketplace (quantities_modified_at), perché l'ordine di consegna dei
+    webhook non è garantito; per gli ordini vale l'ultimo ricevuto.
+    """
+    
+    def __init__(self):
+        self.quantities: Dict[str, int] = {}  # SKU -> quantità
+        self.quantities_modified_at: Dict[str, float] = {}  # SKU -> istante della modifica (Unix), se noto
+        self.inventory_items: List[str] = []  # Inventory item Shopify da risolvere in SKU e quantità
+        self.orders: Dict[str, Dict[str, Any]] = {}  # ID esterno -> ordine normalizzato
+    
+    def is_empty(self) -> bool:
+        return not (self.quantities or self.inventory_items or self.orders)
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+def _timestamp(value: Any) -> Optional[float]:
+    """
+    Converte una data ISO 8601 del payload in timestamp Unix; le date senza fuso
+    orario sono in UTC.
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def _shopify_order_status(payload: Dict[str, Any]) -> str:
+    if payload.get("cancelled_at"):
+        return "cancelled"
+    if payload.get("financial_status") == "refunded":
+        return "refunded"
+    if payload.get("fulfillment_status") == "fulfilled":
+        return "shipped"
+    if payload.get("financial_status") == "paid":
+        return "processing"
+    return "pending"
+
+def _shopify_order(payload: Dict[str, Any]) -> Dict[str, Any]:
+    customer = payload.get("customer") or {}
+    shipping = (payload.get("total_shipping_price_set") or {}).get("shop_money") or {}
+    
+    return {
+        "order_number": str(payload.get("name") or payload.get("order_number") or payload.get("id")),
+        "status": _shopify_order_status(payload),
+        "total_price": _to_float(payload.get("total_price")),
+        "subtotal": _to_float(payload.get("subtotal_price")),
+        "shipping_price": _to_float(shipping.get("amount")),
+        "tax_price": _to_float(payload.get("total_tax")),
+        "discount_price": _to_float(payload.get("total_discounts")),
+        "currency": payload.get("currency") or "EUR",
+        "shipping_address": payload.get("shipping_address"),
+        "billing_address": payload.get("billing_address"),
+        "payment_method": ", ".join(payload.get("payment_gateway_names") or []) or None,
+        "notes": payload.get("note"),
+        "items": [
+            {
+                "sku": item.get("sku"),
+                "name": item.get("title"),
+                "quantity": item.get("quantity"),
+                "price": _to_float(item.get("price")),
+            }
+            for item in payload.get("line_items") or []
+        ],
+        "customer": {
+            "email": payload.get("email") or customer.get("email"),
+            "first_name": customer.get("first_name"),
+            "last_name": customer.get("last_name"),
+            "phone": customer.get("phone") or payload.get("phone"),
+        },
+        "metadata": {"platform": "shopify", "external_id": payload.get("id")},
+    }
+
+def _woocommerce_order(payload: Dict[str, Any]) -> Dict[str, Any]:
+    billing = payload.get("billing") or {}
+    items = payload.get("line_items") or []
+    
+    return {
+        "order_number": str(payload.get("number") or payload.get("id")),
+        "status": WOOCOMMERCE_ORDER_STATUSES.get(payload.get("status"), "pending"),
+        "total_price": _to_float(payload.get("total")),
+        "subtotal": sum(_to_float(item.get("subtotal")) for item in items),
+        "shipping_price": _to_float(payload.get("shipping_total")),
+        "tax_price": _to_float(payload.get("total_tax")),
+        "discount_price": _to_float(payload.get("discount_total")),
+        "currency": payload.get("currency") or "EUR",
+        "shipping_address": payload.get("shipping"),
+        "billing_address": billing or None,
+        "payment_method": payload.get("payment_method_title") or payload.get("payment_method") or None,
+        "notes": payload.get("customer_note") or None,
+        "items": [
+            {
+                "sku": item.get("sku"),
+                "name": item.get("name"),
+                "quantity": item.get("quantity"),
+                "price": _to_float(item.get("price")),
+            }
+            for item in items
+        ],
+        "customer": {
+            "email": billing.get("email"),
+            "first_name": billing.get("first_name"),
+            "last_name": billing.get("last_name"),
+            "phone": billing.get("phone"),
+        },
+        "metadata": {"platform": "woocommerce", "external_id": payload.get("id")},
+    }
+
+def parse_shopify_event(topic: str, payload: Dict[str, Any]) -> Optional[WebhookUpdates]:
+    """
+    Estrae gli aggiornamenti da un webhook Shopify; None se il topic non è gestito.
+    """
+    if topic not in SHOPIFY_TOPICS:
+        return None
+    
+    updates = WebhookUpdates()
+    if topic == "inventory_levels/update":
+        # Il payload riporta la disponibilità di una sola sede e non contiene lo SKU:
+        # il totale viene ricalcolato al momento dell'applicazione
+        if payload.get("inventory_item_id"):
+            updates.inventory_items.append(str(payload["inventory_item_id"]))
+    
+    elif topic == "products/update":
+        modified_at = _timestamp(payload.get("updated_at"))
+        for variant in payload.get("variants") or []:
+            if variant.get("sku") and variant.get("inventory_quantity") is not None:
+                updates.quantities[variant["sku"]] = int(variant["inventory_quantity"])
+                if modified_at is not None:
+                    updates.quantities_modified_at[variant["sku"]] = modified_at
+    
+    elif topic == "orders/create":
+        updates.orders[str(payload.get("id"))] = _shopify_order(payload)
+    
+    return updates
+
+def parse_woocommerce_event(topic: str, payload: Dict[str, Any]) -> Optional[WebhookUpdates]:
+    """
+    Estrae gli aggiornamenti da un webhook WooCommerce; None se il topic non è gestito.
+    """
+    if topic not in WOOCOMMERCE_TOPICS:
+        return None
+    
+    updates = WebhookUpdates()
+    if topic == "product.updated":
+        # Le variazioni generano webhook propri con il loro SKU e la loro giacenza
+        if payload.get("sku") and payload.get("manage_stock") is not False and payload.get("stock_quantity") is not None:
+            updates.quantities[payload["sku"]] = int(payload["stock_quantity"])
+            modified_at = _timestamp(payload.get("date_modified_gmt"))
+            if modified_at is not None:
+                updates.quantities_modified_at[payload["sku"]] = modified_at
+    
+    elif topic == "order.created":
+        updates.orders[str(payload.get("id"))] = _woocommerce_order(payload)
+    
+    return updates
@@ -0,0 +1,19 @@
+import base64
+import hashlib
+import hmac
+from typing import Optional
+
+def verify_hmac_signature(body: bytes, signature: Optional[str], secret: Optional[str]) -> bool:
+    """
+    Verifica la firma HMAC-SHA256 (codificata in base64) del corpo di un webhook.
+    
+    È lo schema usato sia da Shopify (header X-Shopify-Hmac-Sha256) sia da
+    WooCommerce (header X-WC-Webhook-Signature). Il confronto avviene in tempo
+    costante sul corpo grezzo della richiesta, prima di qualsiasi parsing.
+    """
+    if not signature or not secret:
+        return False
+    
+    digest = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).digest()
+    expected = base64.b64encode(digest).decode("ascii")
+    return hmac.compare_digest(expected, signature.strip())